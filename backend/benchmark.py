@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Benchmark các thành phần xử lý log
+Usage: python benchmark.py sample <out.log> [lines] [seed]
+       python benchmark.py parser <access.log> [repeat]
+       python benchmark.py batch <access.log> [clients]
+       python benchmark.py inference <models_dir>
+       python benchmark.py encode [vocab_size] [rows]
+       python benchmark.py dedup <access.log> [backend]
+       python benchmark.py scan <access.log> [workers]
+       python benchmark.py memory <access.log> [rows]
+       python benchmark.py cascade <access.log> [target_recall]
+       python benchmark.py paths <access.log>
+"""
+
+import sys
+import os
+import time
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.parser import parse_log_file, PARSE_ENGINES
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def write_sample(filepath, lines="200000", seed="0"):
+    """Sinh file combined log cố định theo seed (IP, path, status, user agent, thời gian trong một tháng),
+    để các số đo benchmark lặp lại được trên cùng một input"""
+    import numpy as np
+    import pandas as pd
+
+    lines, rng = int(lines), np.random.default_rng(int(seed))
+    agents = np.array(["Mozilla/5.0 (Windows NT 10.0; Win64; x64)", "Mozilla/5.0 (X11; Linux)", "curl/7.64.1",
+                       "python-requests/2.31.0", "Googlebot/2.1 (+http://www.google.com/bot.html)"])
+    requests = np.array(["GET /index.html", "GET /api/items/{n}", "POST /login", "GET /static/app.js",
+                         "GET /search?q=item{n}", "GET /users/{n}/profile"])
+    statuses = np.array([200, 200, 200, 200, 301, 304, 404, 500])
+    stamps = pd.Timestamp("2024-01-01 00:00:00") + pd.to_timedelta(np.sort(rng.integers(0, 31 * 86400, lines)), unit="s")
+    stamps = stamps.strftime("%d/%b/%Y:%H:%M:%S +0700")
+    with open(filepath, "w") as f:
+        for i in range(lines):
+            request = requests[rng.integers(len(requests))].replace("{n}", str(rng.integers(100000)))
+            f.write(f'10.0.{rng.integers(4)}.{rng.integers(256)} - - [{stamps[i]}] "{request} HTTP/1.1" '
+                    f'{statuses[rng.integers(len(statuses))]} {rng.integers(100, 50000)} "-" "{agents[rng.integers(len(agents))]}"\n')
+    print(f"  wrote {lines:,} lines ({os.path.getsize(filepath) / (1024 * 1024):.1f} MB) to {filepath}")
+
+def bench_parser(filepath, repeat="5"):
+    """Throughput từng engine parse: lấy lần chạy nhanh nhất trong `repeat` lần (sau một lần chạy làm nóng)"""
+    print("=" * 60)
+    print(f"⏱️  PARSER BENCHMARK: {filepath} (best of {repeat})")
+    print("=" * 60)
+
+    size_mb = os.path.getsize(filepath) / (1024 * 1024)
+    results = {}
+    for engine in PARSE_ENGINES:
+        df = parse_log_file(filepath, engine=engine)  # làm nóng page cache + import
+        elapsed = min(_timed(parse_log_file, filepath, engine=engine)[1] for _ in range(int(repeat)))
+        results[engine] = (df, elapsed)
+        mem_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+        print(f"  {engine:<12} {len(df):>10} rows  {elapsed:8.2f}s  {len(df) / elapsed:>12,.0f} rows/s  {size_mb / elapsed:8.1f} MB/s  {mem_mb:8.1f} MB in memory")
+
+    base_df, base_time = results["python"]
+    for engine, (df, elapsed) in results.items():
+        if engine == "python": continue
+        same = df.equals(base_df)
+        print(f"\n  {engine}: speedup x{base_time / elapsed:.1f}, same output as python engine: {'✅' if same else '❌'}")
+
+def bench_batch(filepath, clients="32", rows=2000):
+    """Throughput của /servers/{id}/analyze: từng dòng một so với gộp batch (nhiều client đồng thời)"""
+    import pandas as pd
+    from core.model_registry import model_registry
+    from core.batcher import analyze_batcher
+
+    print("=" * 60)
+    print(f"⏱️  ANALYZE BATCH BENCHMARK: {filepath} ({clients} clients)")
+    print("=" * 60)
+
+    detector = model_registry.get()
+    df = parse_log_file(filepath).head(rows)
+    df['datetime'] = df['datetime'].astype(str)
+    records = df[['ip', 'method', 'path', 'status', 'size', 'referrer', 'user_agent', 'datetime']].to_dict(orient="records")
+
+    _, single = _timed(lambda: [detector.detect_anomalies(pd.DataFrame([r])) for r in records])
+    clients = int(clients)
+    def work(k):
+        for r in records[k::clients]:
+            analyze_batcher.submit(r)
+    def run_clients():
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(clients)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+    _, batched = _timed(run_clients)
+
+    print(f"  single   {len(records) / single:>10,.0f} logs/s")
+    print(f"  batched  {len(records) / batched:>10,.0f} logs/s  (x{single / batched:.1f})")
+
+def bench_inference(model_dir):
+    """Thời gian load + predict của backend NumPy so với Keras (nếu có TensorFlow)"""
+    import numpy as np
+    from core.ml_engine import LogAnomalyDetector
+
+    print("=" * 60)
+    print(f"⏱️  INFERENCE BACKEND BENCHMARK: {model_dir}")
+    print("=" * 60)
+
+    for backend in ("numpy", "keras"):
+        detector = LogAnomalyDetector(model_dir, backend=backend)
+        _, load_time = _timed(detector.load_resources)
+        if detector.model is None:
+            print(f"  {backend:<6} not available")
+            continue
+        print(f"  {backend:<6} load {load_time:6.2f}s")
+        for batch in (1, 64, 10000):
+            x = np.random.rand(batch, 8).astype(np.float32)
+            repeat = max(1, 20000 // batch)
+            _, elapsed = _timed(lambda: [detector.model.predict(x, verbose=0) for _ in range(repeat)])
+            print(f"         batch {batch:>6}: {elapsed / repeat * 1000:8.3f} ms/call  {batch * repeat / elapsed:>12,.0f} rows/s")
+
+def bench_encode(vocab_size="300000", rows="2000000"):
+    """Label encoding: dict dựng lại mỗi lần gọi (cách cũ) so với bảng tra dựng sẵn và hashing trick, batch nhỏ và scan lớn"""
+    import pickle
+    import numpy as np
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+    from core.ml_engine import LogAnomalyDetector
+    from core.hash_encoder import HashingEncoder
+
+    print("=" * 60)
+    print(f"⏱️  LABEL ENCODING BENCHMARK: vocab {vocab_size}, {rows} rows")
+    print("=" * 60)
+
+    vocab_size, rows = int(vocab_size), int(rows)
+    vocab = np.array([f"/api/items/{i}?page={i % 97}" for i in range(vocab_size)])
+    detector = LogAnomalyDetector("models")
+    detector.label_encoders = {"path": LabelEncoder().fit(vocab)}
+    _, build = _timed(detector._build_lookups)
+    print(f"  build lookup once: {build * 1000:8.1f} ms")
+    hasher = HashingEncoder(2 ** 20)
+    print(f"  artifact: label_encoders {len(pickle.dumps(detector.label_encoders)) / 1024:,.0f} KB  "
+          f"hash_encoder {len(pickle.dumps(hasher))} B")
+
+    def legacy(encoder, values):
+        classes = list(encoder.classes_)
+        val_map = {val: idx for idx, val in enumerate(classes)}
+        return [val_map.get(str(x), 0) for x in values]
+
+    rng = np.random.default_rng(0)
+    for size in (1, 64, rows):
+        values = pd.Series(vocab[rng.integers(0, vocab_size * 11 // 10, size) % vocab_size])
+        column = values.astype("category")
+        repeat = 20 if size < 1000 else 1
+        _, old = _timed(lambda: [legacy(detector.label_encoders["path"], values) for _ in range(repeat)])
+        _, new = _timed(lambda: [detector.encode_column("path", values) for _ in range(repeat)])
+        _, cat = _timed(lambda: [detector.encode_column("path", column) for _ in range(repeat)])
+        _, hashed = _timed(lambda: [hasher.encode(values) for _ in range(repeat)])
+        print(f"  {size:>9} rows: legacy {old / repeat * 1000:9.2f} ms  lookup {new / repeat * 1000:9.2f} ms  "
+              f"category {cat / repeat * 1000:9.2f} ms  hash {hashed / repeat * 1000:9.2f} ms  (x{old / new:.0f})")
+
+def bench_dedup(filepath, backend="auto"):
+    """Chấm điểm cả file có/không gộp các vector đặc trưng trùng nhau"""
+    import numpy as np
+    from core.ml_engine import LogAnomalyDetector
+
+    print("=" * 60)
+    print(f"⏱️  DEDUP SCORING BENCHMARK: {filepath} ({backend} backend)")
+    print("=" * 60)
+
+    detector = LogAnomalyDetector("models", backend=backend)
+    detector.load_resources()
+    df = parse_log_file(filepath)
+    results = {}
+    for mode in ("0", "1"):
+        detector.dedup = mode
+        (mse, _), elapsed = _timed(detector.reconstruction_errors, df)
+        results[mode] = mse
+        print(f"  dedup={mode}: {elapsed:8.3f}s  {len(df) / elapsed:>12,.0f} rows/s")
+    print(f"  {detector.dedup_stats()}, same errors: {'✅' if np.array_equal(results['0'], results['1']) else '❌'}")
+
+def bench_scan(filepath, workers=None):
+    """Quét cả file: nạp toàn bộ vào RAM so với chunk tuần tự, pipeline (parse song song với predict)
+    và chia shard cho process pool (`workers` process, mặc định số CPU)"""
+    import tracemalloc
+    from core.model_registry import model_registry
+    from core.scan_executor import ScanExecutor, SCAN_WORKERS
+    from routers.analyze import scan_chunks, SCAN_CHUNK_ROWS
+
+    print("=" * 60)
+    print(f"⏱️  SCAN PIPELINE BENCHMARK: {filepath} ({SCAN_CHUNK_ROWS} rows/chunk)")
+    print("=" * 60)
+
+    detector = model_registry.get()
+    def whole():
+        return detector.detect_anomalies(parse_log_file(filepath))
+    def chunked(depth):
+        threats = []
+        for chunk in scan_chunks(filepath, depth=depth):
+            threats.extend(detector.detect_anomalies(chunk))
+        return threats
+
+    executor = ScanExecutor(workers=int(workers) if workers else SCAN_WORKERS)
+    executor.scan(filepath, detector.version, end=1)  # khởi động worker + load model trước khi đo
+    def sharded():
+        return executor.scan(filepath, detector.version)
+
+    chunked(0)  # làm nóng parse cache để các chế độ đọc cùng một nguồn
+    results = {}
+    for name, run in (("whole file", whole), ("chunked", lambda: chunked(0)), ("pipelined", lambda: chunked(2)),
+                      (f"sharded x{executor.workers}", sharded)):
+        tracemalloc.start()
+        threats, elapsed = _timed(run)
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        results[name] = threats
+        print(f"  {name:<12} {elapsed:8.2f}s  peak {peak:8.1f} MB  {len(threats)} threats")
+    executor.shutdown()
+    same = results["chunked"] == results["pipelined"] == results[f"sharded x{executor.workers}"]
+    print(f"\n  pipelined/sharded same threats as chunked: {'✅' if same else '❌'}")
+
+def _legacy_errors(detector, df):
+    """Tiền xử lý + MSE kiểu cũ: copy df, thêm cột _enc, .values, scaler.transform, np.power"""
+    import numpy as np
+    import pandas as pd
+    from core.ml_engine import FEATURE_COLUMNS
+    features = df.copy()
+    features['hour'] = features['datetime'].dt.hour.fillna(0).astype(int)
+    for col in ['ip', 'method', 'path', 'referrer', 'user_agent']:
+        features[col + '_enc'] = detector.encode_column(col, features[col]) if detector.label_encoders else 0
+    features['status'] = pd.to_numeric(features['status'], errors='coerce').fillna(200)
+    features['size'] = pd.to_numeric(features['size'], errors='coerce').fillna(0)
+    input_data = detector.scaler.transform(features[FEATURE_COLUMNS].values.astype(np.float32))
+    reconstructions = detector.model.predict(input_data, verbose=0)
+    return np.mean(np.power(input_data - reconstructions, 2), axis=1)
+
+def _rss_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def bench_memory(filepath, rows="10000000", mode=None):
+    """RSS đỉnh khi chấm điểm `rows` dòng (file lặp lại): tiền xử lý kiểu cũ so với ma trận cấp phát sẵn + scale/MSE tại chỗ.
+    Mỗi chế độ chạy trong một process riêng để số đo RSS đỉnh không lẫn vào nhau."""
+    import subprocess
+    if mode is None:
+        print("=" * 60)
+        print(f"⏱️  SCORING MEMORY BENCHMARK: {filepath} x {rows} rows")
+        print("=" * 60)
+        for mode in ("legacy", "fused"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "memory", filepath, rows, mode],
+                                 capture_output=True, text=True)
+            print(out.stdout.strip().splitlines()[-1] if out.returncode == 0 else f"  {mode}: failed\n{out.stderr}")
+        return
+
+    import gc
+    import numpy as np
+    from core.model_registry import model_registry
+    from core.parser import _concat_frames
+
+    detector = model_registry.get()
+    df = parse_log_file(filepath)
+    df = _concat_frames([df] * -(-int(rows) // len(df))).iloc[:int(rows)].reset_index(drop=True)
+    gc.collect()
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # đặt lại mốc RSS đỉnh (VmHWM)
+    except OSError:
+        pass
+    base = _rss_mb("VmRSS:")
+    if mode == "legacy":
+        mse, elapsed = _timed(_legacy_errors, detector, df)
+    else:
+        detector.dedup = "0"
+        (mse, _), elapsed = _timed(detector.reconstruction_errors, df)
+    print(f"  {mode:<7} {len(df):>10} rows  {elapsed:8.2f}s  peak RSS +{_rss_mb('VmHWM:') - base:8.1f} MB  mse checksum {float(np.sum(mse, dtype=np.float64)):.6f}")
+
+def bench_cascade(filepath, target_recall=None):
+    """Recall và throughput của cascade (tầng lọc + autoencoder) so với chạy autoencoder cho mọi dòng.
+    Nếu thư mục model chưa có prefilter_profile.npz (hoặc truyền target_recall) thì hiệu chỉnh trên nửa đầu file."""
+    import numpy as np
+    from core.model_registry import model_registry
+    from core.prefilter import FeatureProfile, PREFILTER_TARGET_RECALL
+
+    print("=" * 60)
+    print(f"⏱️  CASCADE BENCHMARK: {filepath}")
+    print("=" * 60)
+
+    detector = model_registry.get()
+    df = parse_log_file(filepath)
+    if detector.prefilter is None or target_recall is not None:
+        train = df.iloc[:len(df) // 2]
+        df = df.iloc[len(df) // 2:].reset_index(drop=True)
+        detector.cascade = "0"
+        mse, _ = detector.reconstruction_errors(train)
+        data, _ = detector.preprocess_features(train)
+        detector.prefilter = FeatureProfile.fit(data, mse, detector.threshold,
+                                                float(target_recall) if target_recall is not None else PREFILTER_TARGET_RECALL)
+        print(f"  profile calibrated on {len(train)} rows, evaluated on the other {len(df)}")
+    print(f"  z_limit = {detector.prefilter.z_limit:.3f}")
+
+    results = {}
+    for mode in ("0", "1"):
+        detector.cascade = mode
+        (mse, _), elapsed = _timed(detector.reconstruction_errors, df)
+        results[mode] = (mse > detector.threshold, elapsed)
+    single, single_time = results["0"]
+    cascade, cascade_time = results["1"]
+    # Riêng phần model (không tính tiền xử lý chung cho cả hai chế độ)
+    data, _ = detector.preprocess_features(df)
+    _, model_single = _timed(detector._model_errors, data)
+    suspects, filter_time = _timed(detector.prefilter.suspects, data)
+    _, model_cascade = _timed(detector._model_errors, data[suspects])
+    forwarded = np.count_nonzero(suspects)
+    recall = np.count_nonzero(cascade & single) / max(1, np.count_nonzero(single))
+    print(f"  single-stage {single_time:8.3f}s  {len(df) / single_time:>12,.0f} rows/s  {np.count_nonzero(single)} anomalies")
+    print(f"  cascade      {cascade_time:8.3f}s  {len(df) / cascade_time:>12,.0f} rows/s  {np.count_nonzero(cascade)} anomalies")
+    print(f"  forwarded to autoencoder: {forwarded / len(df):.1%}, recall vs single-stage: {recall:.4f}, "
+          f"speedup x{single_time / cascade_time:.2f}")
+    print(f"  model stage only: single {model_single * 1000:.1f} ms, cascade {(filter_time + model_cascade) * 1000:.1f} ms "
+          f"(filter {filter_time * 1000:.1f} ms), x{model_single / (filter_time + model_cascade):.2f}")
+
+def bench_paths(filepath):
+    """Kích thước từ vựng path (và LabelEncoder) trước/sau normalize_path và template học từ chính file"""
+    import pickle
+    import numpy as np
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+    from core.ml_engine import LogAnomalyDetector
+    from core.parser import PathTemplates
+
+    print("=" * 60)
+    print(f"⏱️  PATH NORMALIZATION BENCHMARK: {filepath}")
+    print("=" * 60)
+
+    df = parse_log_file(filepath)
+    raw_paths = set(df['path'].dropna().astype(str).unique())
+    templates, learn = _timed(PathTemplates.learn, raw_paths)
+    report = templates.vocabulary_report(raw_paths)
+    print(f"  learn: {learn * 1000:.1f} ms, {len(templates.variable_prefixes)} variable positions")
+    print(f"  vocabulary: raw {report['raw']:,}  normalized {report['normalized']:,}  templates {report['templates']:,}  "
+          f"(x{report['raw'] / max(report['templates'], 1):.0f})")
+
+    normalized, normalize = _timed(templates.normalize, df['path'])
+    print(f"  normalize column ({len(df):,} rows): {normalize * 1000:.1f} ms")
+    for name, values in (("raw", df['path']), ("templates", normalized)):
+        detector = LogAnomalyDetector("models")
+        detector.label_encoders = {"path": LabelEncoder().fit(np.array(sorted(values.dropna().astype(str).unique())))}
+        _, build = _timed(detector._build_lookups)
+        _, encode = _timed(detector.encode_column, "path", pd.Series(values))
+        print(f"  {name:>9}: encoder {len(pickle.dumps(detector.label_encoders)) / 1024:10,.1f} KB  "
+              f"build lookup {build * 1000:7.1f} ms  encode {encode * 1000:7.1f} ms")
+
+BENCHMARKS = {
+    "sample": write_sample,
+    "parser": bench_parser,
+    "batch": bench_batch,
+    "inference": bench_inference,
+    "encode": bench_encode,
+    "dedup": bench_dedup,
+    "scan": bench_scan,
+    "memory": bench_memory,
+    "cascade": bench_cascade,
+    "paths": bench_paths,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,117 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+from core.model_registry import model_registry
+from core.ml_engine import hour_of
+from core.verdict_cache import verdict_cache
+from core.server_thresholds import server_thresholds
+
+# Gom các request analyze real-time đến cùng lúc thành một batch để chỉ gọi model.predict một lần
+BATCH_MAX_SIZE = int(os.getenv("ANALYZE_BATCH_SIZE", "64"))
+# Thời gian chờ tối đa (ms) để gom thêm request sau request đầu tiên của batch
+BATCH_MAX_WAIT_MS = float(os.getenv("ANALYZE_BATCH_WAIT_MS", "5"))
+
+class MicroBatcher:
+    """Hàng đợi + một thread nền: request chờ trên Future, thread nền gom tối đa max_batch dòng
+    (hoặc hết max_wait_ms) rồi chấm điểm cả batch và trả kết quả về từng request"""
+
+    def __init__(self, max_batch: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, row: dict, server_id: str = None) -> list:
+        """Danh sách threat của một dòng log (rỗng nếu bình thường), chờ tới khi batch chứa dòng đó chạy xong.
+        Có server_id thì so với ngưỡng riêng của server đó"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((row, server_id, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive(): return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = score_rows([row for row, _, _ in batch], [server_id for _, server_id, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), threats in zip(batch, results):
+                future.set_result(threats)
+
+# Các trường quyết định vector đặc trưng của một dòng (cùng key -> cùng lỗi tái tạo)
+VERDICT_KEY_FIELDS = ['ip', 'method', 'path', 'status', 'size', 'referrer', 'user_agent']
+
+def verdict_key(row: dict) -> tuple:
+    return tuple(row.get(f) for f in VERDICT_KEY_FIELDS) + (hour_of(row.get('datetime')),)
+
+def score_rows(rows: list, server_ids: list = None) -> list:
+    """Chấm điểm nhiều dòng log bằng một lần predict, trả về danh sách threat cho từng dòng.
+    Dòng đã gặp gần đây (cùng model) lấy lỗi tái tạo từ verdict_cache, không encode/predict lại.
+    server_ids (nếu có): dòng của server đã đủ dữ liệu được so với ngưỡng phân vị riêng của server đó"""
+    detector = model_registry.get()
+    results = [[] for _ in rows]
+    if detector.model is None:
+        return results
+
+    verdict_cache.sync_version(detector.version)
+    keys = [verdict_key(row) for row in rows]
+    mse = np.array([verdict_cache.get(key) for key in keys], dtype=float)
+    missing = np.flatnonzero(np.isnan(mse))
+    if len(missing):
+        try:
+            fresh, _ = detector.reconstruction_errors(pd.DataFrame([rows[i] for i in missing]))
+        except Exception as e:
+            print(f"❌ Inference Error: {e}")
+            fresh = None
+        # Predict lỗi: chỉ bỏ các dòng chưa có trong cache (lỗi NaN: không threat, không vào sketch),
+        # các dòng đã có verdict trong cache vẫn được chấm bình thường
+        if fresh is not None:
+            mse[missing] = fresh
+            for i, err in zip(missing, fresh):
+                verdict_cache.put(keys[i], float(err))
+
+    threshold = global_threshold = detector.threshold if detector.threshold is not None else 0.05
+    if server_ids is not None:
+        threshold = np.array([server_thresholds.threshold_for(sid, detector.version, global_threshold) for sid in server_ids])
+        try:
+            # Học từ mọi dòng đã qua autoencoder; dòng cascade bỏ qua có lỗi đúng bằng 0 (không phải lỗi thật),
+            # dòng predict lỗi là NaN
+            scored = mse > 0
+            for sid in set(server_ids):
+                rows_of_server = [i for i, s in enumerate(server_ids) if s == sid and scored[i]]
+                server_thresholds.observe(sid, detector.version, mse[rows_of_server], global_threshold)
+        except Exception as e:
+            print(f"⚠️ Failed to update server error sketches: {e}")
+    indices = np.flatnonzero(mse > threshold)
+    if len(indices):
+        for idx, threat in zip(indices, detector.make_threats(pd.DataFrame(rows), mse, indices)):
+            results[idx].append(threat)
+    return results
+
+analyze_batcher = MicroBatcher()
@@ -0,0 +1,65 @@
+import os
+import hashlib
+from database import get_file_checkpoint, save_file_checkpoint
+from core.parser import detect_compression
+
+# Số byte ở đầu file và ngay trước offset dùng để xác nhận phần đã xử lý không bị thay đổi
+FINGERPRINT_BYTES = 64 * 1024
+
+def complete_size(filepath: str) -> int:
+    """Vị trí ngay sau ký tự xuống dòng cuối cùng; phần sau đó là dòng đang ghi dở"""
+    pos = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        while pos > 0:
+            step = min(FINGERPRINT_BYTES, pos)
+            f.seek(pos - step)
+            cut = f.read(step).rfind(b'\n')
+            if cut != -1:
+                return pos - step + cut + 1
+            pos -= step
+    return 0
+
+def prefix_fingerprint(filepath: str, offset: int, version: str = "") -> str:
+    """Hash phần đầu file và đoạn ngay trước offset (O(1), không đọc lại cả file)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{version}:{offset}".encode())
+    with open(filepath, 'rb') as f:
+        h.update(f.read(min(FINGERPRINT_BYTES, offset)))
+        start = max(0, offset - FINGERPRINT_BYTES)
+        f.seek(start)
+        h.update(f.read(offset - start))
+    return h.hexdigest()
+
+class FileCheckpoint:
+    """Checkpoint byte offset của một file upload cho một loại xử lý (stats/scan/parse).
+    Khi file chỉ được ghi thêm vào cuối, lần xử lý sau bắt đầu từ offset thay vì từ đầu file."""
+
+    def __init__(self, filename: str, kind: str, filepath: str, version=""):
+        self.filename = filename
+        self.kind = kind
+        self.filepath = filepath
+        self.version = str(version)
+        # File nén không đọc tiếp từ giữa được nên luôn xử lý lại từ đầu
+        self.resumable = detect_compression(filepath) is None
+        self.offset = 0
+        self.end = complete_size(filepath) if self.resumable else None
+
+    def load(self):
+        """Trả về state đã lưu nếu phần file tới offset không đổi (và cùng version), ngược lại None"""
+        if not self.resumable: return None
+        checkpoint = get_file_checkpoint(self.filename, self.kind)
+        if not checkpoint or checkpoint['byte_offset'] > self.end:
+            return None
+        if checkpoint['fingerprint'] != prefix_fingerprint(self.filepath, checkpoint['byte_offset'], self.version):
+            return None
+        self.offset = checkpoint['byte_offset']
+        return checkpoint['state']
+
+    def save(self, state):
+        """Lưu state ứng với phần file [0, end)"""
+        if not self.resumable: return
+        try:
+            fingerprint = prefix_fingerprint(self.filepath, self.end, self.version)
+            save_file_checkpoint(self.filename, self.kind, self.end, fingerprint, state)
+        except Exception as e:
+            print(f"⚠️ Could not save checkpoint for {self.filename}: {e}")
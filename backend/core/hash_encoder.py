@@ -0,0 +1,52 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+HASH_ENCODER_FILE = 'hash_encoder.json'
+# Số bucket khi train bằng hashing trick thay cho LabelEncoder (0 = dùng LabelEncoder như cũ).
+# Mã phải biểu diễn đúng bằng float32 nên tối đa 2^24
+FEATURE_HASH_BUCKETS = int(os.getenv("FEATURE_HASH_BUCKETS", "0"))
+# Khóa SipHash cố định (16 byte): cùng giá trị cho cùng mã ở mọi process/lần chạy, khác hash() của Python
+DEFAULT_HASH_KEY = "weblog-analyzer1"
+
+class HashingEncoder:
+    """Hashing trick cho các cột text: mã = SipHash(chuỗi) mod buckets.
+    Không lưu từ vựng: bộ nhớ và file cấu hình cố định, encode không cần bảng tra,
+    giá trị chưa gặp khi train có mã riêng thay vì dồn về 0 (đổi lại có thể trùng mã giữa các giá trị)"""
+
+    def __init__(self, buckets: int, key: str = DEFAULT_HASH_KEY):
+        if not 0 < buckets <= 2 ** 24:
+            raise ValueError(f"buckets must be in (0, 2^24], got {buckets}")
+        if len(key.encode()) != 16:
+            raise ValueError("hash key must be 16 bytes")
+        self.buckets = int(buckets)
+        self.key = key
+
+    def _hash(self, strings: np.ndarray) -> np.ndarray:
+        hashed = pd.util.hash_array(strings, hash_key=self.key, categorize=True)
+        return (hashed % np.uint64(self.buckets)).astype(np.int64)
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        """Mã của từng giá trị, cùng cách đổi sang chuỗi như LogAnomalyDetector.encode_column"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Cột category: chỉ băm các giá trị khác nhau (mã -1 là NaN -> phần tử cuối 'nan')
+            strings = np.append(values.cat.categories.astype(str).to_numpy(dtype=object), 'nan')
+            return self._hash(strings)[values.cat.codes.to_numpy()]
+        return self._hash(values.astype(str).fillna('nan').to_numpy(dtype=object))
+
+    def bounds(self) -> tuple:
+        """Khoảng mã cố định [0, buckets - 1] dùng để fit MinMaxScaler (không phụ thuộc giá trị gặp khi train)"""
+        return 0, self.buckets - 1
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"buckets": self.buckets, "key": self.key}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HashingEncoder":
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config["buckets"], config.get("key", DEFAULT_HASH_KEY))
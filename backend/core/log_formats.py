@@ -0,0 +1,286 @@
+import re
+import csv
+import json
+import functools
+import numpy as np
+import pandas as pd
+from core.parser import (
+    LOG_PATTERN, REQUEST_PATTERN, TIME_FORMAT, FIXED_TIME_PATTERN,
+    _open_log, _finalize_frame, _vector_combined_frame, buffer_lines, parse_timestamps,
+)
+
+# Các định dạng log ngoài combined (Apache/Nginx). Combined vẫn đi qua các engine trong core.parser,
+# mỗi định dạng còn lại có hàm parse riêng chạy trên block byte (xem block_parser)
+
+# Common Log Format: như combined nhưng không có referrer/user agent
+COMMON_PATTERN = re.compile(
+    r'(?P<ip>^[\d\.]+) \S+ \S+ \[(?P<timestamp>.*?)\] "(?P<request>.*?)" (?P<status>\d{3}) (?P<size>\S+)$'
+)
+# Nginx log_format combined + $request_time ở cuối dòng (có thể kèm vài field trong ngoặc kép ở giữa)
+NGINX_PATTERN = re.compile(
+    r'(?P<ip>^[\d\.]+) \S+ \S+ \[(?P<timestamp>.*?)\] "(?P<request>.*?)" (?P<status>\d{3}) (?P<size>\S+) "(?P<referrer>.*?)" "(?P<user_agent>.*?)".*?\s(?:rt=|request_time=)?(?P<request_time>\d+(?:\.\d+)?)$'
+)
+REQUEST_TIME_PATTERN = r'\s(?:rt=|request_time=)?(?P<request_time>\d+(?:\.\d+)?)$'
+W3C_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+UTC_DTYPE = 'datetime64[us, UTC]'
+
+# Tên cột chuẩn -> các tên thường gặp trong log JSON/CSV (so sánh không phân biệt hoa thường)
+FIELD_ALIASES = {
+    'ip': ('ip', 'remote_addr', 'client_ip', 'clientip', 'remote_ip', 'c-ip'),
+    'datetime': ('datetime', 'timestamp', '@timestamp', 'time', 'time_local', 'time_iso8601', 'date'),
+    'request': ('request',),
+    'method': ('method', 'request_method', 'verb', 'cs-method'),
+    'path': ('path', 'uri', 'request_uri', 'url', 'cs-uri-stem'),
+    'protocol': ('protocol', 'server_protocol', 'httpversion', 'cs-version'),
+    'status': ('status', 'status_code', 'response', 'sc-status'),
+    'size': ('size', 'bytes', 'body_bytes_sent', 'bytes_sent', 'response_size', 'sc-bytes'),
+    'referrer': ('referrer', 'referer', 'http_referer', 'cs(referer)'),
+    'user_agent': ('user_agent', 'http_user_agent', 'agent', 'useragent', 'cs(user-agent)'),
+    'request_time': ('request_time', 'duration', 'response_time', 'time-taken'),
+}
+# Số dòng đầu file dùng để nhận diện định dạng
+SAMPLE_BYTES = 64 * 1024
+SAMPLE_LINES = 50
+
+def _is_json_line(line: str) -> bool:
+    if not line.startswith('{'): return False
+    try:
+        return isinstance(json.loads(line), dict)
+    except ValueError:
+        return False
+
+# Nhận diện theo từng dòng; khi nhiều định dạng khớp cùng số dòng thì ưu tiên định dạng đứng trước
+LINE_DETECTORS = {
+    "json": _is_json_line,
+    "nginx": lambda line: NGINX_PATTERN.match(line) is not None,
+    "combined": lambda line: LOG_PATTERN.match(line) is not None,
+    "common": lambda line: COMMON_PATTERN.match(line) is not None,
+}
+
+def _sample_lines(filepath: str) -> list:
+    with _open_log(filepath) as f:
+        head = f.read(SAMPLE_BYTES)
+    lines = head.decode('utf-8', errors='ignore').split('\n')
+    if len(head) == SAMPLE_BYTES:
+        lines = lines[:-1]  # Dòng cuối có thể bị cắt
+    return [line.strip() for line in lines if line.strip()][:SAMPLE_LINES]
+
+def _canonical_names(names) -> dict:
+    """Tên cột trong file -> tên cột chuẩn theo FIELD_ALIASES"""
+    lookup = {alias: name for name, aliases in FIELD_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for column in names:
+        name = lookup.get(str(column).strip().lower())
+        if name and name not in mapping.values():
+            mapping[column] = name
+    return mapping
+
+def _csv_header(line: str):
+    """Header CSV nếu dòng đầu là danh sách tên cột nhận diện được (cần ít nhất ip/path/status)"""
+    if ',' not in line: return None
+    fields = next(csv.reader([line]))
+    names = set(_canonical_names(fields).values())
+    if len(fields) >= 3 and len(names & {'ip', 'path', 'request', 'status'}) >= 2:
+        return tuple(fields)
+    return None
+
+def detect_log_format(filepath: str, name: str = "auto") -> tuple:
+    """(tên định dạng, header) của file dựa trên các dòng đầu; header chỉ có với w3c (#Fields) và csv"""
+    lines = _sample_lines(filepath)
+    fields_line = next((line for line in lines if line.startswith('#Fields:')), None)
+    if name == "w3c" or (name == "auto" and fields_line):
+        return ("w3c", tuple(fields_line.split()[1:]) if fields_line else ())
+    header = _csv_header(lines[0]) if lines else None
+    if name == "csv":
+        return ("csv", header or (tuple(next(csv.reader([lines[0]]))) if lines else ()))
+    if name != "auto":
+        if name not in LINE_DETECTORS:
+            raise ValueError(f"Unknown log format: {name}")
+        return (name, None)
+    if header:
+        return ("csv", header)
+
+    lines = [line for line in lines if not line.startswith('#')]
+    scores = {fmt: sum(1 for line in lines if matches(line)) for fmt, matches in LINE_DETECTORS.items()}
+    best = max(scores.values(), default=0)
+    if best == 0: return ("combined", None)
+    return next((fmt, None) for fmt, score in scores.items() if score == best)
+
+def _block_text(block) -> str:
+    return bytes(block).decode('utf-8', errors='ignore')
+
+def _block_array(block):
+    """Các dòng của block dạng mảng chuỗi pyarrow (đã trim)"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    return pc.utf8_trim_whitespace(pa.array(buffer_lines(block), type=pa.string()))
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """Thời gian dạng chuỗi (Apache hoặc ISO 8601), epoch (giây) hoặc đã là datetime.
+    Trừ dạng Apache (giữ offset như engine combined), kết quả luôn là UTC_DTYPE dù đi qua pyarrow hay fallback"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # pyarrow đọc chuỗi ISO 8601 thành timestamp[s] không timezone, đã đổi về UTC
+        stamps = values if values.dt.tz is not None else values.dt.tz_localize('UTC')
+    elif pd.api.types.is_numeric_dtype(values):
+        stamps = pd.to_datetime(values, unit='s', utc=True, errors='coerce')
+    else:
+        values = values.astype(str)
+        sample = values.dropna()
+        if not sample.empty and re.match(FIXED_TIME_PATTERN, sample.iloc[0]):
+            return parse_timestamps(values, TIME_FORMAT)
+        stamps = parse_timestamps(values, 'ISO8601', utc=True)
+    return stamps.dt.tz_convert('UTC').astype(UTC_DTYPE)
+
+def _standard_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Dựng DataFrame chuẩn (LOG_COLUMNS) từ các cột đã đổi sang tên chuẩn, thiếu cột nào thì điền mặc định"""
+    if df.empty: return pd.DataFrame()
+    df = df.reset_index(drop=True)
+
+    def text(name, default='-'):
+        if name not in df.columns: return pd.Series(default, index=df.index, dtype=str)
+        return df[name].astype(str).fillna(default)
+
+    out = pd.DataFrame({'ip': text('ip'), 'referrer': text('referrer'), 'user_agent': text('user_agent')})
+    if 'request' in df.columns:
+        out['request'] = text('request', '')
+        req = out['request'].str.extract(REQUEST_PATTERN)
+        req_ok = req['method'].notna()
+        out['method'] = text('method') if 'method' in df.columns else req['method'].where(req_ok, "unknown")
+        out['path'] = text('path') if 'path' in df.columns else req['path'].where(req_ok, out['request'])
+    else:
+        out['method'] = text('method', 'unknown')
+        out['path'] = text('path', '')
+        out['request'] = out['method'] + ' ' + out['path'] + (' ' + text('protocol') if 'protocol' in df.columns else '')
+    out['status'] = df['status'] if 'status' in df.columns else 200
+    out['size'] = pd.to_numeric(df['size'], errors='coerce').fillna(0).astype('int64') if 'size' in df.columns else 0
+    out['datetime'] = _to_datetime(df['datetime']) if 'datetime' in df.columns else pd.NaT
+    if 'request_time' in df.columns:
+        out['request_time'] = pd.to_numeric(df['request_time'], errors='coerce')
+    return _finalize_frame(out)
+
+def _regex_frame(lines, pattern) -> pd.DataFrame:
+    """Fallback khi không có pyarrow: regex từng dòng"""
+    rows = [m.groupdict() for m in map(pattern.match, (line.strip() for line in lines)) if m]
+    return _standard_frame(pd.DataFrame(rows).rename(columns={'timestamp': 'datetime'}))
+
+def _parse_common(block) -> pd.DataFrame:
+    try:
+        import pyarrow.compute as pc
+    except ImportError:
+        return _regex_frame(_block_text(block).split('\n'), COMMON_PATTERN)
+
+    # RE2 của pyarrow: một lượt tuyến tính cho cả block, không backtracking
+    parsed = pc.extract_regex(_block_array(block), COMMON_PATTERN.pattern)
+    parsed = parsed.filter(pc.is_valid(parsed))
+    return _standard_frame(pd.DataFrame({
+        ('datetime' if name == 'timestamp' else name): parsed.field(name).to_pandas()
+        for name in ('ip', 'timestamp', 'request', 'status', 'size')
+    }))
+
+def _parse_nginx(block) -> pd.DataFrame:
+    try:
+        import pyarrow.compute as pc
+    except ImportError:
+        return _regex_frame(_block_text(block).split('\n'), NGINX_PATTERN)
+
+    # Phần combined dùng chung fast path của engine vectorized, chỉ tách thêm $request_time ở cuối dòng
+    arr = _block_array(block)
+    df = _vector_combined_frame(arr)
+    if df.empty: return pd.DataFrame()
+    times = pc.extract_regex(arr, REQUEST_TIME_PATTERN)
+    times = pc.if_else(pc.is_valid(times), times.field('request_time'), None)
+    df['request_time'] = pc.cast(times, 'float64').to_numpy(zero_copy_only=False)[df.index.to_numpy()]
+    return _finalize_frame(df.reset_index(drop=True), fast_time=True)
+
+def _parse_json(block) -> pd.DataFrame:
+    """JSON lines: decoder JSON của pyarrow cho cả block, block có dòng lỗi thì json.loads từng dòng"""
+    try:
+        import pyarrow as pa
+        import pyarrow.json as pj
+        df = pj.read_json(pa.BufferReader(pa.py_buffer(block))).to_pandas()
+    except (ImportError, ValueError):
+        rows = []
+        for line in _block_text(block).split('\n'):
+            line = line.strip()
+            if not line.startswith('{'): continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict):
+                rows.append(row)
+        df = pd.DataFrame(rows)
+    return _standard_frame(df.rename(columns=_canonical_names(df.columns)))
+
+def _w3c_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Đổi các field W3C/IIS sang cột chuẩn"""
+    df = df.replace('-', None)
+    if 'date' in df.columns and 'time' in df.columns:
+        stamps = parse_timestamps(df['date'] + ' ' + df['time'], W3C_TIME_FORMAT)
+        df['datetime'] = stamps.dt.tz_localize('UTC')  # W3C luôn ghi theo UTC
+        df = df.drop(columns=['date', 'time'])
+    df = df.rename(columns=_canonical_names(df.columns))
+    if 'path' in df.columns and 'cs-uri-query' in df.columns:
+        df['path'] = df['path'] + ('?' + df['cs-uri-query']).fillna('')
+    if 'user_agent' in df.columns:
+        df['user_agent'] = df['user_agent'].str.replace('+', ' ', regex=False)
+    if 'request_time' in df.columns:
+        df['request_time'] = pd.to_numeric(df['request_time'], errors='coerce') / 1000  # time-taken tính bằng ms
+    return _standard_frame(df)
+
+def _parse_w3c(block, fields) -> pd.DataFrame:
+    """W3C Extended (IIS): field cách nhau bởi dấu cách theo thứ tự trong #Fields, dòng # là chú thích"""
+    fields = list(fields)
+    try:
+        import pyarrow.compute as pc
+    except ImportError:
+        rows = [
+            parts for parts in (line.strip().split(' ') for line in _block_text(block).split('\n')
+                                if line.strip() and not line.startswith('#'))
+            if len(parts) == len(fields)
+        ]
+        return _w3c_frame(pd.DataFrame(rows, columns=fields))
+
+    parts = pc.split_pattern(_block_array(block), ' ')
+    parts = parts.filter(pc.equal(pc.list_value_length(parts), len(fields)))
+    parts = parts.filter(pc.invert(pc.starts_with(pc.list_element(parts, 0), '#')))
+    return _w3c_frame(pd.DataFrame({field: pc.list_element(parts, i).to_pandas() for i, field in enumerate(fields)}))
+
+def _parse_csv(block, fields) -> pd.DataFrame:
+    """CSV có header: reader CSV của pyarrow cho cả block (mọi cột đọc dạng chuỗi), bỏ các dòng header"""
+    fields = list(fields)
+    if not fields or len(block) == 0: return pd.DataFrame()
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pcsv
+        table = pcsv.read_csv(
+            pa.BufferReader(pa.py_buffer(block)),
+            read_options=pcsv.ReadOptions(column_names=fields),
+            parse_options=pcsv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+            convert_options=pcsv.ConvertOptions(column_types={field: pa.string() for field in fields}),
+        )
+        df = table.to_pandas()
+    except ImportError:
+        rows = [row for row in csv.reader(_block_text(block).splitlines()) if len(row) == len(fields)]
+        df = pd.DataFrame(rows, columns=fields)
+
+    header = np.ones(len(df), dtype=bool)
+    for field in fields:
+        header &= (df[field] == field).to_numpy()
+    df = df[~header]
+    return _standard_frame(df.rename(columns=_canonical_names(df.columns)))
+
+# định dạng -> hàm parse một block byte (combined dùng PARSE_ENGINES trong core.parser)
+FORMAT_PARSERS = {
+    "common": _parse_common,
+    "nginx": _parse_nginx,
+    "json": _parse_json,
+    "w3c": _parse_w3c,
+    "csv": _parse_csv,
+}
+
+def block_parser(log_format: tuple):
+    """Hàm parse block cho (tên định dạng, header); dùng functools.partial để gửi được sang process pool"""
+    name, fields = log_format
+    parse = FORMAT_PARSERS[name]
+    return functools.partial(parse, fields=fields) if name in ("w3c", "csv") else parse
@@ -0,0 +1,63 @@
+from collections import Counter
+import pandas as pd
+
+class LogStatsAccumulator:
+    """Cộng dồn thống kê cho /api/stats theo từng chunk, không cần giữ cả file trong bộ nhớ"""
+
+    def __init__(self):
+        self.total_requests = 0
+        self.total_size = 0
+        self.error_5xx = 0
+        self.ips = set()  # IP gặp từ lúc khởi tạo (phần mới); tập IP đầy đủ lưu ở bảng file_ips
+        self.status_counts = Counter()
+        self.hourly_traffic = Counter()
+
+    def update(self, df: pd.DataFrame):
+        if df.empty: return
+        self.total_requests += len(df)
+        if 'ip' in df.columns:
+            self.ips.update(df['ip'].dropna().unique().tolist())
+        if 'size' in df.columns:
+            self.total_size += int(df['size'].sum())
+        if 'status' in df.columns:
+            self.error_5xx += int((df['status'] >= 500).sum())
+            self.status_counts.update({int(k): int(v) for k, v in df['status'].value_counts().items()})
+        if 'datetime' in df.columns:
+            # Traffic theo giờ
+            hours = df['datetime'].dropna().dt.floor('h')
+            self.hourly_traffic.update({ts.strftime('%Y-%m-%d %H:%M'): int(v) for ts, v in hours.value_counts().items()})
+
+    def to_state(self) -> dict:
+        """State dạng JSON để lưu checkpoint (kích thước cố định, không chứa tập IP)"""
+        return {
+            "total_requests": self.total_requests,
+            "total_size": self.total_size,
+            "error_5xx": self.error_5xx,
+            "status_counts": {str(k): v for k, v in self.status_counts.items()},
+            "hourly_traffic": dict(self.hourly_traffic),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict = None) -> "LogStatsAccumulator":
+        stats = cls()
+        if not state: return stats
+        stats.total_requests = state["total_requests"]
+        stats.total_size = state["total_size"]
+        stats.error_5xx = state["error_5xx"]
+        # Checkpoint cũ còn lưu cả tập IP: nạp lại để được ghi vào bảng file_ips
+        stats.ips = set(state.get("ips", []))
+        stats.status_counts = Counter({int(k): v for k, v in state["status_counts"].items()})
+        stats.hourly_traffic = Counter(state["hourly_traffic"])
+        return stats
+
+    def result(self, unique_ips: int = None) -> dict:
+        """unique_ips: số IP khác nhau của cả file (mặc định chỉ đếm các IP đã update vào accumulator)"""
+        total = self.total_requests
+        return {
+            "total_requests": total,
+            "unique_ips": len(self.ips) if unique_ips is None else unique_ips,
+            "avg_body_size": round(self.total_size / total / 1024, 2) if total > 0 else 0,
+            "error_rate": round((self.error_5xx / total) * 100, 2) if total > 0 else 0,
+            "status_distribution": {str(k): v for k, v in self.status_counts.most_common(5)},
+            "traffic_chart": dict(sorted(self.hourly_traffic.items())),
+        }
@@ -2,145 +2,390 @@ import os
 import numpy as np
 import pandas as pd
 import joblib
+import heapq
+import hashlib
 from datetime import datetime
+from core.numpy_model import NumpyAutoencoder, KERAS_MODEL_FILE, NUMPY_MODEL_FILE, keras_file_digest
+from core.prefilter import FeatureProfile, PREFILTER_FILE
+from core.hash_encoder import HashingEncoder, HASH_ENCODER_FILE
+from core.parser import PathTemplates, PATH_TEMPLATES_FILE
+
+# Backend suy luận: "numpy" (file .npz, không import TensorFlow), "keras", hoặc "auto" = numpy nếu bản .npz khớp với file .keras
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto")
+# Chỉ đưa vào model các vector đặc trưng khác nhau rồi trải lỗi tái tạo về từng dòng.
+# "auto": bật với model Keras (predict đắt hơn nhiều so với np.unique), tắt với backend NumPy (forward pass rẻ hơn cả np.unique)
+DEDUP_SCORING = os.getenv("DEDUP_SCORING", "auto")
+# Số dòng mỗi lần gọi model.predict khi chấm điểm (bội số của batch mặc định 32 của Keras)
+SCORE_BLOCK_ROWS = int(os.getenv("SCORE_BLOCK_ROWS", "65536"))
+# Cascade: lọc bằng FeatureProfile (prefilter_profile.npz) rồi chỉ chạy autoencoder cho các dòng nghi ngờ.
+# Đánh đổi một phần recall (đo bằng `benchmark.py cascade`) lấy throughput, nên mặc định tắt
+CASCADE_PREFILTER = os.getenv("CASCADE_PREFILTER", "0")
+
+def _str_values(values: pd.Series) -> np.ndarray:
+    """Như [str(v) for v in values] nhưng chỉ gọi str() một lần cho mỗi giá trị khác nhau"""
+    if values.dtype == object:
+        return np.array([str(v) for v in values], dtype=object)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.array([str(v) for v in uniques], dtype=object)[codes]
+
+def hour_of(value) -> int:
+    """Giờ của một chuỗi thời gian (0 nếu không parse được), như đặc trưng 'hour' của model"""
+    ts = pd.to_datetime(value, errors='coerce')
+    return ts.hour if pd.notna(ts) else 0
+
+def unique_rows(data: np.ndarray):
+    """(các dòng khác nhau, inverse) sao cho unique[inverse] == data; so sánh theo byte của cả dòng"""
+    data = np.ascontiguousarray(data)
+    keys = data.view(np.dtype((np.void, data.dtype.itemsize * data.shape[1]))).ravel()
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return data[index], inverse.ravel()
+
+def row_mse(data: np.ndarray, reconstructions) -> np.ndarray:
+    """np.mean((data - reconstructions) ** 2, axis=1), tính tại chỗ trên mảng reconstructions (không thêm mảng tạm cỡ data)"""
+    errors = np.asarray(reconstructions)
+    if errors.dtype != data.dtype or not errors.flags.writeable:
+        errors = errors.astype(data.dtype)
+    np.subtract(data, errors, out=errors)
+    np.square(errors, out=errors)
+    return np.mean(errors, axis=1)
+
+def select_anomalies(mse: np.ndarray, threshold: float, top_k: int = None, min_error: float = None) -> np.ndarray:
+    """Vị trí các dòng có lỗi tái tạo vượt ngưỡng (và >= min_error);
+    với top_k chỉ lấy k dòng lỗi lớn nhất (np.partition), sắp xếp giảm dần"""
+    mask = mse > threshold
+    if min_error is not None:
+        mask &= mse >= min_error
+    indices = np.flatnonzero(mask)
+    if top_k is None:
+        return indices
+    if top_k <= 0:
+        return indices[:0]
+    if len(indices) > top_k:
+        # Lỗi bằng nhau ở biên top_k: lấy các dòng đứng trước trong file (không phụ thuộc cách chia chunk/shard)
+        kth = -np.partition(-mse[indices], top_k - 1)[top_k - 1]
+        above = indices[mse[indices] > kth]
+        indices = np.concatenate([above, indices[mse[indices] == kth][:top_k - len(above)]])
+    return indices[np.argsort(-mse[indices], kind='stable')]
+
+def top_threats(errors: list, threats: list, top_k: int) -> tuple:
+    """Giữ top_k threat có lỗi tái tạo gốc (float, chưa làm tròn) lớn nhất, sắp xếp giảm dần.
+    errors[i] là lỗi của threats[i]; trả về (errors, threats) đã lọc"""
+    order = heapq.nlargest(top_k, range(len(errors)), key=errors.__getitem__)
+    return [errors[i] for i in order], [threats[i] for i in order]
+
+# Thứ tự các cột đầu vào của model (như lúc train)
+FEATURE_COLUMNS = ['ip_enc', 'method_enc', 'path_enc', 'status', 'size', 'referrer_enc', 'user_agent_enc', 'hour']
 
 class LogAnomalyDetector:
-    def __init__(self, model_dir: str):
+    def __init__(self, model_dir: str, backend: str = INFERENCE_BACKEND):
         self.model_dir = model_dir
+        self.backend = backend
         self.model = None
         self.scaler = None
         self.label_encoders = None
+        # col -> (LabelEncoder, pd.Index các class), dựng một lần thay vì mỗi lần encode
+        self._lookups = {}
+        # Model train bằng hashing trick (hash_encoder.json) thì dùng thay cho label_encoders
+        self.hash_encoder = None
+        # Template path học lúc train (path_templates.json): path được chuẩn hóa trước khi encode
+        self.path_templates = None
         self.threshold = None 
+        # Threshold đọc từ file (threshold mặc định 0.05 khi thiếu file không tính)
+        self.threshold_loaded = False
+        self.version = None
+        self.dedup = DEDUP_SCORING
+        # Thống kê cộng dồn: số dòng đã chấm điểm / số vector thực sự đưa vào model
+        self.rows_scored = 0
+        self.unique_scored = 0
+        # Tầng lọc rẻ trước autoencoder (nếu có file profile và CASCADE_PREFILTER bật)
+        self.prefilter = None
+        self.cascade = CASCADE_PREFILTER
+        self.rows_cleared = 0
+
+    def model_version(self) -> str:
+        """Định danh bộ model đang dùng (tên, kích thước, mtime các file trong model_dir)"""
+        h = hashlib.blake2b(digest_size=8)
+        if os.path.isdir(self.model_dir):
+            for name in sorted(os.listdir(self.model_dir)):
+                path = os.path.join(self.model_dir, name)
+                if not os.path.isfile(path): continue  # vd. thư mục versions/ chứa các bản train lại
+                st = os.stat(path)
+                h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return h.hexdigest()
 
     def load_resources(self):
         print(f"--- Loading AI Resources from {self.model_dir} ---")
+        self.version = self.model_version()
         
-        # 1. Load Model (.keras)
-        try:
-            from tensorflow.keras.models import load_model # type: ignore
-            
-            model_path = os.path.join(self.model_dir, 'autoencoder_model.keras')
-            if os.path.exists(model_path):
-                self.model = load_model(model_path)
-                print(f"✅ Model loaded: {model_path}")
-            else:
-                print(f"❌ Model not found: {model_path}")
-        except Exception as e:
-            print(f"❌ Error loading Model: {e}")
+        # 1. Load Model (.npz chạy bằng NumPy, hoặc .keras qua TensorFlow)
+        if self.backend != "keras":
+            self.model = self._load_numpy_model()
+        if self.model is None and self.backend != "numpy":
+            try:
+                from tensorflow.keras.models import load_model # type: ignore
+                
+                model_path = os.path.join(self.model_dir, KERAS_MODEL_FILE)
+                if os.path.exists(model_path):
+                    self.model = load_model(model_path)
+                    print(f"✅ Model loaded: {model_path}")
+                else:
+                    print(f"❌ Model not found: {model_path}")
+            except Exception as e:
+                print(f"❌ Error loading Model: {e}")
 
         try:
             scaler_path = os.path.join(self.model_dir, 'scaler.pkl')
             le_path = os.path.join(self.model_dir, 'label_encoders.pkl')
+            hash_path = os.path.join(self.model_dir, HASH_ENCODER_FILE)
+            templates_path = os.path.join(self.model_dir, PATH_TEMPLATES_FILE)
             th_path = os.path.join(self.model_dir, 'reconstruction_threshold.pkl')
+            prefilter_path = os.path.join(self.model_dir, PREFILTER_FILE)
 
             if os.path.exists(scaler_path):
                 self.scaler = joblib.load(scaler_path)
                 print("✅ Scaler loaded")
             
-            if os.path.exists(le_path):
+            if os.path.exists(hash_path):
+                self.hash_encoder = HashingEncoder.load(hash_path)
+                print(f"✅ Hashing Encoder loaded ({self.hash_encoder.buckets} buckets)")
+            elif os.path.exists(le_path):
                 self.label_encoders = joblib.load(le_path)
+                self._build_lookups()
                 print("✅ Label Encoders loaded")
 
+            if os.path.exists(templates_path):
+                self.path_templates = PathTemplates.load(templates_path)
+                print(f"✅ Path templates loaded ({len(self.path_templates.variable_prefixes)} variable positions)")
+
             if os.path.exists(th_path):
                 self.threshold = joblib.load(th_path)
+                self.threshold_loaded = True
                 print(f"✅ Threshold loaded from Train Model: {self.threshold:.6f}")
             else:
                 self.threshold = 0.05
                 print(f"⚠️ Threshold file not found. Using default fallback: {self.threshold}")
+
+            if os.path.exists(prefilter_path):
+                self.prefilter = FeatureProfile.load(prefilter_path)
+                print(f"✅ Prefilter profile loaded (z_limit={self.prefilter.z_limit:.3f})")
                 
         except Exception as e:
             print(f"❌ Error loading Pickle files: {e}")
             # Đảm bảo threshold luôn có giá trị để không crash
             if self.threshold is None: self.threshold = 0.05
 
-    def safe_label_transform(self, encoder, values):
-        classes = list(encoder.classes_)
-        val_map = {val: idx for idx, val in enumerate(classes)}
-        return [val_map.get(str(x), 0) for x in values]
+    def missing_resources(self) -> list:
+        """Các thành phần bắt buộc chưa load được sau load_resources (rỗng = bộ model đầy đủ)"""
+        missing = [name for name, value in (("model", self.model), ("scaler", self.scaler)) if value is None]
+        if self.label_encoders is None and self.hash_encoder is None:
+            missing.append("encoders")
+        if not self.threshold_loaded:
+            missing.append("threshold")
+        return missing
 
-    def preprocess_features(self, df: pd.DataFrame):
-        if df.empty or self.model is None or self.scaler is None:
-            return None, None
+    def _load_numpy_model(self):
+        npz_path = os.path.join(self.model_dir, NUMPY_MODEL_FILE)
+        keras_path = os.path.join(self.model_dir, KERAS_MODEL_FILE)
+        if not os.path.exists(npz_path):
+            if self.backend == "numpy": print(f"❌ Model not found: {npz_path}")
+            return None
+        try:
+            model = NumpyAutoencoder.load(npz_path)
+            # Bản export cũ hơn model vừa train lại: chế độ auto dùng file .keras
+            if self.backend == "auto" and os.path.exists(keras_path) and model.source_digest != keras_file_digest(keras_path):
+                print(f"⚠️ {npz_path} is stale (exported from another {KERAS_MODEL_FILE}), using Keras")
+                return None
+            print(f"✅ Model loaded (NumPy backend): {npz_path}")
+            return model
+        except Exception as e:
+            print(f"❌ Error loading NumPy model: {e}")
+            return None
+
+    def _build_lookups(self):
+        for col, encoder in (self.label_encoders or {}).items():
+            lookup = pd.Index(encoder.classes_)
+            lookup.get_indexer(lookup[:1])  # Dựng sẵn hash table (pandas dựng lười ở lần tra đầu tiên)
+            self._lookups[col] = (encoder, lookup)
 
-        features = df.copy()
+    def encode_column(self, col: str, values: pd.Series) -> np.ndarray:
+        """Label encoding an toàn bằng bảng tra dựng sẵn (Index.get_indexer), giá trị chưa gặp khi train -> 0"""
+        encoder = self.label_encoders[col]
+        cached = self._lookups.get(col)
+        if cached is None or cached[0] is not encoder:
+            self._build_lookups()
+        lookup = self._lookups[col][1]
 
-        # Xử lý Thời gian (Hour)
-        if 'datetime' in features.columns:
-            time_col = pd.to_datetime(features['datetime'], errors='coerce')
-            features['hour'] = time_col.dt.hour.fillna(0).astype(int)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Cột category: chỉ encode các giá trị khác nhau rồi tra theo mã (mã -1 là NaN -> phần tử cuối 'nan')
+            encoded = lookup.get_indexer(pd.Index(values.cat.categories.astype(str)).append(pd.Index(['nan'])))
+            codes = encoded[values.cat.codes.to_numpy()]
         else:
-            features['hour'] = 0
-        cols_to_encode = ['ip', 'method', 'path', 'referrer', 'user_agent']
-        
-        for col in cols_to_encode:
-            if col not in features.columns:
-                features[col] = "unknown"
-            
-            features[col] = features[col].astype(str)
-            
-            # Label Encoding an toàn
-            if self.label_encoders and col in self.label_encoders:
-                le = self.label_encoders[col]
-                features[col + '_enc'] = self.safe_label_transform(le, features[col])
-            else:
-                features[col + '_enc'] = 0
-
-        # Chuẩn bị Vector đầu vào
-        features['status'] = pd.to_numeric(features['status'], errors='coerce').fillna(200)
-        features['size'] = pd.to_numeric(features['size'], errors='coerce').fillna(0)
-        feature_columns = [
-            'ip_enc', 'method_enc', 'path_enc', 'status', 
-            'size', 'referrer_enc', 'user_agent_enc', 'hour'
-        ]
-        
-        # Kiểm tra đủ cột chưa
-        missing = [c for c in feature_columns if c not in features.columns]
-        if missing:
-            print(f"❌ Missing columns: {missing}")
+            codes = lookup.get_indexer(values.astype(str).fillna('nan'))
+        codes[codes < 0] = 0
+        return codes
+
+    def preprocess_features(self, df: pd.DataFrame):
+        """(ma trận đặc trưng đã scale, DataFrame gốc để dựng threat).
+        Từng đặc trưng được ghi thẳng vào một ma trận float32 cấp phát sẵn rồi scale tại chỗ: không copy df, không thêm cột _enc"""
+        if df.empty or self.model is None or self.scaler is None:
             return None, None
 
-        final_data = features[feature_columns].values.astype(np.float32)
+        data = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for j, name in enumerate(FEATURE_COLUMNS):
+            data[:, j] = self._feature_values(df, name)
         try:
-            X_scaled = self.scaler.transform(final_data)
-            return X_scaled, features
+            self._scale_inplace(data)
+            return data, df
         except Exception as e:
             print(f"❌ Scaling Error: {e}")
             return None, None
 
-    def detect_anomalies(self, df: pd.DataFrame):
-        threats = []
-        if self.model is None:
-            return []
+    def _feature_values(self, df: pd.DataFrame, name: str):
+        """Giá trị của một cột đặc trưng (trước khi scale) cho từng dòng của df"""
+        if name == 'hour':
+            # Cột datetime từ parser đã có kiểu datetime, không parse lại
+            if 'datetime' not in df.columns:
+                return 0
+            time_col = df['datetime']
+            if pd.api.types.is_datetime64_any_dtype(time_col):
+                return time_col.dt.hour.fillna(0).to_numpy(dtype=int)
+            # Chuỗi thời gian (request real-time, có thể gộp batch nhiều định dạng): mỗi giá trị parse riêng
+            codes, uniques = pd.factorize(time_col)
+            hours = np.array([hour_of(v) for v in uniques] + [0], dtype=int)
+            return hours[codes]
+        if name == 'status':
+            return pd.to_numeric(df['status'], errors='coerce').fillna(200).to_numpy()
+        if name == 'size':
+            return pd.to_numeric(df['size'], errors='coerce').fillna(0).to_numpy()
+
+        # Hashing trick, hoặc Label Encoding an toàn
+        col = name[:-len('_enc')]
+        if self.hash_encoder is not None:
+            encode = self.hash_encoder.encode
+        elif self.label_encoders and col in self.label_encoders:
+            encode = lambda values: self.encode_column(col, values)
+        else:
+            return 0
+        values = df[col] if col in df.columns else pd.Series(["unknown"])
+        if col == 'path' and self.path_templates is not None:
+            values = self.path_templates.normalize(values)
+        codes = encode(values)
+        return codes if col in df.columns else codes[0]
+
+    def _scale_inplace(self, data: np.ndarray):
+        """MinMaxScaler.transform tính tại chỗ từ tham số đã fit (scale_, min_), không cấp phát ma trận mới"""
+        scaler = self.scaler
+        if not hasattr(scaler, 'scale_') or not hasattr(scaler, 'min_'):
+            data[...] = scaler.transform(data)
+            return
+        if data.shape[1] != len(scaler.scale_):
+            raise ValueError(f"X has {data.shape[1]} features, but scaler is expecting {len(scaler.scale_)} features")
+        data *= scaler.scale_
+        data += scaler.min_
+        if getattr(scaler, 'clip', False):
+            np.clip(data, scaler.feature_range[0], scaler.feature_range[1], out=data)
+
+    def reconstruction_errors(self, df: pd.DataFrame):
+        """MSE tái tạo của từng dòng và DataFrame đã tiền xử lý; (None, None) nếu chưa có model hoặc dữ liệu lỗi"""
+        mse, processed_df, _ = self._score(df)
+        return mse, processed_df
+
+    def _dedup_enabled(self) -> bool:
+        if self.dedup == "auto":
+            return not isinstance(self.model, NumpyAutoencoder)
+        return self.dedup not in ("0", "false", False)
 
+    def _score(self, df: pd.DataFrame):
+        """(mse, processed_df, số vector khác nhau đã đưa vào model)"""
+        if self.model is None:
+            return None, None, 0
         input_data, processed_df = self.preprocess_features(df)
-        
         if input_data is None or processed_df is None:
-            return []
+            return None, None, 0
+
+        # Cùng bố cục bộ nhớ (C-contiguous) để lỗi tái tạo giống hệt nhau dù có dedup hay không
+        input_data = np.ascontiguousarray(input_data)
+        if self._cascade_enabled():
+            # Tầng lọc: dòng chắc chắn bình thường nhận lỗi 0, chỉ các dòng nghi ngờ chạy autoencoder
+            suspects = self.prefilter.suspects(input_data)
+            mse = np.zeros(len(input_data), dtype=input_data.dtype)
+            mse[suspects], scored = self._model_errors(input_data[suspects])
+            self.rows_cleared += len(mse) - int(np.count_nonzero(suspects))
+        else:
+            mse, scored = self._model_errors(input_data)
+        self.rows_scored += len(mse)
+        self.unique_scored += scored
+        return mse, processed_df, scored
+
+    def _cascade_enabled(self) -> bool:
+        return self.prefilter is not None and self.cascade not in ("0", "false", False)
+
+    def _model_errors(self, input_data: np.ndarray):
+        """(MSE tái tạo của từng dòng qua autoencoder, số vector thực sự đưa vào model)"""
+        inverse = None
+        if self._dedup_enabled():
+            # Các dòng giống hệt nhau (cùng IP, path, status, size, UA, giờ...) chỉ chấm điểm một lần
+            input_data, inverse = unique_rows(input_data)
+        # predict + MSE theo từng block: activation các lớp ẩn và reconstruction chỉ cỡ một block
+        mse = np.empty(len(input_data), dtype=input_data.dtype)
+        for start in range(0, len(input_data), SCORE_BLOCK_ROWS):
+            block = input_data[start:start + SCORE_BLOCK_ROWS]
+            mse[start:start + len(block)] = row_mse(block, self.model.predict(block, verbose=0))
+        if inverse is not None:
+            mse = mse[inverse]
+        return mse, len(input_data)
 
+    def dedup_stats(self) -> dict:
+        return {
+            "rows_scored": self.rows_scored,
+            "unique_scored": self.unique_scored,
+            "dedup_ratio": round(1 - self.unique_scored / self.rows_scored, 4) if self.rows_scored else 0,
+            "rows_cleared": self.rows_cleared,
+        }
+
+    def make_threats(self, processed_df: pd.DataFrame, mse: np.ndarray, indices: np.ndarray) -> list:
+        """Dựng danh sách threat cho các dòng `indices` theo từng cột (không iloc từng dòng)"""
+        if len(indices) == 0: return []
+        rows = processed_df.take(indices)
+        def column(name, default):
+            return _str_values(rows[name]) if name in rows.columns else [str(default)] * len(rows)
+        return [
+            {
+                "ip": ip,
+                "type": "Anomaly Detected",
+                "severity": "High",
+                "time": time,
+                "reconstruction_error": round(loss, 4),
+                "details": f"Path: {path}"
+            }
+            for ip, time, path, loss in zip(
+                column('ip', 'unknown'), column('datetime', ''), column('path', 'unknown'), mse[indices].tolist()
+            )
+        ]
+
+    def find_anomalies(self, df: pd.DataFrame, top_k: int = None, min_error: float = None) -> tuple:
+        """(số dòng vượt ngưỡng và >= min_error, lỗi tái tạo gốc của các threat trả về, threats).
+        Số dòng là tổng trước khi cắt top_k; lỗi gốc dùng để gộp top_k giữa các chunk/shard"""
         try:
-            # Predict
-            reconstructions = self.model.predict(input_data, verbose=0)
-            
-            # Tính MSE
-            mse = np.mean(np.power(input_data - reconstructions, 2), axis=1)
-            
+            # Predict + tính MSE
+            mse, processed_df, scored = self._score(df)
+            if mse is None:
+                return 0, [], []
+
             curr_thresh = self.threshold if self.threshold is not None else 0.05
-            anomaly_indices = np.where(mse > curr_thresh)[0]
-            print(f"🔍 Scan complete. Threshold={curr_thresh:.4f}. Found {len(anomaly_indices)} anomalies.")
-            for idx in anomaly_indices:
-                row = processed_df.iloc[idx]
-                loss = float(mse[idx])
-                severity = "High"
-                threats.append({
-                    "ip": str(row.get('ip', 'Unknown')),
-                    "type": "Anomaly Detected",
-                    "severity": severity,
-                    "time": str(row.get('datetime', '')),
-                    "reconstruction_error": round(loss, 4),
-                    "details": f"Path: {row.get('path')}"
-                })
+            mask = mse > curr_thresh
+            anomaly_count = int(np.count_nonzero(mask))
+            print(f"🔍 Scan complete. Threshold={curr_thresh:.4f}. Found {anomaly_count} anomalies. "
+                  f"Scored {scored}/{len(mse)} unique rows.")
+            if min_error is not None:
+                anomaly_count = int(np.count_nonzero(mask & (mse >= min_error)))
+            indices = select_anomalies(mse, curr_thresh, top_k, min_error)
+            return anomaly_count, mse[indices].tolist(), self.make_threats(processed_df, mse, indices)
 
         except Exception as e:
             print(f"❌ Inference Error: {e}")
+        return 0, [], []
 
-        return threats
\ No newline at end of file
+    def detect_anomalies(self, df: pd.DataFrame, top_k: int = None, min_error: float = None):
+        """Threat cho các dòng vượt ngưỡng; top_k chỉ trả về k dòng lỗi lớn nhất (giảm dần), min_error lọc thêm theo lỗi tái tạo"""
+        return self.find_anomalies(df, top_k, min_error)[2]
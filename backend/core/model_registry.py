@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+from core.ml_engine import LogAnomalyDetector
+
+# Thư mục model tính theo vị trí file, không phụ thuộc thư mục chạy server
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+# Khoảng thời gian (giây) tối thiểu giữa hai lần kiểm tra file trong MODEL_DIR có thay đổi không
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "5"))
+# Các bản model train lại nằm trong MODEL_DIR/versions/<tên>, file MODEL_DIR/CURRENT ghi tên bản đang dùng
+VERSIONS_DIR = 'versions'
+ACTIVE_MODEL_FILE = 'CURRENT'
+
+def active_model_dir(model_dir: str) -> str:
+    """Thư mục chứa bộ model đang dùng: bản ghi trong CURRENT, hoặc chính model_dir nếu chưa có bản nào"""
+    try:
+        with open(os.path.join(model_dir, ACTIVE_MODEL_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return model_dir
+    path = os.path.join(model_dir, VERSIONS_DIR, name)
+    return path if name and os.path.isdir(path) else model_dir
+
+def publish_model_dir(model_dir: str, name: str):
+    """Chuyển sang bản model MODEL_DIR/versions/<name> (ghi CURRENT nguyên khối); API tự nạp ở lần kiểm tra sau"""
+    pointer = os.path.join(model_dir, ACTIVE_MODEL_FILE)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(name)
+    os.replace(f"{pointer}.tmp", pointer)
+
+class ModelRegistry:
+    """Giữ sẵn một LogAnomalyDetector đã load cho cả process.
+    Khi file model thay đổi thì load bản mới rồi thay thế nguyên khối, request đang chạy vẫn dùng bản cũ tới khi xong."""
+
+    def __init__(self, model_dir: str = MODEL_DIR, check_interval: float = MODEL_CHECK_INTERVAL):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self._detector = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> LogAnomalyDetector:
+        detector = self._detector
+        if detector is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return detector
+
+        with self._lock:
+            detector = self._detector
+            if detector is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return detector
+            self._checked_at = time.monotonic()
+
+            candidate = LogAnomalyDetector(active_model_dir(self.model_dir))
+            if detector is not None and candidate.model_version() == detector.version:
+                return detector
+
+            print(f"🔄 Loading model version from {candidate.model_dir}...")
+            candidate.load_resources()
+            # Bản mới thiếu thành phần nào (vd. đang train dở, file pickle lỗi) thì giữ bản cũ, lần kiểm tra sau thử lại
+            missing = candidate.missing_resources()
+            if detector is not None and missing:
+                print(f"⚠️ New model could not be loaded (missing {', '.join(missing)}), keeping current version")
+                return detector
+            self._detector = candidate
+            return candidate
+
+    def reload(self) -> LogAnomalyDetector:
+        """Buộc kiểm tra lại thư mục model ngay lập tức"""
+        self._checked_at = 0.0
+        return self.get()
+
+model_registry = ModelRegistry()
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import zipfile
+import numpy as np
+
+# Autoencoder chỉ gồm các lớp Dense nên có thể chạy bằng NumPy (không cần import TensorFlow trong API)
+KERAS_MODEL_FILE = 'autoencoder_model.keras'
+NUMPY_MODEL_FILE = 'autoencoder_model.npz'
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    with np.errstate(over='ignore'):  # exp tràn -> inf -> kết quả 0, đúng giới hạn
+        np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': _sigmoid,
+    'tanh': lambda x: np.tanh(x, out=x),
+}
+
+def keras_file_digest(path: str) -> str:
+    """Hash file .keras, lưu kèm bản .npz để biết bản export còn khớp với model đã train hay không"""
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+class NumpyAutoencoder:
+    """Forward pass của chuỗi lớp Dense bằng NumPy, cùng interface predict() với model Keras"""
+
+    def __init__(self, layers: list, source_digest: str = ""):
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32), a) for w, b, a in layers]
+        self.source_digest = source_digest
+
+    def predict(self, x, verbose=0, batch_size=None):
+        out = np.asarray(x, dtype=np.float32)
+        for weights, bias, activation in self.layers:
+            out = out @ weights
+            out += bias
+            out = ACTIVATIONS[activation](out)
+        return out
+
+    def save(self, path: str):
+        arrays = {}
+        for i, (weights, bias, _) in enumerate(self.layers):
+            arrays[f'W{i}'] = weights
+            arrays[f'b{i}'] = bias
+        # Ghi file tạm rồi đổi tên để ModelRegistry không đọc phải file ghi dở
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, activations=np.array([a for _, _, a in self.layers]),
+                 source_digest=np.array(self.source_digest), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyAutoencoder":
+        with np.load(path) as data:
+            activations = [str(a) for a in data['activations']]
+            layers = [(data[f'W{i}'], data[f'b{i}'], a) for i, a in enumerate(activations)]
+            return cls(layers, str(data['source_digest']))
+
+def layers_from_keras_model(model) -> list:
+    """(kernel, bias, activation) của các lớp Dense trong model Keras đã load"""
+    layers = []
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights: continue  # InputLayer
+        if type(layer).__name__ != 'Dense':
+            raise ValueError(f"Unsupported layer: {type(layer).__name__}")
+        layers.append((weights[0], weights[1], layer.get_config()['activation']))
+    return layers
+
+def layers_from_keras_file(path: str) -> list:
+    """Đọc trực tiếp file .keras (Keras 3: config.json + model.weights.h5), không cần TensorFlow"""
+    try:
+        import h5py
+    except ImportError:
+        raise RuntimeError("Export không có TensorFlow cần package 'h5py'")
+    import io
+
+    with zipfile.ZipFile(path) as archive:
+        config = json.loads(archive.read('config.json'))
+        weights_file = h5py.File(io.BytesIO(archive.read('model.weights.h5')), 'r')
+
+    layers = []
+    with weights_file:
+        for layer in config['config']['layers']:
+            if layer['class_name'] == 'InputLayer': continue
+            if layer['class_name'] != 'Dense':
+                raise ValueError(f"Unsupported layer: {layer['class_name']}")
+            params = weights_file['layers'][layer['config']['name']]['vars']
+            layers.append((params['0'][()], params['1'][()], layer['config']['activation']))
+    return layers
+
+def export_numpy_model(model_dir: str, model=None) -> str:
+    """Xuất trọng số model Keras trong model_dir ra NUMPY_MODEL_FILE; trả về đường dẫn file .npz"""
+    keras_path = os.path.join(model_dir, KERAS_MODEL_FILE)
+    if model is not None:
+        layers = layers_from_keras_model(model)
+    else:
+        try:
+            from tensorflow.keras.models import load_model # type: ignore
+            layers = layers_from_keras_model(load_model(keras_path))
+        except ImportError:
+            layers = layers_from_keras_file(keras_path)
+
+    npz_path = os.path.join(model_dir, NUMPY_MODEL_FILE)
+    NumpyAutoencoder(layers, keras_file_digest(keras_path)).save(npz_path)
+    return npz_path
+
+def check_parity(keras_model, numpy_model, samples: int = 10000, seed: int = 0) -> float:
+    """Sai khác lớn nhất giữa model.predict của Keras và bản NumPy trên dữ liệu ngẫu nhiên trong [0, 1]
+    (miền giá trị sau MinMaxScaler) và một vài điểm biên"""
+    rng = np.random.default_rng(seed)
+    input_dim = numpy_model.layers[0][0].shape[0]
+    x = rng.random((samples, input_dim), dtype=np.float32)
+    x = np.vstack([x, np.zeros((1, input_dim), np.float32), np.ones((1, input_dim), np.float32), x[:8] * 3 - 1])
+    expected = np.asarray(keras_model.predict(x, verbose=0))
+    return float(np.max(np.abs(expected - numpy_model.predict(x))))
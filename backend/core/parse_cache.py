@@ -0,0 +1,178 @@
+import os
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+import pandas as pd
+from core.parser import iter_log_chunks, detect_compression, resolve_log_format, parse_version, PARSER_VERSION, CHUNK_ROWS, DEFAULT_LOG_FORMAT
+from core.checkpoints import FileCheckpoint
+
+# Cache kết quả parse dạng cột (Parquet) để /stats, /logs, /scan không phải parse lại file
+CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "parse_cache")
+CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# LRU (path, số byte đã hash, size, mtime) -> digest, tránh hash lại file chưa thay đổi
+DIGEST_MEMO_SIZE = int(os.getenv("PARSE_DIGEST_MEMO_SIZE", "1024"))
+_digest_memo = OrderedDict()
+_digest_lock = threading.Lock()
+
+def file_digest(filepath: str, size: int = None) -> str:
+    """Hash (blake2b) đúng size byte đầu của file (mặc định cả file), nhớ kết quả theo size + mtime.
+    Đọc đúng size byte nên phần ghi thêm trong lúc hash không lọt vào digest."""
+    st = os.stat(filepath)
+    if size is None:
+        size = st.st_size
+    memo_key = (os.path.abspath(filepath), size, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            _digest_memo.move_to_end(memo_key)
+            return _digest_memo[memo_key]
+
+    h = hashlib.blake2b(digest_size=16)
+    remaining = size
+    with open(filepath, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                raise OSError(f"{filepath} shrank while hashing")
+            h.update(block)
+            remaining -= len(block)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+        while len(_digest_memo) > DIGEST_MEMO_SIZE:
+            _digest_memo.popitem(last=False)
+    return digest
+
+def _cache_path(digest: str, format_name: str) -> str:
+    # Cùng nội dung nhưng parse theo định dạng khác (đổi LOG_FORMAT) là entry khác
+    return os.path.join(CACHE_DIR, f"{digest}-v{PARSER_VERSION}-{format_name}.parquet")
+
+def _evict(max_bytes: int = CACHE_MAX_BYTES):
+    """Xóa các entry ít dùng nhất (mtime cũ nhất) cho tới khi tổng dung lượng <= max_bytes"""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.parquet'): continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+        except OSError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def _normalize_dictionaries(table):
+    """Cột category của mỗi chunk có kiểu index khác nhau (int8/int16...), ép về int32 để mọi chunk cùng schema"""
+    import pyarrow as pa
+    fields = [
+        pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type) else f
+        for f in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+def _iter_cached(cached, rows: int):
+    for batch in cached.iter_batches(batch_size=rows):
+        yield batch.to_pandas()
+
+def _open_cached(path: str):
+    """Mở entry cache (None nếu chưa có hoặc bị hỏng) và cập nhật mtime cho LRU"""
+    if not os.path.exists(path): return None
+    try:
+        import pyarrow.parquet as pq
+        cached = pq.ParquetFile(path)
+        os.utime(path)
+        return cached
+    except Exception as e:
+        print(f"⚠️ Corrupted parse cache entry {path}: {e}")
+        return None
+
+def _stream_and_store(chunks, path: str):
+    """Đồng thời ghi từng chunk vào file Parquet tạm; chỉ đưa vào cache khi đọc hết file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer, writable, completed = None, True, False
+    try:
+        for chunk in chunks:
+            if writable:
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    table = _normalize_dictionaries(pa.Table.from_pandas(chunk, preserve_index=False))
+                    if writer is None:
+                        os.makedirs(CACHE_DIR, exist_ok=True)
+                        writer = pq.ParquetWriter(tmp_path, table.schema)
+                    writer.write_table(table)
+                except Exception as e:
+                    print(f"⚠️ Parse cache write skipped: {e}")
+                    writable = False
+            yield chunk
+        completed = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if writer is not None and writable and completed:
+            os.replace(tmp_path, path)  # Ghi atomic để request song song không đọc file dở dang
+            _evict()
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return writable and completed
+
+def iter_parsed_chunks(filepath: str, rows: int = CHUNK_ROWS, workers: int = 1, start: int = 0, end: int = None,
+                       log_format=DEFAULT_LOG_FORMAT):
+    """Như core.parser.iter_log_chunks nhưng đọc từ cache Parquet (theo từng batch) nếu file đã được parse trước đó.
+    Cache áp dụng cho đoạn [0, end) (mặc định cả file), theo digest của đúng đoạn đó;
+    đoạn bắt đầu ở giữa file được parse trực tiếp."""
+    if start > 0:
+        yield from iter_log_chunks(filepath, rows=rows, workers=workers, start=start, end=end, log_format=log_format)
+        return
+
+    # Chụp kích thước một lần: digest, entry cache và phần được parse cùng ứng với đúng [0, size)
+    # nên phần ghi thêm trong lúc xử lý không lọt vào entry của digest cũ
+    resumable = detect_compression(filepath) is None
+    try:
+        log_format = resolve_log_format(filepath, log_format)
+        size = os.path.getsize(filepath) if end is None else end
+        path = _cache_path(file_digest(filepath, size if resumable else None), log_format[0])
+    except OSError as e:
+        print(f"⚠️ Parse cache disabled for {filepath}: {e}")
+        yield from iter_log_chunks(filepath, rows=rows, workers=workers, end=end, log_format=log_format)
+        return
+
+    cached = _open_cached(path)
+    if cached is not None:
+        yield from _iter_cached(cached, rows)
+        return
+
+    # File chỉ được ghi thêm so với lần parse trước: dùng lại phần đầu đã cache, chỉ parse phần mới
+    checkpoint = FileCheckpoint(filepath, "parse", filepath, version=parse_version(log_format))
+    state = checkpoint.load()
+    prefix = _open_cached(state.get("cache", "")) if state and checkpoint.offset <= size else None
+    if not resumable:
+        size = None
+    if prefix is not None:
+        print(f"♻️ Reusing parsed prefix of {filepath} ({checkpoint.offset} bytes)")
+        chunks = itertools.chain(
+            _iter_cached(prefix, rows),
+            iter_log_chunks(filepath, rows=rows, workers=workers, start=checkpoint.offset, end=size, log_format=log_format),
+        )
+    else:
+        chunks = iter_log_chunks(filepath, rows=rows, workers=workers, end=size, log_format=log_format)
+
+    stored = yield from _stream_and_store(chunks, path)
+    # Chỉ lưu checkpoint khi entry cache kết thúc đúng ở dòng hoàn chỉnh cuối cùng (khớp [0, offset))
+    if stored and checkpoint.end == size:
+        checkpoint.save({"cache": path})
+
+def load_parsed_log(filepath: str, workers: int = 1) -> pd.DataFrame:
+    """Trả về toàn bộ DataFrame đã parse (qua cache)"""
+    chunks = list(iter_parsed_chunks(filepath, workers=workers))
+    if not chunks: return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
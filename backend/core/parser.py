@@ -1,42 +1,685 @@
+import os
 import re
+import json
+import bz2
+import gzip
+import mmap
+import queue
+import threading
+import multiprocessing
+from collections import deque, defaultdict
+from urllib.parse import unquote
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Tăng mỗi khi schema/kết quả parse thay đổi để làm mất hiệu lực parse cache
+PARSER_VERSION = 5
 
 LOG_PATTERN = re.compile(
     r'(?P<ip>^[\d\.]+) \S+ \S+ \[(?P<timestamp>.*?)\] "(?P<request>.*?)" (?P<status>\d{3}) (?P<size>\S+) "(?P<referrer>.*?)" "(?P<user_agent>.*?)"\s*.*'
 )
+# Bản bytes của LOG_PATTERN cho engine "mmap" khi không có pyarrow: quét thẳng trên vùng nhớ map từ file
+LOG_PATTERN_BYTES = re.compile(
+    rb'^[ \t\r\f\v]*(?P<ip>[\d\.]+) \S+ \S+ \[(?P<timestamp>.*?)\] "(?P<request>.*?)" (?P<status>\d{3}) (?P<size>\S+) "(?P<referrer>.*?)" "(?P<user_agent>.*?)"',
+    re.MULTILINE
+)
+SIZE_PATTERN = re.compile(r'[+-]?[0-9]+')
+# Tách Method/Path từ request, tương đương request.split() lấy 2 phần đầu
+REQUEST_PATTERN = r'^\s*(?P<method>\S+)\s+(?P<path>\S+)'
+# Kiểm tra hình dạng các phần khi cắt dòng theo dấu " (fast path của engine vectorized)
+FAST_HEAD_PATTERN = r'^[\d\.]+ [^\s\[]+ [^\s\[]+ \[[^\[]*\] $'
+FAST_STATUS_PATTERN = r'^ \d{3} \S+ $'
+
+LOG_COLUMNS = ['ip', 'request', 'status', 'size', 'referrer', 'user_agent', 'method', 'path', 'datetime']
+# Cột chỉ có ở một số định dạng (vd. nginx có $request_time), giữ lại nếu parser của định dạng đó tạo ra
+EXTRA_COLUMNS = ['request_time']
+# Các cột chuỗi lặp lại nhiều được lưu dạng category (mỗi giá trị khác nhau chỉ lưu một lần)
+CATEGORICAL_COLUMNS = ['ip', 'request', 'referrer', 'user_agent', 'method', 'path']
+TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+# Timestamp chuẩn dạng 10/Oct/2000:13:55:36 -0700 có độ dài cố định, có thể cắt theo vị trí
+FIXED_TIME_PATTERN = r'^\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:\d\d [+-]\d{4}$'
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Engine "vectorized" đọc file theo block lớn rồi tách field bằng pyarrow compute (RE2),
+# engine "mmap" làm tương tự nhưng dựng mảng chuỗi trực tiếp trên vùng nhớ map từ file
+DEFAULT_ENGINE = os.getenv("PARSE_ENGINE", "mmap")
+# Định dạng log: "auto" nhận diện từ các dòng đầu file, hoặc tên trong core.log_formats (combined, common, nginx, json, w3c, csv)
+DEFAULT_LOG_FORMAT = os.getenv("LOG_FORMAT", "auto")
+BLOCK_SIZE = 32 * 1024 * 1024
+
+# Parse song song theo từng đoạn byte (shard) cho file lớn
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_BYTES = int(os.getenv("PARALLEL_PARSE_MIN_MB", "256")) * 1024 * 1024
+# Tỉ lệ nén ước lượng, dùng để quyết định parse song song với file nén
+COMPRESSION_RATIO_HINT = 10
+# Số dòng mỗi DataFrame khi parse theo luồng (iter_log_chunks)
+CHUNK_ROWS = int(os.getenv("PARSE_CHUNK_ROWS", "200000"))
+
+# Nhận diện file nén qua magic bytes (không dựa vào đuôi file)
+COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+def detect_compression(filepath: str):
+    with open(filepath, 'rb') as f:
+        head = f.read(4)
+    for magic, kind in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+def _open_log(filepath: str):
+    """Mở file log ở chế độ binary, file nén được giải nén theo luồng"""
+    kind = detect_compression(filepath)
+    if kind == 'gzip':
+        return gzip.open(filepath, 'rb')
+    if kind == 'bz2':
+        return bz2.open(filepath, 'rb')
+    if kind == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("File nén zstd cần package 'zstandard'")
+        return zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), read_across_frames=True, closefd=True)
+    return open(filepath, 'rb')
+
+def prefetch(iterable, depth: int = 2):
+    """Chạy iterable trong thread nền và giữ sẵn tối đa `depth` phần tử,
+    để việc đọc/giải nén block kế tiếp chạy song song với việc xử lý block hiện tại"""
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        # Không chặn vô hạn khi consumer đã dừng (generator bị đóng giữa chừng)
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)): return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None: raise error
+            if item is done: return
+            yield item
+    finally:
+        stop.set()
+
+def _iter_raw_blocks(filepath: str, block_size: int = BLOCK_SIZE, start: int = 0, end: int = None):
+    """Đọc file (hoặc đoạn [start, end) với file không nén) theo block byte lớn, kết thúc ngay sau ký tự xuống dòng.
+    File nén được giải nén trong thread nền, song song với việc parse."""
+    if detect_compression(filepath):
+        yield from prefetch(_read_raw_blocks(filepath, block_size, 0, None))
+    else:
+        yield from _read_raw_blocks(filepath, block_size, start, end)
+
+def _read_raw_blocks(filepath: str, block_size: int, start: int, end: int):
+    with _open_log(filepath) as f:
+        if start: f.seek(start)
+        remaining = end - start if end is not None else None
+        rest = b''
+        while True:
+            block = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not block: break
+            if remaining is not None: remaining -= len(block)
+            block = rest + block
+            cut = block.rfind(b'\n')
+            if cut == -1:
+                rest = block
+                continue
+            rest = block[cut + 1:]
+            yield block[:cut + 1]
+        if rest:
+            yield rest
+
+def _iter_line_blocks(filepath: str, block_size: int = BLOCK_SIZE, start: int = 0, end: int = None):
+    """Như _iter_raw_blocks nhưng decode UTF-8 và trả về list các dòng"""
+    for block in _iter_raw_blocks(filepath, block_size, start, end):
+        yield block.decode('utf-8', errors='ignore').removesuffix('\n').split('\n')
+
+def _iter_mmap_blocks(filepath: str, block_size: int = BLOCK_SIZE, start: int = 0, end: int = None):
+    """Map file vào bộ nhớ, trả về từng block byte (không copy, không decode) kết thúc ngay sau ký tự xuống dòng"""
+    if detect_compression(filepath):
+        # File nén không map được: đọc block đã giải nén
+        yield from _iter_raw_blocks(filepath, block_size)
+        return
+
+    size = os.path.getsize(filepath)
+    end = size if end is None else min(end, size)
+    if start >= end: return
+
+    try:
+        import pyarrow as pa
+        # Buffer của pyarrow giữ vùng map sống cho tới khi không còn array nào tham chiếu
+        mapped = pa.memory_map(filepath, 'r')
+        def view(pos, length):
+            mapped.seek(pos)
+            return mapped.read_buffer(length)
+    except ImportError:
+        with open(filepath, 'rb') as f:
+            mapped = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        def view(pos, length):
+            return mapped[pos:pos + length]
 
-def parse_log_file(filepath: str) -> pd.DataFrame:
+    pos = start
+    while pos < end:
+        length = min(block_size, end - pos)
+        block = view(pos, length)
+        while pos + length < end:
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            if newlines.size:
+                block = view(pos, int(newlines[-1]) + 1)
+                break
+            # Dòng dài hơn block: nới rộng block
+            length = min(length * 2, end - pos)
+            block = view(pos, length)
+        yield block
+        pos += len(block)
+
+def _decode_fixed_timestamps(values: pd.Series):
+    """Giải mã timestamp bằng cắt chuỗi theo vị trí cố định (không strptime từng dòng).
+    Trả về None nếu block có timestamp lệch chuẩn hoặc nhiều múi giờ, để dùng pd.to_datetime như cũ."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arr = pa.array(values, type=pa.string(), from_pandas=True)
+    if arr.null_count or not pc.all(pc.match_substring_regex(arr, FIXED_TIME_PATTERN)).as_py():
+        return None
+    offsets = pc.unique(pc.utf8_slice_codeunits(arr, 21, 26))
+    if len(offsets) != 1:
+        return None
+
+    def number(start, stop):
+        return pc.cast(pc.utf8_slice_codeunits(arr, start, stop), pa.int64()).to_numpy()
+
+    month = pc.index_in(pc.utf8_slice_codeunits(arr, 3, 6), value_set=pa.array(MONTHS))
+    if month.null_count:
+        return None
+    local = pd.to_datetime(pd.DataFrame({
+        'year': number(7, 11), 'month': month.to_numpy() + 1, 'day': number(0, 2),
+        'hour': number(12, 14), 'minute': number(15, 17), 'second': number(18, 20),
+    }), errors='coerce')
+    if local.isna().any():
+        return None
+
+    # Lấy đúng dtype (đơn vị + múi giờ) mà pd.to_datetime trả về cho giá trị đầu tiên
+    sample = pd.to_datetime(values.iloc[:1], format=TIME_FORMAT)
+    return local.dt.tz_localize(sample.dt.tz).astype(sample.dtype).set_axis(values.index)
+
+def parse_timestamps(values: pd.Series, fmt: str = TIME_FORMAT, utc: bool = False) -> pd.Series:
+    """Chuyển chuỗi thời gian sang datetime, mỗi giá trị khác nhau chỉ parse một lần"""
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == len(values):
+        return pd.to_datetime(values, format=fmt, errors='coerce', utc=utc)
+    decoded = pd.to_datetime(pd.Series(uniques), format=fmt, errors='coerce', utc=utc)
+    return pd.Series(decoded.take(codes).where(codes >= 0).array, index=values.index)
+
+def _finalize_frame(df: pd.DataFrame, fast_time: bool = False) -> pd.DataFrame:
+    # Ép kiểu dữ liệu
+    df['status'] = pd.to_numeric(df['status'], errors='coerce').fillna(200).astype('int64')
+    # Một số định dạng (json, w3c...) đã tự chuyển thời gian sang datetime
+    if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        decoded = _decode_fixed_timestamps(df['datetime']) if fast_time else None
+        if decoded is None:
+            decoded = parse_timestamps(df['datetime'])
+        df['datetime'] = decoded
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df[LOG_COLUMNS + [col for col in EXTRA_COLUMNS if col in df.columns]]
+
+def _parse_lines_python(lines) -> pd.DataFrame:
+    """Engine gốc: regex + dict cho từng dòng"""
     data = []
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+
+        match = LOG_PATTERN.match(line)
+        if match:
+            row = match.groupdict()
+            # Tách Method/Path
+            parts = row['request'].split()
+            if len(parts) >= 2:
+                row['method'] = parts[0]
+                row['path'] = parts[1]
+            else:
+                row['method'] = "unknown"
+                row['path'] = row['request']
+            # Xử lý Size
+            row['size'] = 0 if row['size'] == '-' else int(row['size'])
+            row['datetime'] = row.pop('timestamp')
+            data.append(row)
+
+    df = pd.DataFrame(data)
+    if df.empty: return pd.DataFrame()
+    return _finalize_frame(df)
+
+def _parse_lines_vectorized(lines) -> pd.DataFrame:
+    """Tách field cho cả block bằng phép toán vector, không tạo dict cho từng dòng"""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return _parse_lines_pandas(lines)
+
+    df = _vector_combined_frame(pc.utf8_trim_whitespace(pa.array(lines, type=pa.string())))
+    if df.empty: return pd.DataFrame()
+    return _finalize_frame(df.reset_index(drop=True), fast_time=True)
+
+def _vector_combined_frame(arr) -> pd.DataFrame:
+    """Tách field combined cho mảng dòng (pyarrow, đã trim); chưa ép kiểu,
+    index là vị trí dòng trong mảng để định dạng khác (nginx) ghép thêm cột"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    positions = np.arange(len(arr))
+
+    # Fast path: dòng có đúng 6 dấu " thì cắt theo dấu " là đủ, chỉ cần kiểm tra hình dạng từng phần
+    parts = pc.split_pattern(arr, '"')
+    fast = pc.equal(pc.list_value_length(parts), 7)
+    fast_parts = parts.filter(fast)
+    fast_ok = pc.and_(
+        pc.and_(
+            pc.match_substring_regex(pc.list_element(fast_parts, 0), FAST_HEAD_PATTERN),
+            pc.match_substring_regex(pc.list_element(fast_parts, 2), FAST_STATUS_PATTERN),
+        ),
+        pc.equal(pc.list_element(fast_parts, 4), ' '),
+    )
+    fast_parts = fast_parts.filter(fast_ok)
+    fast_positions = positions[fast.to_numpy(zero_copy_only=False)][fast_ok.to_numpy(zero_copy_only=False)]
+
+    head = pc.list_element(fast_parts, 0)
+    head_fields = pc.split_pattern(head, ' [', max_splits=1)
+    status_fields = pc.split_pattern(pc.utf8_trim(pc.list_element(fast_parts, 2), ' '), ' ')
+    frames = [_vector_fields_frame(pc, fast_positions, {
+        'ip': pc.list_element(pc.split_pattern(head, ' ', max_splits=1), 0),
+        'timestamp': pc.utf8_slice_codeunits(pc.list_element(head_fields, 1), 0, -2),
+        'request': pc.list_element(fast_parts, 1),
+        'status': pc.list_element(status_fields, 0),
+        'size': pc.list_element(status_fields, 1),
+        'referrer': pc.list_element(fast_parts, 3),
+        'user_agent': pc.list_element(fast_parts, 5),
+    })]
+
+    # Các dòng còn lại (có dấu " trong request/UA, dòng lỗi...) đi qua regex đầy đủ
+    slow_mask = np.ones(len(arr), dtype=bool)
+    slow_mask[fast_positions] = False
+    if slow_mask.any():
+        parsed = pc.extract_regex(arr.filter(pa.array(slow_mask)), LOG_PATTERN.pattern)
+        matched = pc.is_valid(parsed)
+        parsed = parsed.filter(matched)
+        if len(parsed):
+            slow_positions = positions[slow_mask][matched.to_numpy(zero_copy_only=False)]
+            frames.append(_vector_fields_frame(pc, slow_positions, {
+                name: parsed.field(name)
+                for name in ('ip', 'timestamp', 'request', 'status', 'size', 'referrer', 'user_agent')
+            }))
+
+    df = pd.concat(frames) if len(frames) > 1 else frames[0]
+    if len(frames) > 1:
+        df = df.sort_index(kind='stable')
+    return df
+
+def _vector_fields_frame(pc, positions, fields) -> pd.DataFrame:
+    req = pc.extract_regex(fields['request'], REQUEST_PATTERN)
+    req_ok = pc.is_valid(req)
+    size = fields['size']
+    size = pc.if_else(pc.match_substring_regex(size, f'^{SIZE_PATTERN.pattern}$'), pc.replace_substring_regex(size, r'^\+', ''), '0')
+    df = pd.DataFrame({
+        'ip': fields['ip'].to_pandas(),
+        'request': fields['request'].to_pandas(),
+        'status': pc.cast(fields['status'], 'int64').to_pandas(),
+        'size': pc.cast(size, 'int64').to_pandas(),
+        'referrer': fields['referrer'].to_pandas(),
+        'user_agent': fields['user_agent'].to_pandas(),
+        'method': pc.if_else(req_ok, req.field('method'), 'unknown').to_pandas(),
+        'path': pc.if_else(req_ok, req.field('path'), fields['request']).to_pandas(),
+        'datetime': fields['timestamp'].to_pandas(),
+    })
+    df.index = positions
+    return df
+
+def _parse_buffer(buf) -> pd.DataFrame:
+    """Engine "mmap": dựng mảng chuỗi của pyarrow trỏ thẳng vào block (offset = vị trí xuống dòng),
+    không tạo str cho từng dòng; không có pyarrow thì quét block bằng regex bytes"""
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                
-                match = LOG_PATTERN.match(line)
-                if match:
-                    row = match.groupdict()
-                    # Tách Method/Path
-                    parts = row['request'].split()
-                    if len(parts) >= 2:
-                        row['method'] = parts[0]
-                        row['path'] = parts[1]
-                    else:
-                        row['method'] = "unknown"
-                        row['path'] = row['request']
-                    # Xử lý Size
-                    row['size'] = 0 if row['size'] == '-' else int(row['size'])                    
-                    row['datetime'] = row.pop('timestamp')
-                    data.append(row)
-
-        df = pd.DataFrame(data)
-        if df.empty: return pd.DataFrame()
-        # Ép kiểu dữ liệu 
-        df['status'] = pd.to_numeric(df['status'], errors='coerce').fillna(200)
-        df['datetime'] = pd.to_datetime(df['datetime'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
-        
-        return df
+        import pyarrow
+    except ImportError:
+        return _parse_buffer_regex(buf)
 
+    lines = buffer_lines(buf)
+    if len(lines) == 0: return pd.DataFrame()
+    return _parse_lines_vectorized(lines)
+
+def buffer_lines(buf):
+    """Mảng chuỗi pyarrow gồm các dòng của block byte (không copy); block có UTF-8 lỗi thì trả về list str"""
+    import pyarrow as pa
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if data.size == 0: return []
+    offsets = np.flatnonzero(data == 10) + 1
+    if offsets.size == 0 or offsets[-1] != data.size:
+        offsets = np.append(offsets, data.size)
+    offsets = np.concatenate(([0], offsets)).astype(np.int32)
+
+    lines = pa.Array.from_buffers(pa.binary(), len(offsets) - 1, [None, pa.py_buffer(offsets), pa.py_buffer(buf)])
+    try:
+        lines = lines.cast(pa.string())
+    except pa.ArrowInvalid:
+        # Block có byte UTF-8 lỗi: decode bỏ qua lỗi như cách đọc text mode
+        lines = bytes(buf).decode('utf-8', errors='ignore').split('\n')
+    return lines
+
+def _parse_buffer_regex(buf) -> pd.DataFrame:
+    """Quét block bằng LOG_PATTERN_BYTES, chỉ decode các field đã bắt được"""
+    rows = []
+    for match in LOG_PATTERN_BYTES.finditer(buf):
+        ip, timestamp, request, status, size, referrer, user_agent = (
+            field.decode('utf-8', errors='ignore') for field in match.groups()
+        )
+        # Tách Method/Path
+        parts = request.split()
+        method, path = (parts[0], parts[1]) if len(parts) >= 2 else ("unknown", request)
+        size = int(size) if SIZE_PATTERN.fullmatch(size) else 0
+        rows.append((ip, request, status, size, referrer, user_agent, method, path, timestamp))
+
+    if not rows: return pd.DataFrame()
+    return _finalize_frame(pd.DataFrame(rows, columns=LOG_COLUMNS))
+
+def _parse_lines_pandas(lines) -> pd.DataFrame:
+    """Fallback khi không có pyarrow: dùng pandas str.extract"""
+    parsed = pd.Series(lines).str.strip().str.extract(LOG_PATTERN)
+    parsed = parsed.dropna(subset=['ip']).reset_index(drop=True)
+    if parsed.empty: return pd.DataFrame()
+
+    req = parsed['request'].str.extract(REQUEST_PATTERN)
+    req_ok = req['method'].notna()
+    parsed['method'] = req['method'].where(req_ok, "unknown")
+    parsed['path'] = req['path'].where(req_ok, parsed['request'])
+    parsed['size'] = pd.to_numeric(parsed['size'].replace('-', '0'), errors='coerce').fillna(0).astype('int64')
+    parsed = parsed.rename(columns={'timestamp': 'datetime'})
+    return _finalize_frame(parsed)
+
+# engine -> (nguồn đọc block, hàm parse một block)
+PARSE_ENGINES = {
+    "python": (_iter_line_blocks, _parse_lines_python),
+    "vectorized": (_iter_line_blocks, _parse_lines_vectorized),
+    "mmap": (_iter_mmap_blocks, _parse_buffer),
+}
+
+def split_byte_ranges(filepath: str, shards: int, start: int = 0, end: int = None):
+    """Chia file (hoặc đoạn [start, end)) thành các đoạn con có ranh giới ngay sau ký tự xuống dòng"""
+    size = os.path.getsize(filepath) if end is None else end
+    bounds = [start]
+    with open(filepath, 'rb') as f:
+        for i in range(1, shards):
+            target = max(start + (size - start) * i // shards, bounds[-1])
+            f.seek(target)
+            if target > 0:
+                f.readline()  # Bỏ phần còn lại của dòng đang bị cắt
+            pos = min(f.tell(), size)
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+def _concat_frames(frames) -> pd.DataFrame:
+    frames = [df for df in frames if not df.empty]
+    if not frames: return pd.DataFrame()
+    if len(frames) == 1: return frames[0]
+    # pd.concat biến category khác tập giá trị thành object, nên gộp category bằng union_categoricals
+    columns = {}
+    for col in frames[0].columns:
+        parts = [df[col] for df in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[col] = union_categoricals(parts)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def parse_version(log_format: tuple) -> str:
+    """Định danh kết quả parse (PARSER_VERSION + định dạng log), gắn vào cache/checkpoint dựng từ kết quả parse"""
+    return f"{PARSER_VERSION}-{log_format[0]}"
+
+def resolve_log_format(filepath: str, log_format=DEFAULT_LOG_FORMAT) -> tuple:
+    """(tên định dạng, header) của file; "auto" thì nhận diện từ các dòng đầu file"""
+    if isinstance(log_format, tuple): return log_format
+    from core.log_formats import detect_log_format
+    return detect_log_format(filepath, log_format)
+
+def _block_engine(engine: str, log_format: tuple):
+    """(nguồn đọc block, hàm parse một block) cho engine + định dạng log"""
+    if log_format[0] == "combined":
+        return PARSE_ENGINES[engine]
+    # Các định dạng khác parse trực tiếp trên block byte
+    from core.log_formats import block_parser
+    return (_iter_mmap_blocks if engine == "mmap" else _iter_raw_blocks), block_parser(log_format)
+
+def _iter_engine_blocks(filepath: str, engine: str, log_format: tuple, start: int = 0, end: int = None):
+    read_blocks, parse_block = _block_engine(engine, log_format)
+    return map(parse_block, read_blocks(filepath, start=start, end=end))
+
+def _parse_byte_range(filepath: str, start: int, end: int, engine: str, log_format: tuple) -> pd.DataFrame:
+    return _concat_frames(_iter_engine_blocks(filepath, engine, log_format, start, end))
+
+def pool_context():
+    """Context cho ProcessPoolExecutor: forkserver (spawn nếu không có). Không fork trực tiếp process API
+    vì fork sao chép cả lock đang bị thread khác giữ (prefetch, batcher, sqlite) và có thể treo worker."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def auto_workers(filepath: str) -> int:
+    """Số worker nên dùng: chỉ parse song song khi file (ước lượng sau giải nén) vượt ngưỡng PARALLEL_PARSE_MIN_MB"""
+    try:
+        size = os.path.getsize(filepath)
+        if detect_compression(filepath):
+            size *= COMPRESSION_RATIO_HINT
+        return PARSE_WORKERS if size >= PARALLEL_MIN_BYTES else 1
+    except OSError:
+        return 1
+
+def _iter_parsed_blocks(filepath: str, engine: str, workers: int, log_format: tuple, start: int = 0, end: int = None):
+    """Parse từng block theo thứ tự file; với workers > 1 các block được parse trong process pool,
+    chỉ giữ tối đa 2 * workers block đang chờ để bộ nhớ không tăng theo kích thước file.
+    [start, end) chỉ áp dụng cho file không nén."""
+    if workers <= 1:
+        yield from _iter_engine_blocks(filepath, engine, log_format, start, end)
+        return
+
+    if detect_compression(filepath):
+        # File nén không chia theo byte được: giải nén tuần tự, gửi từng block sang pool để parse
+        read_blocks, parse_block = _block_engine(engine, log_format)
+        tasks = ((parse_block, block) for block in read_blocks(filepath))
+    else:
+        size = (os.path.getsize(filepath) if end is None else end) - start
+        ranges = split_byte_ranges(filepath, max(1, size // BLOCK_SIZE), start, end)
+        tasks = ((_parse_byte_range, filepath, s, e, engine, log_format) for s, e in ranges)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        pending = deque()
+        for func, *args in tasks:
+            pending.append(pool.submit(func, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_log_chunks(filepath: str, rows: int = CHUNK_ROWS, engine: str = DEFAULT_ENGINE, workers: int = 1,
+                    start: int = 0, end: int = None, log_format=DEFAULT_LOG_FORMAT):
+    """Parse file (hoặc đoạn byte [start, end)) theo luồng, trả về lần lượt các DataFrame tối đa `rows` dòng.
+    Bộ nhớ đỉnh chỉ phụ thuộc BLOCK_SIZE và `rows`, không phụ thuộc kích thước file.
+    Lỗi giữa chừng được ném ra cho nơi gọi (không kết thúc bình thường với dữ liệu thiếu)."""
+    buffer, buffered = [], 0
+    log_format = resolve_log_format(filepath, log_format)
+    for df in _iter_parsed_blocks(filepath, engine, workers, log_format, start, end):
+        if df.empty: continue
+        buffer.append(df)
+        buffered += len(df)
+        while buffered >= rows:
+            merged = _concat_frames(buffer)
+            yield merged.iloc[:rows].reset_index(drop=True)
+            rest = merged.iloc[rows:]
+            buffer, buffered = ([rest] if len(rest) else []), len(rest)
+    if buffered:
+        yield _concat_frames(buffer).reset_index(drop=True)
+
+def parse_log_file(filepath: str, engine: str = DEFAULT_ENGINE, workers: int = 1,
+                   start: int = 0, end: int = None, log_format=DEFAULT_LOG_FORMAT) -> pd.DataFrame:
+    try:
+        log_format = resolve_log_format(filepath, log_format)
+        return _concat_frames(_iter_parsed_blocks(filepath, engine, workers, log_format, start, end))
     except Exception as e:
         print(f"❌ Lỗi Parser: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+# ---------------------------------------------------------------------------
+# Chuẩn hóa path trước khi encode: /api/users/123/orders/9981?x=1 -> /api/users/{num}/orders/{num}
+# ---------------------------------------------------------------------------
+
+PATH_TEMPLATES_FILE = 'path_templates.json'
+# Một vị trí segment (sau cùng một tiền tố) có nhiều hơn bấy nhiêu giá trị khác nhau trong tập train thì gộp thành {var}
+PATH_TEMPLATE_MAX_CHILDREN = int(os.getenv("PATH_TEMPLATE_MAX_CHILDREN", "100"))
+PATH_VARIABLE = '{var}'
+# Luật cho segment dài (>= 16 ký tự); segment toàn chữ số luôn thành {num}
+PATH_SEGMENT_RULES = [
+    (re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'), '{uuid}'),
+    (re.compile(r'^[0-9a-fA-F]{16,}$'), '{hash}'),
+    # Token dài lẫn chữ và số (session id, base64...)
+    (re.compile(r'^(?=[A-Za-z_\-]*\d)[A-Za-z0-9_\-]{20,}$'), '{token}'),
+]
+# Fingerprint trong tên file tĩnh: app.3f2a9c1b.js -> app.{hash}.js
+PATH_FINGERPRINT = re.compile(r'\.[0-9a-fA-F]{8,}\.')
+# Dấu hiệu tấn công (kiểm tra trên chuỗi đã percent-decode): segment/query khớp thì giữ nguyên cho model thấy payload,
+# còn lại segment được phép gộp thành {var} và query string thành PATH_QUERY
+PATH_ATTACK_PATTERN = re.compile(
+    r"\.\.|[<>'\"`;\\\x00]|\$[{(]|(?i:\bunion\b.*\bselect\b|\bor\b\s+\d+\s*=\s*\d+|javascript:|/etc/passwd)"
+)
+PATH_QUERY = '?{query}'
+
+def _normalize_segment(segment: str) -> str:
+    # Kiểm tra rẻ trước, chỉ chạy regex với segment có thể khớp
+    if segment.isdecimal():
+        return '{num}'
+    if len(segment) >= 16:
+        for pattern, placeholder in PATH_SEGMENT_RULES:
+            if pattern.match(segment):
+                return placeholder
+    if len(segment) >= 10 and '.' in segment:
+        return PATH_FINGERPRINT.sub('.{hash}.', segment)
+    return segment
+
+def _decode(text: str) -> str:
+    # Giải mã hai lần để bắt cả payload bị encode kép (%252e%252e -> %2e%2e -> ..)
+    return unquote(unquote(text))
+
+def is_safe_segment(segment: str) -> bool:
+    """Segment (đã chuẩn hóa) có thể gộp thành {var} mà không làm mất dấu hiệu tấn công"""
+    return segment != '' and PATH_ATTACK_PATTERN.search(_decode(segment)) is None
+
+def _split_query(path: str) -> tuple:
+    """(phần path, phần từ ký tự ? hoặc # đầu tiên)"""
+    cut = len(path.split('?', 1)[0].split('#', 1)[0])
+    return path[:cut], path[cut:]
+
+def normalize_path(path: str) -> str:
+    """Query string/fragment thông thường thành PATH_QUERY (giữ nguyên nếu có dấu hiệu tấn công),
+    thay các segment số, UUID, hash, token bằng placeholder"""
+    path, query = _split_query(str(path))
+    if len(query) > 1 and PATH_ATTACK_PATTERN.search(_decode(query)) is None:
+        query = PATH_QUERY
+    elif len(query) <= 1:
+        query = ''
+    return '/'.join([_normalize_segment(segment) for segment in path.split('/')]) + query
+
+class PathTemplates:
+    """Template path học từ tập train: ngoài các luật cố định của normalize_path, vị trí segment nào
+    (sau một tiền tố đã chuẩn hóa) có quá nhiều giá trị khác nhau thì được gộp thành {var}.
+    Segment đầu tiên (ngay sau /) không bao giờ bị gộp để giữ các endpoint gốc (/wp-admin, /.env...),
+    segment không an toàn (xem is_safe_segment) luôn giữ nguyên: /shop/<script> không thành /shop/{var}"""
+
+    def __init__(self, variable_prefixes=(), max_children: int = PATH_TEMPLATE_MAX_CHILDREN):
+        self.variable_prefixes = set(variable_prefixes)
+        self.max_children = max_children
+
+    def apply(self, path: str) -> str:
+        """Template của một path (đã hoặc chưa qua normalize_path)"""
+        path = normalize_path(path)
+        if not self.variable_prefixes:
+            return path
+        path, query = _split_query(path)
+        segments = path.split('/')
+        prefix = segments[0]
+        for segment in segments[1:]:
+            variable = prefix in self.variable_prefixes and is_safe_segment(segment)
+            prefix = f"{prefix}/{PATH_VARIABLE if variable else segment}"
+        return prefix + query
+
+    def normalize(self, values: pd.Series) -> pd.Series:
+        """Template cho cả cột path (dạng category), mỗi giá trị khác nhau chỉ chuẩn hóa một lần; NaN giữ nguyên"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values)
+        templates = [self.apply(v) for v in uniques]
+        template_codes, template_uniques = pd.factorize(pd.Index(templates, dtype=object))
+        mapped = np.append(template_codes, -1)[codes]
+        return pd.Series(pd.Categorical.from_codes(mapped, categories=template_uniques), index=values.index, name=values.name)
+
+    @classmethod
+    def learn(cls, paths, max_children: int = PATH_TEMPLATE_MAX_CHILDREN) -> "PathTemplates":
+        """Học các vị trí biến từ tập path train, từng độ sâu một (tiền tố ở độ sâu d đã được gộp theo các độ sâu trước)"""
+        split = [_split_query(p)[0].split('/') for p in {normalize_path(p) for p in paths}]
+        current = [segments[:1] for segments in split]
+        variable = set()
+        depth = 1
+        while True:
+            children = defaultdict(set)
+            for segments, out in zip(split, current):
+                # Segment không an toàn không được tính: payload không làm một vị trí trở thành biến
+                if len(segments) > depth and is_safe_segment(segments[depth]):
+                    children['/'.join(out)].add(segments[depth])
+            if not children:
+                break
+            if depth > 1:
+                variable.update(prefix for prefix, kids in children.items() if len(kids) > max_children)
+            for segments, out in zip(split, current):
+                if len(segments) > depth:
+                    prefix = '/'.join(out)
+                    out.append(PATH_VARIABLE if prefix in variable and is_safe_segment(segments[depth]) else segments[depth])
+            depth += 1
+        return cls(variable, max_children)
+
+    def vocabulary_report(self, paths) -> dict:
+        """Số path khác nhau trước / sau normalize_path / sau template"""
+        raw = set(paths)
+        normalized = {normalize_path(p) for p in raw}
+        templates = {self.apply(p) for p in normalized}
+        return {"raw": len(raw), "normalized": len(normalized), "templates": len(templates)}
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"max_children": self.max_children, "variable_prefixes": sorted(self.variable_prefixes)}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PathTemplates":
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config["variable_prefixes"], config.get("max_children", PATH_TEMPLATE_MAX_CHILDREN))
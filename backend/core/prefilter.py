@@ -0,0 +1,63 @@
+import os
+import numpy as np
+
+PREFILTER_FILE = 'prefilter_profile.npz'
+# Tỉ lệ anomaly của dữ liệu train mà tầng lọc phải giữ lại khi hiệu chỉnh ngưỡng z
+PREFILTER_TARGET_RECALL = float(os.getenv("PREFILTER_TARGET_RECALL", "0.99"))
+
+class FeatureProfile:
+    """Tầng lọc rẻ đặt trước autoencoder: mean/std từng đặc trưng (đã scale) của dữ liệu train.
+    Dòng có mọi đặc trưng nằm trong mean ± z_limit * std được coi là bình thường, không cần chạy model."""
+
+    def __init__(self, mean, std, z_limit: float):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.z_limit = float(z_limit)
+        spread = self.std * np.float32(self.z_limit)
+        self.lower = self.mean - spread
+        self.upper = self.mean + spread
+
+    def z_scores(self, data: np.ndarray) -> np.ndarray:
+        """|z| lớn nhất trên các đặc trưng của từng dòng (đặc trưng có std = 0 mà lệch mean -> inf)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.abs(data - self.mean) / self.std
+        z[np.isnan(z)] = 0
+        return z.max(axis=1)
+
+    def suspects(self, data: np.ndarray) -> np.ndarray:
+        """Mask các dòng phải chạy autoencoder: có ít nhất một đặc trưng ngoài khoảng bình thường"""
+        mask = np.zeros(len(data), dtype=bool)
+        for j in range(data.shape[1]):
+            column = data[:, j]
+            mask |= column < self.lower[j]
+            mask |= column > self.upper[j]
+        return mask
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, mean=self.mean, std=self.std, z_limit=np.array(self.z_limit))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureProfile":
+        with np.load(path) as data:
+            return cls(data['mean'], data['std'], float(data['z_limit']))
+
+    @classmethod
+    def fit(cls, data: np.ndarray, errors: np.ndarray, threshold: float,
+            target_recall: float = PREFILTER_TARGET_RECALL) -> "FeatureProfile":
+        """Thống kê trên dữ liệu train đã scale; z_limit chọn sao cho ít nhất target_recall các dòng
+        có lỗi tái tạo vượt threshold vẫn bị coi là nghi ngờ"""
+        return cls.calibrate(data.mean(axis=0), data.std(axis=0), data[errors > threshold], target_recall)
+
+    @classmethod
+    def calibrate(cls, mean, std, anomalies: np.ndarray, target_recall: float = PREFILTER_TARGET_RECALL) -> "FeatureProfile":
+        """Như fit nhưng từ mean/std đã tính sẵn (vd. cộng dồn theo luồng) và các dòng anomaly của dữ liệu train"""
+        profile = cls(mean, std, 0.0)
+        if len(anomalies) == 0:
+            # Không có anomaly để hiệu chỉnh: không loại dòng nào
+            return profile
+        z = profile.z_scores(anomalies)
+        # Dòng được loại khi |z| <= z_limit ở mọi đặc trưng: lấy ngay dưới phân vị (1 - target_recall)
+        z_limit = np.quantile(z, 1 - target_recall, method='lower')
+        return cls(profile.mean, profile.std, max(0.0, float(np.nextafter(z_limit, 0))))
@@ -0,0 +1,129 @@
+import math
+import numpy as np
+
+class TDigest:
+    """Sketch phân vị t-digest (merging digest, Dunning): các centroid (mean, weight) nhỏ dần về hai đuôi
+    nên phân vị cao (0.99, 0.999) vẫn chính xác. Bộ nhớ O(compression), gộp (merge) được nhiều sketch
+    và không cần giữ lại dữ liệu gốc."""
+
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+        self._buffer_size = int(5 * compression)
+
+    def _k(self, q):
+        # Hàm scale k1: bước q nhỏ ở gần 0 và 1
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _flush(self, means=None, weights=None):
+        """Gộp buffer (và các centroid truyền vào) với centroid hiện có"""
+        parts_m = [self.means, np.asarray(self._buffer, dtype=float)]
+        parts_w = [self.weights, np.ones(len(self._buffer))]
+        if means is not None:
+            parts_m.append(means)
+            parts_w.append(weights)
+        all_m = np.concatenate(parts_m)
+        all_w = np.concatenate(parts_w)
+        self._buffer = []
+        if len(all_m) == 0:
+            return
+        order = np.argsort(all_m, kind='stable')
+        all_m, all_w = all_m[order], all_w[order]
+        total = all_w.sum()
+
+        new_m, new_w = [all_m[0]], [all_w[0]]
+        done = 0.0
+        q_limit = self._q(self._k(0) + 1) * total
+        for mean, weight in zip(all_m[1:], all_w[1:]):
+            if done + new_w[-1] + weight <= q_limit:
+                new_w[-1] += weight
+                new_m[-1] += (mean - new_m[-1]) * weight / new_w[-1]
+            else:
+                done += new_w[-1]
+                q_limit = self._q(self._k(done / total) + 1) * total
+                new_m.append(mean)
+                new_w.append(weight)
+        self.means = np.array(new_m)
+        self.weights = np.array(new_w)
+
+    def update(self, value: float):
+        value = float(value)
+        self._buffer.append(value)
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0: return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if len(self._buffer) + len(values) < self._buffer_size:
+            self._buffer.extend(values.tolist())
+        else:
+            self._flush(values, np.ones(len(values)))
+
+    def merge(self, other: "TDigest"):
+        other._flush()
+        if other.count == 0: return
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._flush(other.means, other.weights)
+
+    def quantile(self, q: float):
+        """Giá trị tại phân vị q (0..1), nội suy giữa tâm các centroid; None nếu sketch rỗng"""
+        self._flush()
+        if self.count == 0:
+            return None
+        if q <= 0: return self.min
+        if q >= 1: return self.max
+        means, weights = self.means, self.weights
+        target = q * weights.sum()
+        centers = np.cumsum(weights) - weights / 2
+        if target <= centers[0]:
+            # Giữa min và tâm centroid đầu
+            span = centers[0]
+            return float(self.min + (means[0] - self.min) * (target / span if span > 0 else 1))
+        if target >= centers[-1]:
+            span = weights.sum() - centers[-1]
+            return float(means[-1] + (self.max - means[-1]) * ((target - centers[-1]) / span if span > 0 else 0))
+        i = int(np.searchsorted(centers, target, side='right')) - 1
+        frac = (target - centers[i]) / (centers[i + 1] - centers[i])
+        return float(means[i] + (means[i + 1] - means[i]) * frac)
+
+    def to_state(self) -> dict:
+        """State dạng JSON để lưu vào database"""
+        self._flush()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict = None) -> "TDigest":
+        if not state:
+            return cls()
+        digest = cls(state.get("compression", 100))
+        digest.count = state.get("count", 0)
+        if digest.count:
+            digest.min = state["min"]
+            digest.max = state["max"]
+        digest.means = np.asarray(state.get("means", []), dtype=float)
+        digest.weights = np.asarray(state.get("weights", []), dtype=float)
+        return digest
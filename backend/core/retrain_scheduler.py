@@ -0,0 +1,44 @@
+import os
+import sys
+import subprocess
+import threading
+
+# Chu kỳ (giờ) chạy retrain_model.py trong nền; 0 = tắt
+RETRAIN_INTERVAL_HOURS = float(os.getenv("RETRAIN_INTERVAL_HOURS", "0"))
+RETRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "retrain_model.py")
+
+class RetrainScheduler:
+    """Thread nền định kỳ train lại model từ các log 'safe'. Việc train chạy trong process riêng
+    (TensorFlow không bị nạp vào API); bản mới được ModelRegistry tự nạp khi CURRENT thay đổi."""
+
+    def __init__(self, interval_hours: float = RETRAIN_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"🔁 Online retraining every {self.interval / 3600:g}h")
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def run_once(self) -> bool:
+        try:
+            result = subprocess.run([sys.executable, RETRAIN_SCRIPT], capture_output=True, text=True)
+        except Exception as e:
+            print(f"❌ Retraining Error: {e}")
+            return False
+        if result.returncode != 0:
+            print(f"⚠️ Retraining skipped or failed: {(result.stdout + result.stderr).strip().splitlines()[-1:]}")
+        return result.returncode == 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+retrain_scheduler = RetrainScheduler()
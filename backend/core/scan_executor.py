@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from core.parser import iter_log_chunks, split_byte_ranges, detect_compression, resolve_log_format, pool_context, PARALLEL_MIN_BYTES
+from core.model_registry import model_registry
+from core.ml_engine import top_threats
+
+# Số dòng mỗi chunk khi quét: ma trận đặc trưng + reconstruction chỉ tồn tại cho một chunk
+SCAN_CHUNK_ROWS = int(os.getenv("SCAN_CHUNK_ROWS", "50000"))
+# Quét song song trong process pool (mỗi worker giữ sẵn model riêng); 0 = số CPU
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "0")) or os.cpu_count() or 1
+# Kích thước mỗi shard (theo byte) gửi cho một worker
+SCAN_SHARD_BYTES = int(os.getenv("SCAN_SHARD_MB", "32")) * 1024 * 1024
+
+def _init_worker(model_dir: str):
+    # Load model một lần khi worker khởi động, các shard sau dùng lại bản đã load
+    model_registry.model_dir = model_dir
+    model_registry.get()
+
+def _scan_range(filepath: str, start: int, end: int, log_format: tuple, version: str, top_k=None, min_error=None) -> tuple:
+    """(số anomaly, lỗi tái tạo gốc, threat) của đoạn byte [start, end), chạy trong worker process"""
+    detector = model_registry.get()
+    if detector.version != version:
+        detector = model_registry.reload()
+    if detector.version != version:
+        raise RuntimeError(f"Model changed during scan ({version} -> {detector.version})")
+
+    count, errors, threats = 0, [], []
+    for chunk in iter_log_chunks(filepath, rows=SCAN_CHUNK_ROWS, start=start, end=end, log_format=log_format):
+        chunk_count, chunk_errors, chunk_threats = detector.find_anomalies(chunk, top_k=top_k, min_error=min_error)
+        count += chunk_count
+        errors.extend(chunk_errors)
+        threats.extend(chunk_threats)
+        if top_k is not None and len(threats) > top_k:
+            errors, threats = top_threats(errors, threats, top_k)
+    return count, errors, threats
+
+class ScanExecutor:
+    """Chia file thành các shard theo byte, quét song song trong một process pool dùng chung
+    (mỗi worker giữ model đã load qua nhiều lần quét) rồi gộp threat theo đúng thứ tự trong file"""
+
+    def __init__(self, workers: int = SCAN_WORKERS, shard_bytes: int = SCAN_SHARD_BYTES):
+        self.workers = workers
+        self.shard_bytes = shard_bytes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def use_for(self, filepath: str, start: int = 0, end: int = None) -> bool:
+        """Chỉ quét song song file không nén đủ lớn (file nén không chia theo byte được)"""
+        if self.workers <= 1: return False
+        try:
+            size = (os.path.getsize(filepath) if end is None else end) - start
+            return size >= PARALLEL_MIN_BYTES and not detect_compression(filepath)
+        except OSError:
+            return False
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context(),
+                                                     initializer=_init_worker, initargs=(model_registry.model_dir,))
+        return self._pool
+
+    def iter_shard_threats(self, filepath: str, version: str, start: int = 0, end: int = None, top_k=None, min_error=None):
+        """(số anomaly, lỗi tái tạo gốc, threat) của từng shard theo thứ tự file; tối đa 2 * workers shard đang chờ"""
+        size = (os.path.getsize(filepath) if end is None else end) - start
+        shards = max(self.workers, -(-size // self.shard_bytes))
+        log_format = resolve_log_format(filepath)
+        pool = self._get_pool()
+        pending = deque()
+        for s, e in split_byte_ranges(filepath, shards, start, end):
+            pending.append(pool.submit(_scan_range, filepath, s, e, log_format, version, top_k, min_error))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def scan(self, filepath: str, version: str, start: int = 0, end: int = None) -> list:
+        threats = []
+        for _, _, shard in self.iter_shard_threats(filepath, version, start, end):
+            threats.extend(shard)
+        return threats
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+scan_executor = ScanExecutor()
@@ -0,0 +1,145 @@
+import os
+import threading
+import numpy as np
+from core.quantile_sketch import TDigest
+from database import get_server_sketch, save_server_sketch
+
+# Ngưỡng riêng của mỗi server = phân vị này của lỗi tái tạo các log server đó đã gửi
+SERVER_THRESHOLD_QUANTILE = float(os.getenv("SERVER_THRESHOLD_QUANTILE", "0.999"))
+# Chưa đủ số log này thì server dùng ngưỡng chung của model
+SERVER_THRESHOLD_MIN_COUNT = int(os.getenv("SERVER_THRESHOLD_MIN_COUNT", "1000"))
+# Ngưỡng riêng bị kẹp trong [FLOOR, CAP] lần ngưỡng chung: server "sạch" nhạy hơn tối đa FLOOR,
+# server nhiều nhiễu được nới tối đa CAP (lỗi lớn hơn mức trần được winsorize trước khi vào sketch)
+SERVER_THRESHOLD_FLOOR = float(os.getenv("SERVER_THRESHOLD_FLOOR", "0.5"))
+SERVER_THRESHOLD_CAP = float(os.getenv("SERVER_THRESHOLD_CAP", "4.0"))
+# Ghi sketch xuống database sau mỗi bấy nhiêu log mới của một server
+SERVER_SKETCH_FLUSH_EVERY = int(os.getenv("SERVER_SKETCH_FLUSH_EVERY", "100"))
+# Độ chi tiết của t-digest: phân vị 0.999 cần nhiều centroid ở đuôi (100 lệch tới ~10%, 500 còn ~1%)
+SERVER_SKETCH_COMPRESSION = float(os.getenv("SERVER_SKETCH_COMPRESSION", "500"))
+
+class _ServerSketch:
+    def __init__(self, version, digest: TDigest, compression: float):
+        self.version = version
+        self.digest = digest                 # toàn bộ lỗi tái tạo đã thấy (database + chưa ghi)
+        self.pending = TDigest(compression)  # phần chưa ghi xuống database
+        self.flushing = False                # đang ghi xuống database (ngoài lock)
+        self.threshold = None
+
+class ServerThresholds:
+    """Sketch t-digest lỗi tái tạo theo server_id, lưu trong database (không giữ lịch sử lỗi gốc).
+    Sketch gắn với version model: model đổi thì phân bố lỗi đổi, sketch cũ bị bỏ và tích lũy lại từ đầu.
+    Lock chỉ bảo vệ sketch trong bộ nhớ; đọc/ghi database luôn nằm ngoài lock để không chặn thread chấm điểm."""
+
+    def __init__(self, quantile: float = SERVER_THRESHOLD_QUANTILE, min_count: int = SERVER_THRESHOLD_MIN_COUNT,
+                 flush_every: int = SERVER_SKETCH_FLUSH_EVERY, floor: float = SERVER_THRESHOLD_FLOOR,
+                 cap: float = SERVER_THRESHOLD_CAP, compression: float = SERVER_SKETCH_COMPRESSION):
+        self.quantile = quantile
+        self.min_count = min_count
+        self.flush_every = flush_every
+        self.floor = floor
+        self.cap = cap
+        self.compression = compression
+        self._sketches = {}
+        self._lock = threading.Lock()
+
+    def _saved_digest(self, server_id, version) -> TDigest:
+        """Bản sketch trong database (đọc ngoài lock), theo compression hiện tại"""
+        digest = TDigest(self.compression)
+        saved = get_server_sketch(server_id)
+        if saved and saved['model_version'] == version:
+            digest.merge(TDigest.from_state(saved['sketch']))
+        return digest
+
+    def _get(self, server_id, version) -> _ServerSketch:
+        with self._lock:
+            sketch = self._sketches.get(server_id)
+            if sketch is not None and sketch.version == version:
+                return sketch
+        digest = self._saved_digest(server_id, version)
+        with self._lock:
+            sketch = self._sketches.get(server_id)
+            if sketch is None or sketch.version != version:
+                sketch = self._sketches[server_id] = _ServerSketch(version, digest, self.compression)
+            return sketch
+
+    def _threshold(self, sketch: _ServerSketch, default: float) -> float:
+        if sketch.digest.count < self.min_count:
+            return default
+        if sketch.threshold is None:
+            sketch.threshold = sketch.digest.quantile(self.quantile)
+        return min(max(sketch.threshold, default * self.floor), default * self.cap)
+
+    def threshold_for(self, server_id, version, default: float) -> float:
+        """Ngưỡng của server (phân vị của sketch, kẹp trong [sàn, trần]), hoặc default nếu chưa đủ dữ liệu"""
+        if server_id is None:
+            return default
+        sketch = self._get(server_id, version)
+        with self._lock:
+            return self._threshold(sketch, default)
+
+    def observe(self, server_id, version, errors, default: float):
+        """Cộng dồn lỗi tái tạo mới của server vào sketch; đủ flush_every log thì ghi xuống database.
+        Truyền mọi lỗi đã chấm bằng autoencoder (không gồm dòng được cascade bỏ qua với lỗi 0):
+        lỗi trên mức trần default * cap được winsorize về mức trần để không kéo đuôi sketch."""
+        if server_id is None or len(errors) == 0:
+            return
+        errors = np.minimum(errors, default * self.cap)
+        sketch = self._get(server_id, version)
+        with self._lock:
+            sketch.digest.update_many(errors)
+            sketch.pending.update_many(errors)
+            sketch.threshold = None
+            if sketch.flushing or sketch.pending.count < self.flush_every:
+                return
+            pending = self._take_pending(sketch)
+        self._flush(server_id, sketch, pending)
+
+    def _take_pending(self, sketch: _ServerSketch) -> TDigest:
+        # Gọi trong lock: tách phần chưa ghi ra, log mới trong lúc ghi vào pending mới
+        pending, sketch.pending = sketch.pending, TDigest(self.compression)
+        sketch.flushing = True
+        return pending
+
+    def _flush(self, server_id, sketch: _ServerSketch, pending: TDigest):
+        # Gộp phần mới vào bản trong database (process khác có thể đã ghi thêm) rồi ghi lại, ngoài lock
+        try:
+            merged = self._saved_digest(server_id, sketch.version)
+            merged.merge(pending)
+            threshold = merged.quantile(self.quantile) if merged.count >= self.min_count else None
+            save_server_sketch(server_id, sketch.version, merged.to_state(), threshold)
+        except Exception:
+            with self._lock:
+                sketch.pending.merge(pending)  # ghi lỗi: giữ lại để lần sau ghi tiếp
+                sketch.flushing = False
+            raise
+        with self._lock:
+            merged.merge(sketch.pending)  # cộng phần mới đến trong lúc ghi
+            sketch.digest = merged
+            sketch.threshold = None
+            sketch.flushing = False
+
+    def flush(self):
+        """Ghi mọi sketch còn phần chưa lưu (gọi khi tắt server)"""
+        with self._lock:
+            items = [(server_id, sketch, self._take_pending(sketch)) for server_id, sketch in self._sketches.items()
+                     if sketch.pending.count and not sketch.flushing]
+        for server_id, sketch, pending in items:
+            try:
+                self._flush(server_id, sketch, pending)
+            except Exception as e:
+                print(f"⚠️ Failed to save error sketch of server {server_id}: {e}")
+
+    def describe(self, server_id, version, default: float) -> dict:
+        sketch = self._get(server_id, version)
+        with self._lock:
+            return {
+                "threshold": self._threshold(sketch, default),
+                "per_server": sketch.digest.count >= self.min_count,
+                "quantile": self.quantile,
+                "floor": default * self.floor,
+                "cap": default * self.cap,
+                "samples": sketch.digest.count,
+                "min_samples": self.min_count,
+            }
+
+server_thresholds = ServerThresholds()
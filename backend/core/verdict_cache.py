@@ -0,0 +1,60 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Cache lỗi tái tạo cho các log real-time lặp lại (health check, static asset...)
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "100000"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "300"))
+
+class VerdictCache:
+    """LRU + TTL: key đặc trưng -> lỗi tái tạo. Gắn với một version model, đổi version thì xóa sạch"""
+
+    def __init__(self, max_size: int = VERDICT_CACHE_SIZE, ttl: float = VERDICT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sync_version(self, version):
+        """Model được load lại (version khác) thì các kết quả cũ không còn đúng"""
+        if version == self.version: return
+        with self._lock:
+            if version != self.version:
+                self._items.clear()
+                self.version = version
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        if self.max_size <= 0: return
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+            "model_version": self.version,
+        }
+
+verdict_cache = VerdictCache()
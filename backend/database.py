@@ -83,6 +83,51 @@ def init_db():
         )
     ''')
     
+    # Checkpoint byte offset của file upload: stats/scan/parse chỉ xử lý phần mới ghi thêm
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_checkpoints(
+            filename TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            state TEXT,
+            updated_at TEXT,
+            PRIMARY KEY(filename, kind)
+        )
+    ''')
+    
+    # Threat của từng đoạn byte [start_offset, end_offset) đã quét: lần quét sau chỉ ghi thêm đoạn mới
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_threat_ranges(
+            filename TEXT NOT NULL,
+            model_version TEXT,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            threats TEXT NOT NULL,
+            PRIMARY KEY(filename, start_offset)
+        )
+    ''')
+    
+    # Các IP khác nhau của file upload (đếm unique_ips cho /stats mà không lưu cả tập IP trong checkpoint)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_ips(
+            filename TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            PRIMARY KEY(filename, ip)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Sketch phân vị lỗi tái tạo của từng server (ngưỡng riêng theo phân vị), gắn với version model
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS server_error_sketches(
+            server_id TEXT PRIMARY KEY,
+            model_version TEXT,
+            sketch TEXT NOT NULL,
+            threshold REAL,
+            updated_at TEXT
+        )
+    ''')
+    
     # Add missing columns to existing tables (if they don't exist)
     try:
         cursor.execute("ALTER TABLE scan_history ADD COLUMN owner_id TEXT")
@@ -104,6 +149,12 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # Column already exists
     
+    # Các trường có cấu trúc (ip, method, path...) mà model đã chấm điểm, dạng JSON: dùng để train lại
+    try:
+        cursor.execute("ALTER TABLE logs ADD COLUMN features TEXT")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    
     conn.commit()
     conn.close()
     
@@ -226,6 +277,9 @@ def clear_all_data():
     try:
         cursor.execute("DELETE FROM scan_threats")
         cursor.execute("DELETE FROM scan_history")
+        cursor.execute("DELETE FROM file_checkpoints")
+        cursor.execute("DELETE FROM scan_threat_ranges")
+        cursor.execute("DELETE FROM file_ips")
         cursor.execute("DELETE FROM logs")
         cursor.execute("DELETE FROM servers")
         cursor.execute("DELETE FROM users")
@@ -346,6 +400,7 @@ def delete_server(server_id):
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM logs WHERE server_id = ?", (server_id,))
+        cursor.execute("DELETE FROM server_error_sketches WHERE server_id = ?", (server_id,))
         cursor.execute("DELETE FROM servers WHERE id = ?", (server_id,))
         conn.commit()
         return True
@@ -358,17 +413,17 @@ def delete_server(server_id):
 
 # ==================== LOG FUNCTIONS ====================
 
-def create_log(server_id, status, contents):
-    """Create a new log entry"""
+def create_log(server_id, status, contents, features=None):
+    """Create a new log entry (features: structured fields that were scored by the model)"""
     conn = get_db_connection()
     cursor = conn.cursor()
     log_id = generate_uuid()
     
     try:
         cursor.execute('''
-            INSERT INTO logs (id, server_id, status, contents)
-            VALUES (?, ?, ?, ?)
-        ''', (log_id, server_id, status, contents))
+            INSERT INTO logs (id, server_id, status, contents, features)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (log_id, server_id, status, contents, json.dumps(features) if features is not None else None))
         conn.commit()
         return log_id
     finally:
@@ -383,6 +438,18 @@ def get_server_logs(server_id):
     finally:
         conn.close()
 
+def iter_recent_log_features(status, limit):
+    """Các trường đã chấm điểm (dict) của tối đa `limit` log gần nhất có trạng thái `status` (mới nhất trước),
+    đọc dần theo cursor; bỏ qua log cũ chưa có cột features"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('SELECT features FROM logs WHERE status = ? AND features IS NOT NULL ORDER BY rowid DESC LIMIT ?',
+                              (status, limit))
+        for row in cursor:
+            yield json.loads(row['features'])
+    finally:
+        conn.close()
+
 def get_log_by_id(log_id):
     """Get log by ID"""
     conn = get_db_connection()
@@ -404,4 +471,122 @@ def delete_log(log_id):
         print(f"Error deleting log: {e}")
         return False
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+# ==================== CHECKPOINT FUNCTIONS ====================
+
+def get_file_checkpoint(filename, kind):
+    """Get byte-offset checkpoint of an uploaded file for one kind of processing"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM file_checkpoints WHERE filename = ? AND kind = ?', (filename, kind)).fetchone()
+        if not row:
+            return None
+        checkpoint = dict(row)
+        checkpoint['state'] = json.loads(checkpoint['state']) if checkpoint['state'] else None
+        return checkpoint
+    finally:
+        conn.close()
+
+def save_file_checkpoint(filename, kind, byte_offset, fingerprint, state=None):
+    """Create or replace a file checkpoint"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        cursor.execute('''
+            INSERT OR REPLACE INTO file_checkpoints (filename, kind, byte_offset, fingerprint, state, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (filename, kind, byte_offset, fingerprint, json.dumps(state) if state is not None else None, updated_at))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_scan_threats(filename, model_version, end_offset):
+    """Get threats of all scanned ranges of a file up to end_offset, in file order"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT threats FROM scan_threat_ranges
+            WHERE filename = ? AND model_version = ? AND end_offset <= ?
+            ORDER BY start_offset
+        ''', (filename, model_version, end_offset)).fetchall()
+        threats = []
+        for row in rows:
+            threats.extend(json.loads(row['threats']))
+        return threats
+    finally:
+        conn.close()
+
+def save_scan_threats(filename, model_version, start_offset, end_offset, threats):
+    """Store threats of a newly scanned range, dropping stale ranges at or after start_offset"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM scan_threat_ranges WHERE filename = ? AND start_offset >= ?', (filename, start_offset))
+        if end_offset > start_offset:
+            cursor.execute('''
+                INSERT INTO scan_threat_ranges (filename, model_version, start_offset, end_offset, threats)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (filename, model_version, start_offset, end_offset, json.dumps(threats)))
+        conn.commit()
+    finally:
+        conn.close()
+
+def add_file_ips(filename, ips):
+    """Add distinct IPs seen in an uploaded file (already stored IPs are ignored)"""
+    conn = get_db_connection()
+    try:
+        conn.executemany('INSERT OR IGNORE INTO file_ips (filename, ip) VALUES (?, ?)', ((filename, ip) for ip in ips))
+        conn.commit()
+    finally:
+        conn.close()
+
+def count_file_ips(filename, extra_ips=()):
+    """Count distinct IPs of a file, including extra_ips that are not stored yet"""
+    conn = get_db_connection()
+    try:
+        count = conn.execute('SELECT COUNT(*) FROM file_ips WHERE filename = ?', (filename,)).fetchone()[0]
+        for ip in extra_ips:
+            if not conn.execute('SELECT 1 FROM file_ips WHERE filename = ? AND ip = ?', (filename, ip)).fetchone():
+                count += 1
+        return count
+    finally:
+        conn.close()
+
+def clear_file_ips(filename):
+    """Delete stored IPs of a file (file replaced, counting starts over)"""
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM file_ips WHERE filename = ?', (filename,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_server_sketch(server_id):
+    """Get the reconstruction-error quantile sketch of a server"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM server_error_sketches WHERE server_id = ?', (server_id,)).fetchone()
+        if not row:
+            return None
+        sketch = dict(row)
+        sketch['sketch'] = json.loads(sketch['sketch'])
+        return sketch
+    finally:
+        conn.close()
+
+def save_server_sketch(server_id, model_version, sketch, threshold=None):
+    """Create or replace the quantile sketch of a server"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        cursor.execute('''
+            INSERT OR REPLACE INTO server_error_sketches (server_id, model_version, sketch, threshold, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (server_id, model_version, json.dumps(sketch), threshold, updated_at))
+        conn.commit()
+    finally:
+        conn.close()
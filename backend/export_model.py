@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Xuất autoencoder (.keras) sang file .npz cho backend NumPy và kiểm tra kết quả khớp với Keras
+Usage: python export_model.py [models_dir]
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.numpy_model import NumpyAutoencoder, export_numpy_model, check_parity, KERAS_MODEL_FILE, NUMPY_MODEL_FILE
+
+# Sai khác tối đa cho phép giữa hai backend (float32)
+PARITY_TOLERANCE = 1e-5
+
+def verify_parity(model_dir, keras_model=None):
+    """So sánh output của bản NumPy với model.predict của Keras.
+    Trả về True/False, hoặc None nếu không kiểm tra được (không có TensorFlow)"""
+    if keras_model is None:
+        try:
+            from tensorflow.keras.models import load_model # type: ignore
+        except ImportError:
+            print("⚠️ TensorFlow not installed, parity with Keras NOT verified")
+            return None
+        keras_model = load_model(os.path.join(model_dir, KERAS_MODEL_FILE))
+
+    numpy_model = NumpyAutoencoder.load(os.path.join(model_dir, NUMPY_MODEL_FILE))
+    diff = check_parity(keras_model, numpy_model)
+    ok = diff <= PARITY_TOLERANCE
+    print(f"{'✅' if ok else '❌'} Parity with Keras: max abs diff = {diff:.2e} (tolerance {PARITY_TOLERANCE:.0e})")
+    return ok
+
+def export(model_dir, keras_model=None):
+    """Xuất và kiểm tra: True nếu khớp Keras, False nếu lệch (file export bị xóa), None nếu chưa kiểm tra được"""
+    print("=" * 60)
+    print(f"📦 EXPORTING NUMPY MODEL: {model_dir}")
+    print("=" * 60)
+    path = export_numpy_model(model_dir, keras_model)
+    print(f"✅ Exported: {path} ({os.path.getsize(path)} bytes)")
+    ok = verify_parity(model_dir, keras_model)
+    if ok is not False:
+        return ok
+    # Không để API dùng bản export sai lệch
+    os.remove(path)
+    print(f"🗑️ Removed {path}")
+    return False
+
+if __name__ == "__main__":
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    ok = export(model_dir)
+    # Mã thoát 2: đã export nhưng chưa kiểm tra parity (không báo thành công)
+    sys.exit(0 if ok else 2 if ok is None else 1)
@@ -3,16 +3,26 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import analyze, history, stats, upload, auth, servers
 from database import init_db
+from core.model_registry import model_registry
+from core.scan_executor import scan_executor
+from core.retrain_scheduler import retrain_scheduler
+from core.server_thresholds import server_thresholds
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Server is starting up...")
     init_db() 
+    print("⏳ Loading AI Model...")
+    model_registry.get()
+    retrain_scheduler.start()
     
     yield # Server sẽ chạy và nhận request tại điểm này
     
     # Phần này chạy khi Server TẮT (Shutdown)
     print("🛑 Server is shutting down...")
+    retrain_scheduler.stop()
+    scan_executor.shutdown()
+    server_thresholds.flush()
 
 # Khởi tạo App với tham số lifespan
 app = FastAPI(title="Log Analyzer API", lifespan=lifespan)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Train tiếp (warm-start) autoencoder đang dùng trên mẫu các log 'safe' gần đây trong database
+(các trường ip/method/path... mà API đã chấm điểm, lưu ở cột logs.features),
+ghi ra một bản model mới trong models/versions/<tên> rồi chuyển API sang bản đó (không cần restart)
+Usage: python retrain_model.py [models_dir]
+"""
+
+import os
+import sys
+import shutil
+import random
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import iter_recent_log_features
+from core.ml_engine import LogAnomalyDetector, FEATURE_COLUMNS, row_mse
+from core.model_registry import MODEL_DIR, VERSIONS_DIR, active_model_dir, publish_model_dir
+from core.prefilter import FeatureProfile
+from train_model import save_artifacts, CATEGORICAL_COLUMNS, BATCH_SIZE, _text_values
+
+# Lấy mẫu ngẫu nhiên RETRAIN_SAMPLE_ROWS dòng trong RETRAIN_WINDOW_ROWS log 'safe' gần nhất
+RETRAIN_WINDOW_ROWS = int(os.getenv("RETRAIN_WINDOW_ROWS", "500000"))
+RETRAIN_SAMPLE_ROWS = int(os.getenv("RETRAIN_SAMPLE_ROWS", "50000"))
+# Bỏ qua lần train lại nếu có ít log hơn ngưỡng này
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "1000"))
+RETRAIN_EPOCHS = int(os.getenv("RETRAIN_EPOCHS", "5"))
+# Số bản model cũ giữ lại trong models/versions
+RETRAIN_KEEP_VERSIONS = int(os.getenv("RETRAIN_KEEP_VERSIONS", "5"))
+
+def reservoir_sample(items, k: int, rng: random.Random) -> list:
+    """Mẫu ngẫu nhiên đều k phần tử từ một luồng dài không biết trước (Algorithm R), bộ nhớ O(k)"""
+    sample = []
+    for i, item in enumerate(items):
+        if i < k:
+            sample.append(item)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                sample[j] = item
+    return sample
+
+def extend_label_encoders(label_encoders: dict, df) -> int:
+    """Thêm các giá trị mới gặp vào cuối classes_ (giữ nguyên mã của các giá trị cũ để model train tiếp được).
+    classes_ không còn được sắp xếp: API tra bằng bảng Index nên không ảnh hưởng, nhưng không dùng LabelEncoder.transform."""
+    added = 0
+    for col in CATEGORICAL_COLUMNS:
+        encoder = label_encoders[col]
+        known = set(encoder.classes_.astype(str))
+        new = sorted(_text_values(df, col) - known)
+        if new:
+            encoder.classes_ = np.concatenate([encoder.classes_.astype(object), np.array(new, dtype=object)])
+            added += len(new)
+    return added
+
+def _prune_versions(versions_dir: str, keep: str):
+    names = sorted(os.listdir(versions_dir))
+    for name in names[:max(0, len(names) - RETRAIN_KEEP_VERSIONS)]:
+        if name != keep:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+def retrain(model_dir=MODEL_DIR, seed=None):
+    """Trả về tên bản model mới, hoặc None nếu bỏ qua / lỗi"""
+    print("=" * 60)
+    print(f"🔁 RETRAINING FROM SAFE LOGS: {model_dir}")
+    print("=" * 60)
+
+    # 1. Mẫu log 'safe' gần đây
+    rng = random.Random(seed)
+    rows = reservoir_sample(iter_recent_log_features('safe', RETRAIN_WINDOW_ROWS), RETRAIN_SAMPLE_ROWS, rng)
+    df = pd.DataFrame(rows)
+    if len(df) < RETRAIN_MIN_ROWS:
+        print(f"⚠️ Only {len(df)} safe logs with stored features (< {RETRAIN_MIN_ROWS}), skipped")
+        return None
+    print(f"✅ Sampled {len(df)} safe logs")
+
+    # 2. Bộ model đang dùng: encoder mở rộng từ vựng, scaler mở rộng min/max
+    source_dir = active_model_dir(model_dir)
+    detector = LogAnomalyDetector(source_dir, backend="keras")
+    detector.load_resources()
+    if detector.model is None or detector.scaler is None or not (detector.label_encoders or detector.hash_encoder):
+        print(f"❌ {source_dir} has no Keras model/scaler/encoders, run train_model.py first")
+        return None
+    # Hashing trick: giá trị mới đã có mã, không cần mở rộng từ vựng
+    added = 0
+    if detector.hash_encoder is None:
+        # Từ vựng path của model là các template, không phải path gốc
+        vocab_df = df if detector.path_templates is None else df.assign(path=detector.path_templates.normalize(df['path']))
+        added = extend_label_encoders(detector.label_encoders, vocab_df)
+        detector._build_lookups()
+    raw = np.column_stack([np.broadcast_to(detector._feature_values(df, name), len(df)) for name in FEATURE_COLUMNS])
+    detector.scaler.partial_fit(raw.astype(np.float32))
+    print(f"✅ Vocabulary +{added} values, scaler range extended")
+
+    # 3. Train tiếp từ trọng số hiện tại
+    model = detector.model
+    X, _ = detector.preprocess_features(df)
+    print(f"🚀 Warm-start training ({RETRAIN_EPOCHS} epochs on {len(X)} rows)...")
+    model.fit(X, X, epochs=RETRAIN_EPOCHS, batch_size=BATCH_SIZE, shuffle=True, verbose=0)
+
+    # 4. Threshold + prefilter trên chính mẫu
+    mse = row_mse(X, model.predict(X, verbose=0))
+    threshold = float(np.mean(mse) + 4 * np.std(mse))
+    print(f"🎯 Ngưỡng phát hiện (Threshold): {detector.threshold:.6f} -> {threshold:.6f}")
+
+    # 5. Ghi bản mới rồi chuyển CURRENT sang (API nạp ở lần kiểm tra model kế tiếp)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    versions_dir = os.path.join(model_dir, VERSIONS_DIR)
+    output_dir = os.path.join(versions_dir, name)
+    os.makedirs(output_dir, exist_ok=True)
+    save_artifacts(model, detector.scaler, detector.hash_encoder or detector.label_encoders, threshold,
+                   FeatureProfile.fit(X, mse, threshold), output_dir, path_templates=detector.path_templates)
+    publish_model_dir(model_dir, name)
+    _prune_versions(versions_dir, name)
+    print(f"✅ Active model: {output_dir}")
+    return name
+
+if __name__ == "__main__":
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else MODEL_DIR
+    sys.exit(0 if retrain(model_dir) else 1)
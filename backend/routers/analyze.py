@@ -1,28 +1,93 @@
 import os
-from fastapi import APIRouter, HTTPException
-from core.parser import parse_log_file
-from core.ml_engine import LogAnomalyDetector
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from core.parser import auto_workers, prefetch, resolve_log_format, parse_version, DEFAULT_LOG_FORMAT
+from core.parse_cache import iter_parsed_chunks
+from core.model_registry import model_registry
+from core.ml_engine import top_threats
+from core.checkpoints import FileCheckpoint
+from database import get_scan_threats, save_scan_threats
+from core.verdict_cache import verdict_cache
+from core.scan_executor import scan_executor, SCAN_CHUNK_ROWS
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
+# Số chunk parse sẵn trong thread nền trong lúc chunk hiện tại đang chạy model
+SCAN_PREFETCH = int(os.getenv("SCAN_PREFETCH", "2"))
 
-ai_engine = LogAnomalyDetector(model_dir="models")
-print("⏳ Loading AI Model for Analyzer...")
-try:
-    ai_engine.load_resources()
-except Exception as e:
-    print(f"⚠️ Warning: Could not load AI model: {e}")
+def scan_chunks(file_path: str, start: int = 0, end: int = None, workers: int = None, depth: int = SCAN_PREFETCH,
+                log_format=DEFAULT_LOG_FORMAT):
+    """Pipeline quét: parse chunk N+1 trong thread nền song song với encode/predict chunk N"""
+    if workers is None:
+        workers = auto_workers(file_path)
+    chunks = iter_parsed_chunks(file_path, rows=SCAN_CHUNK_ROWS, workers=workers, start=start, end=end, log_format=log_format)
+    return prefetch(chunks, depth=depth) if depth > 0 else chunks
+
+@router.get("/model/status")
+def model_status():
+    """Version model đang phục vụ và hiệu quả của cache/dedup khi chấm điểm"""
+    ai_engine = model_registry.get()
+    return {
+        "version": ai_engine.version,
+        "loaded": ai_engine.model is not None,
+        "backend": type(ai_engine.model).__name__ if ai_engine.model is not None else None,
+        "dedup": ai_engine.dedup_stats(),
+        "verdict_cache": verdict_cache.stats(),
+    }
 
 @router.post("/scan/{filename}")
-def scan_file(filename: str):
+def scan_file(filename: str, top_k: Optional[int] = Query(None, ge=1), min_error: Optional[float] = Query(None, ge=0)):
     file_path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(file_path): 
         raise HTTPException(status_code=404, detail="File not found")
-    df = parse_log_file(file_path)
-    if df.empty: 
-        return {"threat_count": 0, "threats": []}
     try:
-        threats = ai_engine.detect_anomalies(df)
+        # Model đã load sẵn, dùng cùng một bản cho cả lần quét
+        ai_engine = model_registry.get()
+        if top_k is not None or min_error is not None:
+            return _scan_filtered(ai_engine, file_path, top_k, min_error)
+        # Suy luận theo từng chunk, chỉ giữ lại các threat.
+        # Checkpoint gắn với version model và version parser + định dạng log: đổi một trong hai thì quét lại từ đầu
+        log_format = resolve_log_format(file_path)
+        checkpoint = FileCheckpoint(filename, "scan", file_path, version=f"{ai_engine.version}-{parse_version(log_format)}")
+        state = checkpoint.load()
+        if state and "threats" in state:
+            # Checkpoint cũ lưu cả danh sách threat trong state: chuyển sang bảng theo đoạn byte
+            save_scan_threats(filename, checkpoint.version, 0, checkpoint.offset, state["threats"])
+        threats = get_scan_threats(filename, checkpoint.version, checkpoint.offset) if checkpoint.offset else []
+        if scan_executor.use_for(file_path, checkpoint.offset, checkpoint.end):
+            # File lớn: chia shard cho các worker process, mỗi worker giữ model riêng
+            new_threats = scan_executor.scan(file_path, ai_engine.version, start=checkpoint.offset, end=checkpoint.end)
+        else:
+            new_threats = []
+            for chunk in scan_chunks(file_path, start=checkpoint.offset, end=checkpoint.end, log_format=log_format):
+                new_threats.extend(ai_engine.detect_anomalies(chunk))
+        if checkpoint.resumable:
+            # Chỉ ghi threat của đoạn [offset, end) vừa quét, không ghi lại cả danh sách
+            save_scan_threats(filename, checkpoint.version, checkpoint.offset, checkpoint.end, new_threats)
+            checkpoint.save({})
+        threats.extend(new_threats)
+        if checkpoint.end is not None:
+            for chunk in scan_chunks(file_path, start=checkpoint.end, workers=1, log_format=log_format):
+                threats.extend(ai_engine.detect_anomalies(chunk))
         return {"threat_count": len(threats), "threats": threats}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI Engine Error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"AI Engine Error: {e}")
+
+def _scan_filtered(ai_engine, file_path: str, top_k: Optional[int], min_error: Optional[float]) -> dict:
+    """Chỉ lấy các anomaly nặng nhất: mỗi chunk chọn top_k rồi gộp dần (theo lỗi tái tạo gốc, chưa làm tròn),
+    không dựng threat cho các dòng còn lại. threat_count là tổng số anomaly khớp điều kiện, không bị cắt theo top_k.
+    Kết quả đã lọc nên không lưu checkpoint."""
+    total, errors, threats = 0, [], []
+    if scan_executor.use_for(file_path):
+        batches = scan_executor.iter_shard_threats(file_path, ai_engine.version, top_k=top_k, min_error=min_error)
+    else:
+        batches = (ai_engine.find_anomalies(chunk, top_k=top_k, min_error=min_error) for chunk in scan_chunks(file_path))
+    for count, batch_errors, batch in batches:
+        total += count
+        errors.extend(batch_errors)
+        threats.extend(batch)
+        if top_k is not None and len(threats) > top_k:
+            errors, threats = top_threats(errors, threats, top_k)
+    if top_k is not None:
+        errors, threats = top_threats(errors, threats, top_k)
+    return {"threat_count": total, "returned_count": len(threats), "threats": threats}
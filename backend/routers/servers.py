@@ -9,10 +9,10 @@ from database import (
     get_server_logs,
     create_log
 )
-from core.ml_engine import LogAnomalyDetector
+from core.batcher import analyze_batcher
+from core.model_registry import model_registry
+from core.server_thresholds import server_thresholds
 from core.mail_service import mail_service
-import pandas as pd
-import os
 
 router = APIRouter()
 
@@ -100,6 +100,11 @@ def get_server_logs_endpoint(server_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch logs: {str(e)}")
 
+def _server_threshold(server_id: str):
+    detector = model_registry.get()
+    default = detector.threshold if detector.threshold is not None else 0.05
+    return server_thresholds.describe(server_id, detector.version, default)
+
 @router.get("/servers/{server_id}/stats")
 def get_server_stats_endpoint(server_id: str):
     """Get statistics for server logs, focusing on warnings"""
@@ -134,6 +139,7 @@ def get_server_stats_endpoint(server_id: str):
             "warning_percentage": round(warning_percentage, 2),
             "safe_percentage": round(safe_percentage, 2),
             "status_distribution": status_counts,
+            "threshold": _server_threshold(server_id),
             "warning_logs": warning_logs[:10]  # Latest 10 warnings
         }
     except HTTPException:
@@ -149,11 +155,6 @@ def analyze_log_endpoint(server_id: str, request: LogAnalyzeRequest):
         if not server:
             raise HTTPException(status_code=404, detail="Server not found")
         
-        # Initialize ML engine
-        model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
-        detector = LogAnomalyDetector(model_dir)
-        detector.load_resources()
-        
         # Prepare log data for analysis
         log_data = {
             'ip': request.ip or 'unknown',
@@ -166,17 +167,14 @@ def analyze_log_endpoint(server_id: str, request: LogAnalyzeRequest):
             'datetime': request.datetime or '',
         }
         
-        # Create DataFrame for analysis
-        df = pd.DataFrame([log_data])
-        
-        # Detect anomalies
-        anomalies = detector.detect_anomalies(df)
+        # Detect anomalies: gộp batch với các request đồng thời, model đã load sẵn, ngưỡng riêng của server
+        anomalies = analyze_batcher.submit(log_data, server_id)
         
         # Determine status: warning if anomaly detected, safe otherwise
         status = 'warning' if anomalies else 'safe'
         
-        # Save log to database
-        log_id = create_log(server_id, status, request.log_content)
+        # Save log to database (kèm các trường đã chấm điểm để train lại model)
+        log_id = create_log(server_id, status, request.log_content, log_data)
         
         # Send email alert if warning detected
         if status == 'warning':
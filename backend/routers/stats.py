@@ -1,63 +1,65 @@
 import os
-import pandas as pd
 from fastapi import APIRouter, HTTPException
-from core.parser import parse_log_file
+from core.parser import auto_workers, resolve_log_format, parse_version
+from core.parse_cache import iter_parsed_chunks
+from core.log_stats import LogStatsAccumulator
+from core.checkpoints import FileCheckpoint
+from database import add_file_ips, count_file_ips, clear_file_ips
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
+LOGS_PAGE_ROWS = 10000
 
 @router.get("/stats/{filename}")
 def get_stats(filename: str):
     file_path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(file_path): 
         raise HTTPException(status_code=404, detail="File not found")
-    df = parse_log_file(file_path) 
-    if df.empty: 
-        return {"error": "No data parsed"}
-    
-    # Tính Metrics cơ bản
-    total_req = len(df)
-    unique_ips = int(df['ip'].nunique()) if 'ip' in df.columns else 0
-    avg_size = round(float(df['size'].mean()) / 1024, 2) if 'size' in df.columns else 0
-    
-    error_5xx = df[df['status'] >= 500].shape[0] if 'status' in df.columns else 0
-    error_rate = round((error_5xx / total_req) * 100, 2) if total_req > 0 else 0
-    
-    # Thống kê Status Code
-    status_counts = {}
-    if 'status' in df.columns:
-        s_counts = df['status'].value_counts().head(5)
-        status_counts = {str(k): int(v) for k, v in s_counts.items()}
-
-    # Biểu đồ Traffic theo giờ
-    chart_data = {}
-    if 'datetime' in df.columns:
-        df_time = df.dropna(subset=['datetime'])
-        if not df_time.empty:
-            traffic = df_time.resample('H', on='datetime').size()
-            ts_list = traffic.index.tolist()
-            cnt_list = traffic.values.tolist()
-            for ts, count in zip(ts_list, cnt_list):
-                if count > 0:
-                    time_str = ts.strftime('%Y-%m-%d %H:%M')
-                    chart_data[time_str] = int(count)
 
-    return {
-        "total_requests": total_req,
-        "unique_ips": unique_ips,
-        "avg_body_size": avg_size,
-        "error_rate": error_rate,
-        "status_distribution": status_counts,
-        "traffic_chart": chart_data
-    }
+    # Tính Metrics theo từng chunk, bộ nhớ không tăng theo kích thước file.
+    # File chỉ được ghi thêm: cộng dồn tiếp từ checkpoint, chỉ parse phần mới.
+    # Checkpoint gắn với version parser + định dạng log: đổi cách parse thì đếm lại từ đầu
+    try:
+        log_format = resolve_log_format(file_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Parser Error: {e}")
+    checkpoint = FileCheckpoint(filename, "stats", file_path, version=parse_version(log_format))
+    stats = LogStatsAccumulator.from_state(checkpoint.load())
+    try:
+        if checkpoint.resumable and checkpoint.offset == 0:
+            # Đếm lại từ đầu file: bỏ các IP đã lưu của bản cũ cùng tên
+            clear_file_ips(filename)
+        for chunk in iter_parsed_chunks(file_path, workers=auto_workers(file_path), start=checkpoint.offset, end=checkpoint.end,
+                                        log_format=log_format):
+            stats.update(chunk)
+        if checkpoint.resumable:
+            # Chỉ ghi thêm các IP của phần mới, trước khi lưu checkpoint
+            add_file_ips(filename, stats.ips)
+            stats.ips.clear()
+        checkpoint.save(stats.to_state())
+        # Dòng cuối đang ghi dở (chưa có xuống dòng) được tính vào kết quả nhưng không vào checkpoint
+        if checkpoint.end is not None:
+            for chunk in iter_parsed_chunks(file_path, start=checkpoint.end, log_format=log_format):
+                stats.update(chunk)
+        unique_ips = count_file_ips(filename, stats.ips) if checkpoint.resumable else None
+    except Exception as e:
+        # Parse lỗi giữa chừng: không lưu checkpoint, không trả về số liệu thiếu
+        raise HTTPException(status_code=500, detail=f"Parser Error: {e}")
+    if stats.total_requests == 0: 
+        return {"error": "No data parsed"}
+    return stats.result(unique_ips)
 
 @router.get("/logs/{filename}")
 def get_logs(filename: str):
     file_path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(file_path): 
         raise HTTPException(status_code=404, detail="File not found")    
-    df = parse_log_file(file_path)
-    if df.empty: return []
+    # Chỉ cần chunk đầu tiên
+    try:
+        df = next(iter_parsed_chunks(file_path, rows=LOGS_PAGE_ROWS), None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Parser Error: {e}")
+    if df is None or df.empty: return []
     if 'datetime' in df.columns:
         df['datetime'] = df['datetime'].astype(str)
-    return df.head(10000).to_dict(orient="records")
\ No newline at end of file
+    return df.head(LOGS_PAGE_ROWS).to_dict(orient="records")
@@ -1,6 +1,7 @@
 import os
 import shutil
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from core.parser import detect_compression, resolve_log_format
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
@@ -11,10 +12,23 @@ async def upload_file(file: UploadFile = File(...)):
     if file.filename is None:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
+    # File nén (.gz/.bz2/.zst) được lưu nguyên dạng nén, parser tự giải nén theo luồng khi đọc
     file_location = os.path.join(UPLOAD_DIR, file.filename)
     try:
         with open(file_location, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        return {"status": "success", "filename": file.filename}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
+
+    # Lỗi nhận diện (file nén hỏng, thiếu zstandard...) là lỗi của file tải lên, không phải lỗi server
+    try:
+        compression = detect_compression(file_location)
+        log_format = resolve_log_format(file_location)[0]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not detect log format: {e}")
+    return {
+        "status": "success",
+        "filename": file.filename,
+        "compression": compression,
+        "log_format": log_format,
+    }
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# Chạy pytest từ thư mục backend/: import được database, core, routers... như các script khác
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Database SQLite riêng cho mỗi test, thư mục làm việc là tmp_path (uploads/, parse_cache/...)"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "weblog_analyzer.db"))
+    database.init_db()
+    return tmp_path
@@ -0,0 +1,39 @@
+import pytest
+
+from core import batcher
+from core.verdict_cache import verdict_cache
+
+ROW = {'ip': '10.0.0.1', 'method': 'GET', 'path': '/', 'status': 200, 'size': 512,
+       'referrer': '-', 'user_agent': 'Mozilla/5.0', 'datetime': '2024-01-07 14:30:00'}
+
+class _BrokenDetector:
+    """Model lỗi khi predict: chỉ các verdict đã có trong cache được dùng"""
+    model = object()
+    version = "test-broken-inference"
+    threshold = 0.5
+
+    def reconstruction_errors(self, df):
+        raise RuntimeError("inference failed")
+
+    def make_threats(self, df, mse, indices):
+        return [{"ip": df.iloc[i]['ip'], "reconstruction_error": float(mse[i])} for i in indices]
+
+@pytest.fixture
+def broken_detector(monkeypatch):
+    detector = _BrokenDetector()
+    monkeypatch.setattr(batcher.model_registry, "get", lambda: detector)
+    verdict_cache.sync_version(detector.version)
+    yield detector
+    verdict_cache.sync_version(None)
+
+def test_inference_error_keeps_cached_verdicts(broken_detector):
+    cached_threat = dict(ROW, ip='10.0.0.2')
+    cached_safe = dict(ROW, ip='10.0.0.3')
+    verdict_cache.put(batcher.verdict_key(cached_threat), 0.9)
+    verdict_cache.put(batcher.verdict_key(cached_safe), 0.1)
+
+    results = batcher.score_rows([ROW, cached_threat, cached_safe])
+    assert results[0] == []  # chưa có verdict, predict lỗi -> bỏ qua
+    assert [t["reconstruction_error"] for t in results[1]] == [0.9]
+    assert results[2] == []
+    assert verdict_cache.get(batcher.verdict_key(ROW)) is None  # không cache kết quả lỗi
@@ -0,0 +1,88 @@
+import os
+import pytest
+
+import database
+from core import parser
+from routers import analyze, stats
+
+LINE = '10.0.0.{ip} - - [07/Jan/2024:14:30:00 +0700] "GET /items/{i} HTTP/1.1" {status} 512 "-" "Mozilla/5.0"\n'
+
+def _append(filename, start, count, ips=250, status=200):
+    with open(os.path.join(stats.UPLOAD_DIR, filename), 'a') as f:
+        for i in range(start, start + count):
+            f.write(LINE.format(ip=i % ips, i=i, status=status))
+
+class _FakeEngine:
+    """Coi mọi dòng status 500 là threat, đếm số dòng đã chấm"""
+    version = "v1"
+
+    def __init__(self):
+        self.scored = 0
+
+    def detect_anomalies(self, df):
+        self.scored += len(df)
+        return [{"path": path, "reconstruction_error": 1.0} for path in df.loc[df['status'] >= 500, 'path']]
+
+@pytest.fixture
+def uploads(tmp_db):
+    os.makedirs(stats.UPLOAD_DIR)
+    return tmp_db
+
+def test_stats_counts_unique_ips_across_appends(uploads):
+    _append("access.log", 0, 100, ips=40)
+    assert stats.get_stats("access.log")["unique_ips"] == 40
+
+    _append("access.log", 100, 100, ips=60)  # 20 IP mới
+    result = stats.get_stats("access.log")
+    assert result["total_requests"] == 200
+    assert result["unique_ips"] == 60
+    assert "ips" not in database.get_file_checkpoint("access.log", "stats")["state"]
+
+def test_stats_counts_ips_of_partial_last_line(uploads):
+    _append("access.log", 0, 10, ips=10)
+    with open(os.path.join(stats.UPLOAD_DIR, "access.log"), 'a') as f:
+        f.write(LINE.format(ip=99, i=0, status=200).rstrip('\n'))
+    assert stats.get_stats("access.log")["unique_ips"] == 11
+    assert database.count_file_ips("access.log") == 10  # dòng ghi dở không được lưu
+
+def test_scan_appends_only_new_range(uploads, monkeypatch):
+    engine = _FakeEngine()
+    monkeypatch.setattr(analyze.model_registry, "get", lambda: engine)
+    _append("access.log", 0, 50, status=500)
+    _append("access.log", 50, 50)
+    assert analyze.scan_file("access.log", top_k=None, min_error=None)["threat_count"] == 50
+
+    _append("access.log", 100, 10, status=500)
+    result = analyze.scan_file("access.log", top_k=None, min_error=None)
+    assert engine.scored == 110  # lần quét thứ hai chỉ chấm 10 dòng mới
+    assert result["threat_count"] == 60
+    assert [t["path"] for t in result["threats"]][-10:] == [f"/items/{i}" for i in range(100, 110)]
+
+    conn = database.get_db_connection()
+    ranges = conn.execute('SELECT start_offset, end_offset FROM scan_threat_ranges ORDER BY start_offset').fetchall()
+    conn.close()
+    assert len(ranges) == 2 and ranges[0]['end_offset'] == ranges[1]['start_offset']
+    assert database.get_file_checkpoint("access.log", "scan")["state"] == {}
+
+def test_checkpoints_are_keyed_by_parser_version(uploads, monkeypatch):
+    engine = _FakeEngine()
+    monkeypatch.setattr(analyze.model_registry, "get", lambda: engine)
+    starts = []
+    parsed_chunks = stats.iter_parsed_chunks
+    monkeypatch.setattr(stats, "iter_parsed_chunks", lambda *args, **kwargs: (
+        starts.append(kwargs.get("start", 0)), parsed_chunks(*args, **kwargs))[1])
+
+    _append("access.log", 0, 50, ips=50, status=500)
+    stats.get_stats("access.log")
+    analyze.scan_file("access.log", top_k=None, min_error=None)
+    _append("access.log", 50, 10, ips=60)
+    stats.get_stats("access.log")
+    assert starts[-2] > 0  # cùng version: chỉ parse phần mới
+
+    # Đổi cách parse: checkpoint cũ không còn hợp lệ, stats và scan tính lại từ đầu
+    monkeypatch.setattr(parser, "PARSER_VERSION", parser.PARSER_VERSION + 1)
+    result = stats.get_stats("access.log")
+    assert starts[-2] == 0
+    assert result["total_requests"] == 60 and result["unique_ips"] == 60
+    assert analyze.scan_file("access.log", top_k=None, min_error=None)["threat_count"] == 50
+    assert engine.scored == 50 + 60
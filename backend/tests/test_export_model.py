@@ -0,0 +1,67 @@
+import sys
+import json
+import zipfile
+import numpy as np
+import pytest
+
+import export_model
+from core.numpy_model import NumpyAutoencoder, KERAS_MODEL_FILE, NUMPY_MODEL_FILE, export_numpy_model
+
+# Trọng số cố định, kết quả tính tay: relu -> tanh -> sigmoid
+GOLDEN_LAYERS = [
+    ([[1.0, -1.0], [0.5, 2.0]], [0.0, -1.0], 'relu'),
+    ([[1.0], [-1.0]], [0.5], 'tanh'),
+    ([[2.0]], [0.0], 'sigmoid'),
+]
+GOLDEN_INPUT = [[1.0, 2.0], [0.0, 0.0], [-1.0, 3.0]]
+GOLDEN_OUTPUT = [[0.7159040902975481], [0.7159040902975481], [0.1192219892805756]]  # sigmoid(2 * tanh(.))
+
+def test_export_matches_keras_predict(tmp_path):
+    tf = pytest.importorskip("tensorflow")
+    keras = tf.keras
+    model = keras.Sequential([
+        keras.Input(shape=(8,)),
+        keras.layers.Dense(6, activation='relu'),
+        keras.layers.Dense(3, activation='tanh'),
+        keras.layers.Dense(6, activation='relu'),
+        keras.layers.Dense(8, activation='sigmoid'),
+    ])
+    model.compile(optimizer='adam', loss='mse')
+    model.save(tmp_path / KERAS_MODEL_FILE)
+
+    # Load lại từ file .keras như train_model/retrain: kiểm tra đúng bản trên đĩa
+    assert export_model.export(str(tmp_path)) is True
+    numpy_model = NumpyAutoencoder.load(str(tmp_path / NUMPY_MODEL_FILE))
+    x = np.random.default_rng(0).random((256, 8), dtype=np.float32)
+    expected = keras.models.load_model(tmp_path / KERAS_MODEL_FILE).predict(x, verbose=0)
+    assert np.allclose(numpy_model.predict(x), expected, atol=export_model.PARITY_TOLERANCE)
+
+def test_parity_without_tensorflow_is_not_success(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "tensorflow", None)  # import tensorflow -> ImportError
+    assert export_model.verify_parity(str(tmp_path)) is None
+
+def test_numpy_forward_pass_matches_golden_output(tmp_path):
+    path = str(tmp_path / NUMPY_MODEL_FILE)
+    NumpyAutoencoder(GOLDEN_LAYERS, "digest").save(path)
+    model = NumpyAutoencoder.load(path)
+    assert model.source_digest == "digest"
+    assert np.allclose(model.predict(GOLDEN_INPUT), GOLDEN_OUTPUT, atol=1e-6)
+
+def test_export_reads_keras_file_without_tensorflow(tmp_path, monkeypatch):
+    h5py = pytest.importorskip("h5py")
+    monkeypatch.setitem(sys.modules, "tensorflow", None)
+    # File .keras tối thiểu theo định dạng Keras 3: config.json + model.weights.h5
+    layers = [{"class_name": "InputLayer", "config": {"name": "input"}}]
+    weights_path = tmp_path / "model.weights.h5"
+    with h5py.File(weights_path, 'w') as f:
+        for i, (weights, bias, activation) in enumerate(GOLDEN_LAYERS):
+            name = f"dense_{i}"
+            layers.append({"class_name": "Dense", "config": {"name": name, "activation": activation}})
+            f.create_dataset(f"layers/{name}/vars/0", data=np.array(weights, np.float32))
+            f.create_dataset(f"layers/{name}/vars/1", data=np.array(bias, np.float32))
+    with zipfile.ZipFile(tmp_path / KERAS_MODEL_FILE, 'w') as archive:
+        archive.writestr('config.json', json.dumps({"config": {"layers": layers}}))
+        archive.write(weights_path, 'model.weights.h5')
+
+    model = NumpyAutoencoder.load(export_numpy_model(str(tmp_path)))
+    assert np.allclose(model.predict(GOLDEN_INPUT), GOLDEN_OUTPUT, atol=1e-6)
@@ -0,0 +1,56 @@
+import io
+import os
+import sys
+import asyncio
+import pytest
+import pandas as pd
+from fastapi import HTTPException, UploadFile
+
+from core import parser
+from core.log_formats import detect_log_format, _parse_json, UTC_DTYPE
+from routers import upload
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+# Cùng 3 request trong mọi file mẫu
+PATHS = ['/items/1', '/login', '/search?q=1']
+TIMES = pd.to_datetime(['2024-01-07 07:30:00', '2024-01-07 07:30:05', '2024-01-07 07:31:10'], utc=True)
+
+@pytest.mark.parametrize("filename, expected", [
+    ("combined.log", "combined"),
+    ("common.log", "common"),
+    ("nginx.log", "nginx"),
+    ("access.json", "json"),
+    ("w3c.log", "w3c"),
+    ("access.csv", "csv"),
+])
+def test_detects_and_parses_each_format(filename, expected):
+    path = os.path.join(FIXTURES, filename)
+    assert detect_log_format(path)[0] == expected
+    df = parser.parse_log_file(path, log_format="auto")
+    assert df['ip'].tolist() == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert df['path'].tolist() == PATHS
+    assert df['status'].tolist() == [200, 401, 200]
+    assert (df['datetime'].dt.tz_convert('UTC') == TIMES).all()
+
+def test_unknown_format_name_is_rejected():
+    with pytest.raises(ValueError):
+        detect_log_format(os.path.join(FIXTURES, "combined.log"), "syslog")
+
+def test_json_datetime_dtype_does_not_depend_on_pyarrow(monkeypatch):
+    with open(os.path.join(FIXTURES, "access.json"), 'rb') as f:
+        block = f.read()
+    fast = _parse_json(block)
+    monkeypatch.setitem(sys.modules, "pyarrow.json", None)  # import pyarrow.json -> ImportError
+    fallback = _parse_json(block)
+    assert fast['datetime'].dtype == fallback['datetime'].dtype == UTC_DTYPE
+    assert fast['datetime'].equals(fallback['datetime'])
+
+def test_upload_rejects_undetectable_file(tmp_db):
+    os.makedirs(upload.UPLOAD_DIR)
+    corrupt = UploadFile(io.BytesIO(b'\x1f\x8b' + b'not really gzip'), filename="access.log.gz")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(upload.upload_file(corrupt))
+    assert error.value.status_code == 400
+
+    good = UploadFile(io.BytesIO(open(os.path.join(FIXTURES, "nginx.log"), 'rb').read()), filename="access.log")
+    assert asyncio.run(upload.upload_file(good))["log_format"] == "nginx"
@@ -0,0 +1,33 @@
+import os
+import shutil
+import joblib
+from sklearn.preprocessing import LabelEncoder
+
+from core.model_registry import ModelRegistry, MODEL_DIR, VERSIONS_DIR, publish_model_dir
+
+def _model_set(path, skip=()):
+    """Bộ model đầy đủ từ MODEL_DIR (thêm label_encoders.pkl), bỏ các file trong skip"""
+    os.makedirs(path)
+    for name in ('autoencoder_model.npz', 'autoencoder_model.keras', 'scaler.pkl', 'reconstruction_threshold.pkl'):
+        if name not in skip:
+            shutil.copy(os.path.join(MODEL_DIR, name), path)
+    if 'label_encoders.pkl' not in skip:
+        joblib.dump({'method': LabelEncoder().fit(['GET', 'POST'])}, os.path.join(path, 'label_encoders.pkl'))
+
+def test_reload_keeps_current_model_until_new_set_is_complete(tmp_path):
+    base = str(tmp_path / "models")
+    _model_set(base)
+    registry = ModelRegistry(base, check_interval=0)
+    current = registry.get()
+    assert current.missing_resources() == []
+
+    for skip in ('scaler.pkl', 'label_encoders.pkl', 'reconstruction_threshold.pkl'):
+        name = f"without-{skip.split('.')[0]}"
+        _model_set(os.path.join(base, VERSIONS_DIR, name), skip=(skip,))
+        publish_model_dir(base, name)
+        assert registry.reload() is current
+
+    _model_set(os.path.join(base, VERSIONS_DIR, "complete"))
+    publish_model_dir(base, "complete")
+    detector = registry.reload()
+    assert detector is not current and detector.model_dir.endswith("complete")
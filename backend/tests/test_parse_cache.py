@@ -0,0 +1,106 @@
+import os
+import pytest
+import pandas as pd
+from fastapi import HTTPException
+
+import database
+from core import parser, parse_cache
+from core.checkpoints import complete_size
+from routers import stats
+
+LINE = '10.0.0.{i} - - [07/Jan/2024:14:30:{s:02d} +0700] "GET /api/items/{i} HTTP/1.1" 200 {size} "-" "Mozilla/5.0"\n'
+
+def _write_log(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(LINE.format(i=i % 250, s=i % 60, size=100 + i))
+
+def _cache_files():
+    if not os.path.isdir(parse_cache.CACHE_DIR):
+        return []
+    return os.listdir(parse_cache.CACHE_DIR)
+
+def _no_parse(*args, **kwargs):
+    raise AssertionError("expected the parse cache to be used")
+
+@pytest.fixture
+def failing_parser(monkeypatch):
+    """Parser trả về block đầu tiên rồi lỗi (vd. lỗi đọc đĩa giữa file)"""
+    real = parser._iter_parsed_blocks
+
+    def fail_after_first_block(*args, **kwargs):
+        blocks = real(*args, **kwargs)
+        yield next(blocks)
+        raise OSError("read error in the middle of the file")
+
+    monkeypatch.setattr(parser, "_iter_parsed_blocks", fail_after_first_block)
+
+def test_parse_error_midstream_is_not_cached(tmp_db, failing_parser):
+    path = str(tmp_db / "access.log")
+    _write_log(path, 100)
+
+    seen = []
+    with pytest.raises(OSError):
+        for chunk in parse_cache.iter_parsed_chunks(path, rows=10):
+            seen.append(chunk)
+    assert seen  # đã trả về một phần trước khi lỗi
+    assert _cache_files() == []  # không có entry (hay file tạm) nào cho dữ liệu thiếu
+
+def test_stats_reports_parse_error_without_checkpoint(tmp_db, failing_parser):
+    os.makedirs(stats.UPLOAD_DIR)
+    _write_log(os.path.join(stats.UPLOAD_DIR, "access.log"), 100)
+
+    with pytest.raises(HTTPException) as error:
+        stats.get_stats("access.log")
+    assert error.value.status_code == 500
+    assert database.get_file_checkpoint("access.log", "stats") is None
+    assert _cache_files() == []
+
+def test_complete_parse_is_cached(tmp_db):
+    path = str(tmp_db / "access.log")
+    _write_log(path, 100)
+    first = parse_cache.load_parsed_log(path)
+    assert len(first) == 100
+    assert [name for name in _cache_files() if name.endswith('.parquet')]
+    assert parse_cache.load_parsed_log(path).equals(first)
+
+def test_partial_last_line_still_uses_cache(tmp_db, monkeypatch):
+    path = str(tmp_db / "access.log")
+    _write_log(path, 100)
+    with open(path, 'a') as f:
+        f.write(LINE.format(i=1, s=1, size=1).rstrip('\n'))  # dòng cuối đang ghi dở
+    end = complete_size(path)
+    assert end < os.path.getsize(path)
+
+    first = pd.concat(parse_cache.iter_parsed_chunks(path, end=end), ignore_index=True)
+    assert len(first) == 100
+    monkeypatch.setattr(parse_cache, "iter_log_chunks", _no_parse)
+    assert pd.concat(parse_cache.iter_parsed_chunks(path, end=end), ignore_index=True).equals(first)
+
+def test_digest_covers_only_the_snapshot(tmp_db):
+    path = str(tmp_db / "access.log")
+    _write_log(path, 10)
+    size = os.path.getsize(path)
+    digest = parse_cache.file_digest(path)
+    with open(path, 'a') as f:
+        f.write(LINE.format(i=1, s=1, size=1))  # ghi thêm sau khi chụp kích thước
+    assert parse_cache.file_digest(path, size) == digest
+    assert parse_cache.file_digest(path) != digest
+
+def test_cache_is_keyed_by_log_format(tmp_db):
+    path = str(tmp_db / "access.log")
+    _write_log(path, 100)
+    assert sum(len(chunk) for chunk in parse_cache.iter_parsed_chunks(path, log_format="combined")) == 100
+    # Dòng combined không khớp Common Log Format: không được trả về entry đã cache theo combined
+    assert sum(len(chunk) for chunk in parse_cache.iter_parsed_chunks(path, log_format="common")) == 0
+
+def test_digest_memo_is_bounded(tmp_db, monkeypatch):
+    monkeypatch.setattr(parse_cache, "DIGEST_MEMO_SIZE", 3)
+    monkeypatch.setattr(parse_cache, "_digest_memo", parse_cache.OrderedDict())
+    paths = []
+    for i in range(5):
+        paths.append(str(tmp_db / f"access{i}.log"))
+        _write_log(paths[-1], i + 1)
+        parse_cache.file_digest(paths[-1])
+    assert len(parse_cache._digest_memo) == 3
+    assert [key[0] for key in parse_cache._digest_memo] == paths[2:]
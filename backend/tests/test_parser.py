@@ -0,0 +1,30 @@
+import time
+import threading
+
+from core import parser
+from core.parser import prefetch
+
+def _producer(threads, fail=False):
+    threads.append(threading.current_thread())
+    yield from (1, 2)  # phần tử thứ hai lấp đầy queue (depth=1)
+    if fail:
+        raise OSError("read failed")
+
+def test_prefetch_thread_exits_when_consumer_stops():
+    for fail in (False, True):
+        threads = []
+        items = prefetch(_producer(threads, fail), depth=1)
+        assert next(items) == 1
+        time.sleep(0.3)  # để producer đưa phần tử 2 vào queue trước khi consumer dừng
+        items.close()  # queue còn đầy: put kết thúc/lỗi không được chặn mãi
+        threads[0].join(timeout=2)
+        assert not threads[0].is_alive()
+
+def test_parallel_parse_matches_serial(tmp_path):
+    path = tmp_path / "access.log"
+    with open(path, 'w') as f:
+        for i in range(3000):
+            f.write(f'10.0.0.{i % 250} - - [07/Jan/2024:14:30:00 +0700] "GET /items/{i} HTTP/1.1" 200 {i} "-" "Mozilla/5.0"\n')
+    serial = parser.parse_log_file(str(path), workers=1)
+    parallel = parser.parse_log_file(str(path), workers=2)  # process pool dùng pool_context()
+    assert parallel.equals(serial) and len(serial) == 3000
@@ -0,0 +1,32 @@
+from core.parser import PathTemplates, normalize_path
+
+def _templates():
+    return PathTemplates.learn([f"/shop/item{i}" for i in range(200)] + ["/api/users/1"], max_children=100)
+
+def test_benign_segments_collapse():
+    templates = _templates()
+    assert templates.apply("/shop/new-item_2.html") == "/shop/{var}"
+    assert templates.apply("/shop/red%20shoes") == "/shop/{var}"
+    assert templates.apply("/shop/42?page=2") == "/shop/{var}?{query}"
+    assert templates.apply("/api/users/7") == "/api/users/{num}"
+
+def test_payload_segments_are_kept():
+    templates = _templates()
+    for path in ["/shop/<script>", "/shop/' OR 1=1--", "/shop/..", "/shop/%2e%2e%2fetc%2fpasswd",
+                 "/shop/%252e%252e%252f", "/shop/1;ls"]:
+        assert templates.apply(path) == path
+
+def test_encoded_benign_queries_collapse():
+    assert normalize_path("/search?q=shoes&page=2") == "/search?{query}"
+    assert normalize_path("/search?q=red%20shoes") == "/search?{query}"
+    assert normalize_path("/login?next=/home") == "/login?{query}"
+    assert normalize_path("/search?") == "/search"
+
+def test_encoded_attack_queries_are_kept():
+    for path in ["/search?q=<script>", "/search?q=%3Cscript%3E", "/item?id=1%27%20OR%201=1",
+                 "/upload?name=shell.php%00.jpg", "/view?file=..%2f..%2fetc%2fpasswd"]:
+        assert normalize_path(path) == path
+
+def test_payloads_do_not_make_a_position_variable():
+    paths = ["/shop/item"] + [f"/shop/<img src={i}>" for i in range(200)]
+    assert PathTemplates.learn(paths, max_children=100).variable_prefixes == set()
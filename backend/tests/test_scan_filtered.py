@@ -0,0 +1,33 @@
+import os
+
+from core.ml_engine import select_anomalies
+from routers import analyze
+
+LINE = '10.0.0.1 - - [07/Jan/2024:14:30:00 +0700] "GET /items/{i} HTTP/1.1" 200 {size} "-" "Mozilla/5.0"\n'
+
+class _SizeEngine:
+    """Lỗi tái tạo tăng rất ít theo size: làm tròn 4 chữ số thì nhiều dòng trùng lỗi"""
+    version = "v1"
+
+    def find_anomalies(self, df, top_k=None, min_error=None):
+        mse = 0.1 + df['size'].to_numpy() * 1e-8
+        indices = select_anomalies(mse, 0.05, top_k, min_error)
+        count = len(select_anomalies(mse, 0.05, None, min_error))
+        threats = [{"size": int(df['size'].iloc[i]), "reconstruction_error": round(float(mse[i]), 4)} for i in indices]
+        return count, mse[indices].tolist(), threats
+
+def test_top_k_ranks_on_raw_error_and_counts_all(tmp_db, monkeypatch):
+    os.makedirs(analyze.UPLOAD_DIR)
+    with open(os.path.join(analyze.UPLOAD_DIR, "access.log"), 'w') as f:
+        for i in range(200):
+            f.write(LINE.format(i=i, size=1000 + i))
+    monkeypatch.setattr(analyze.model_registry, "get", lambda: _SizeEngine())
+    monkeypatch.setattr(analyze, "SCAN_CHUNK_ROWS", 7)
+
+    result = analyze.scan_file("access.log", top_k=5, min_error=None)
+    assert result["threat_count"] == 200
+    assert result["returned_count"] == 5
+    assert [t["size"] for t in result["threats"]] == [1199, 1198, 1197, 1196, 1195]
+
+    result = analyze.scan_file("access.log", top_k=None, min_error=0.1 + 1190e-8)
+    assert result["threat_count"] == result["returned_count"] == 10
@@ -0,0 +1,77 @@
+import numpy as np
+
+import database
+from core import batcher
+from core import server_thresholds as module
+from core.server_thresholds import ServerThresholds
+
+def test_threshold_is_clamped_to_floor(tmp_db):
+    thresholds = ServerThresholds(min_count=100, flush_every=10 ** 9, floor=0.5)
+    thresholds.observe("srv", "v1", np.full(500, 0.001), 0.02)
+    assert thresholds.threshold_for("srv", "v1", 0.02) == 0.01
+    assert thresholds.threshold_for("other", "v1", 0.02) == 0.02  # chưa đủ dữ liệu
+
+def test_flush_writes_database_outside_lock(tmp_db, monkeypatch):
+    thresholds = ServerThresholds(min_count=10, flush_every=50)
+    saved = []
+
+    def save(*args):
+        assert not thresholds._lock.locked()
+        saved.append(args)
+        database.save_server_sketch(*args)
+
+    monkeypatch.setattr(module, "save_server_sketch", save)
+    monkeypatch.setattr(module, "get_server_sketch", lambda server_id: (
+        None if thresholds._lock.locked() else database.get_server_sketch(server_id)))
+    errors = np.random.default_rng(0).exponential(0.01, 200)
+    for i in range(0, 200, 20):
+        thresholds.observe("srv", "v1", errors[i:i + 20], 1.0)
+    assert len(saved) == 3
+    thresholds.flush()
+    assert database.get_server_sketch("srv")["sketch"]["count"] == 200
+    assert ServerThresholds(min_count=10).describe("srv", "v1", 1.0)["samples"] == 200
+
+def test_high_quantile_is_accurate(tmp_db):
+    errors = np.random.default_rng(1).lognormal(-5, 1, 50000)
+    thresholds = ServerThresholds(floor=0, flush_every=100)
+    for i in range(0, len(errors), 100):
+        thresholds.observe("srv", "v1", errors[i:i + 100], 1.0)
+    estimate = thresholds.threshold_for("srv", "v1", 1.0)
+    assert abs(estimate / np.quantile(errors, 0.999) - 1) < 0.03
+
+def test_threshold_is_clamped_to_cap(tmp_db):
+    thresholds = ServerThresholds(min_count=100, flush_every=10 ** 9, cap=4.0)
+    thresholds.observe("srv", "v1", np.full(500, 10.0), 0.02)
+    assert thresholds.threshold_for("srv", "v1", 0.02) == 0.08
+
+class _NoisyDetector:
+    """Lỗi tái tạo lấy từ cột size; size = 0 giống dòng được cascade bỏ qua (lỗi 0)"""
+    model = object()
+    version = "test-noisy-server"
+    threshold = 0.05
+
+    def reconstruction_errors(self, df):
+        return df['size'].to_numpy(dtype=float), df
+
+    def make_threats(self, df, mse, indices):
+        return [{"reconstruction_error": float(mse[i])} for i in indices]
+
+def test_noisy_server_threshold_rises_above_global(tmp_db, monkeypatch):
+    detector = _NoisyDetector()
+    monkeypatch.setattr(batcher.model_registry, "get", lambda: detector)
+    thresholds = ServerThresholds(min_count=1000, flush_every=1000)
+    monkeypatch.setattr(batcher, "server_thresholds", thresholds)
+    monkeypatch.setattr(batcher.verdict_cache, "max_size", 0)
+
+    # ~15% log vượt ngưỡng chung 0.05, cộng thêm nhiều dòng cascade bỏ qua (lỗi 0)
+    errors = np.random.default_rng(2).lognormal(np.log(0.03), 0.5, 20000)
+    errors[::3] = 0
+    alerts = []
+    for i in range(0, len(errors), 500):
+        rows = [{'ip': '10.0.0.1', 'path': '/', 'size': e} for e in errors[i:i + 500]]
+        alerts.append(sum(map(bool, batcher.score_rows(rows, ["noisy"] * len(rows)))) / len(rows))
+
+    threshold = thresholds.threshold_for("noisy", detector.version, detector.threshold)
+    assert detector.threshold < threshold <= detector.threshold * thresholds.cap
+    assert thresholds.describe("noisy", detector.version, detector.threshold)["samples"] == np.count_nonzero(errors)
+    assert alerts[0] > 0.05 and alerts[-1] < 0.01
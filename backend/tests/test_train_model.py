@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from core.ml_engine import LogAnomalyDetector
+from core.parser import parse_log_file
+
+LINE = '10.0.0.{ip} - - [07/{month}/2024:{hour:02d}:30:00 +0700] "GET /items/{i} HTTP/1.1" 200 {size} "-" "Mozilla/5.0"\n'
+
+def test_train_features_match_inference(tmp_path, monkeypatch):
+    pytest.importorskip("tensorflow")
+    import train_model
+    log = tmp_path / "train.log"
+    with open(log, 'w') as f:
+        for i in range(600):
+            f.write(LINE.format(ip=i % 20, month=("Jan", "Jun", "Nov")[i % 3], hour=i % 24, i=i % 40, size=500 + i))
+    monkeypatch.setattr(train_model, "OUTPUT_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(train_model, "EPOCHS", 1)
+    captured = {}
+    # Ma trận đặc trưng đã scale mà train() đưa vào model
+    real_transform = train_model.MinMaxScaler.transform
+    monkeypatch.setattr(train_model.MinMaxScaler, "transform",
+                        lambda self, X: captured.setdefault("X", real_transform(self, X)))
+
+    train_model.train(str(log))
+
+    detector = LogAnomalyDetector(str(tmp_path / "models"), backend="numpy")
+    detector.load_resources()
+    features, _ = detector.preprocess_features(parse_log_file(str(log)))
+    assert np.allclose(features, captured["X"])
+    assert len(np.unique(features[:, -1])) == 24  # giờ thật của mọi tháng, không chỉ Jan/Feb
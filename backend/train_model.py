@@ -1,5 +1,6 @@
 import os
-import re
+import sys
+import tempfile
 import numpy as np
 import pandas as pd
 import joblib
@@ -12,109 +13,78 @@ from sklearn.preprocessing import MinMaxScaler, LabelEncoder
 
 DATA_FILE = "./training_data.csv" 
 OUTPUT_DIR = "./models/"            
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Regex Parser 
-LOG_PATTERN = re.compile(
-    r'(?P<ip>^[\d\.]+) \S+ \S+ \[(?P<timestamp>.*?)\] "(?P<request>.*?)" (?P<status>\d{3}) (?P<size>\S+) "(?P<referrer>.*?)" "(?P<user_agent>.*?)"\s*.*'
-)
+# Regex Parser (dùng chung với core.parser)
+from core.parser import iter_log_chunks, auto_workers, prefetch, normalize_path, PathTemplates, PATH_TEMPLATES_FILE
+from core.prefilter import FeatureProfile, PREFILTER_FILE
+from core.hash_encoder import HashingEncoder, HASH_ENCODER_FILE, FEATURE_HASH_BUCKETS
+from core.ml_engine import LogAnomalyDetector, FEATURE_COLUMNS, SCORE_BLOCK_ROWS, row_mse
 
-def parse_log_for_train(filepath):
-    print(f"⏳ Đang đọc file log: {filepath}...")
-    data = []
-    
+EPOCHS = 100
+BATCH_SIZE = 128
+VALIDATION_SPLIT = 0.1
+CATEGORICAL_COLUMNS = ['ip', 'method', 'path', 'referrer', 'user_agent']
+# Chế độ --stream: số dòng mỗi chunk parse, số dòng mỗi block khi xáo trộn dữ liệu đọc từ đĩa,
+# thư mục chứa file đặc trưng tạm (float32, 32 byte/dòng)
+TRAIN_CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", "200000"))
+SHUFFLE_BLOCK_ROWS = int(os.getenv("TRAIN_SHUFFLE_BLOCK_ROWS", str(64 * BATCH_SIZE)))
+TRAIN_CACHE_DIR = os.getenv("TRAIN_CACHE_DIR") or None
+# Chuẩn hóa path (bỏ query string, gộp id/UUID/hash, template học từ tập train) trước khi encode
+PATH_NORMALIZE = os.getenv("PATH_NORMALIZE", "1") not in ("0", "false")
+
+def train(filepath=DATA_FILE):
+    """Train trong RAM. Parse bằng core.parser (mọi định dạng LOG_FORMAT) và tính đặc trưng bằng đúng
+    LogAnomalyDetector._feature_values như API và train_streaming, nên train và suy luận cho cùng vector"""
     if not os.path.exists(filepath):
         print(f"❌ Lỗi: Không tìm thấy file {filepath}")
-        return pd.DataFrame()
-
-    try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                match = LOG_PATTERN.match(line.strip())
-                if match:
-                    row = match.groupdict()
-                    
-                    # Tách Method/Path
-                    parts = row['request'].split()
-                    if len(parts) >= 2:
-                        row['method'] = parts[0]
-                        row['path'] = parts[1]
-                    else:
-                        row['method'] = "unknown"
-                        row['path'] = row['request']
-                    
-                    row['size'] = 0 if row['size'] == '-' else int(row['size'])
-                    row['status'] = int(row['status'])
-                    
-                    # Trích xuất giờ
-                    try:
-                        if "Jan" in row['timestamp'] or "Feb" in row['timestamp']: 
-                            dt = pd.to_datetime(row['timestamp'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
-                            row['hour'] = dt.hour if pd.notnull(dt) else 0
-                        else:
-                            row['hour'] = 0
-                    except:
-                        row['hour'] = 0
-                        
-                    data.append(row)
-    except Exception as e:
-        print(f"❌ Lỗi khi đọc file: {e}")
-        return pd.DataFrame()
-    
-    return pd.DataFrame(data)
+        return
 
-def train():
     # 1. Load Data
-    df = parse_log_for_train(DATA_FILE)
+    print(f"⏳ Đang đọc file log: {filepath}...")
+    chunks = list(iter_training_chunks(filepath))
+    if not chunks:
+        print("❌ Lỗi: Không có dòng log hợp lệ")
+        return
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
     print(f"✅ Đã chuẩn bị {len(df)} dòng dữ liệu.")
 
-    # 2. Label Encoding
-    cols_to_encode = ['ip', 'method', 'path', 'referrer', 'user_agent']
-    label_encoders = {}
-    
-    for col in cols_to_encode:
-        le = LabelEncoder()
-        if col not in df.columns: df[col] = "unknown"
-        df[col] = df[col].astype(str)
-        # Fit & Transform
-        df[col + '_enc'] = le.fit_transform(df[col])
-        label_encoders[col] = le
-        
-    print("✅ Đã mã hóa Text sang Số.")
-
-    # 3. Prepare Vector (8 features)
-    feature_cols = ['ip_enc', 'method_enc', 'path_enc', 'status', 'size', 'referrer_enc', 'user_agent_enc', 'hour']    
-    for col in feature_cols:
-        if col not in df.columns:
-            df[col] = 0
+    # 2. Template path, rồi Label Encoding (hoặc hashing trick nếu đặt FEATURE_HASH_BUCKETS)
+    path_templates = None
+    if PATH_NORMALIZE:
+        raw_paths = _text_values(df, 'path')
+        path_templates = PathTemplates.learn(raw_paths)
+        report_path_vocabulary(path_templates.vocabulary_report(raw_paths))
 
-    X = df[feature_cols].values.astype(np.float32)
+    if FEATURE_HASH_BUCKETS:
+        encoders = HashingEncoder(FEATURE_HASH_BUCKETS)
+    else:
+        # Từ vựng theo đúng chuỗi mà detector sẽ encode (path: template của path gốc)
+        vocab = {col: _text_values(df, col) for col in CATEGORICAL_COLUMNS}
+        if path_templates is not None:
+            vocab['path'] = {path_templates.apply(p) for p in vocab['path']}
+        encoders = {col: LabelEncoder().fit(np.array(sorted(values))) for col, values in vocab.items()}
+    detector = training_detector(encoders, path_templates)
+    print("✅ Đã mã hóa Text sang Số.")
 
-    # 4. Scaling
-    scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
+    # 3. Prepare Vector (8 features) + 4. Scaling
+    X = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for j, name in enumerate(FEATURE_COLUMNS):
+        X[:, j] = detector._feature_values(df, name)
+    scaler = fit_scaler(X.min(axis=0), X.max(axis=0), detector.hash_encoder)
+    X_scaled = scaler.transform(X).astype(np.float32)
     print("✅ Đã chuẩn hóa (Scaling).")
     
     # 5. Build Autoencoder Model 
-    input_dim = X_scaled.shape[1] # 8
-    input_layer = Input(shape=(input_dim,))
-    # Encoder
-    encoded = Dense(16, activation='relu')(input_layer)
-    encoded = Dense(8, activation='relu')(encoded)
-    # Decoder
-    decoded = Dense(16, activation='relu')(encoded)
-    output_layer = Dense(input_dim, activation='sigmoid')(decoded)
-    autoencoder = Model(inputs=input_layer, outputs=output_layer)
-    autoencoder.compile(optimizer='adam', loss='mse')
+    autoencoder = build_autoencoder(X_scaled.shape[1]) # 8
 
     # 6. Training
-    print("🚀 Bắt đầu Train (100 epochs)...")
+    print(f"🚀 Bắt đầu Train ({EPOCHS} epochs)...")
     autoencoder.fit(
         X_scaled, X_scaled,
-        epochs=100,
-        batch_size=128,
+        epochs=EPOCHS,
+        batch_size=BATCH_SIZE,
         shuffle=True,
-        validation_split=0.1,
+        validation_split=VALIDATION_SPLIT,
         verbose=1 
     )
 
@@ -124,13 +94,250 @@ def train():
     threshold = np.mean(mse) + 4 * np.std(mse)
     
     print(f"🎯 Ngưỡng phát hiện (Threshold): {threshold:.6f}")
-    autoencoder.save(os.path.join(OUTPUT_DIR, 'autoencoder_model.keras'))
-    joblib.dump(scaler, os.path.join(OUTPUT_DIR, 'scaler.pkl'))
-    joblib.dump(label_encoders, os.path.join(OUTPUT_DIR, 'label_encoders.pkl'))
-    joblib.dump(threshold, os.path.join(OUTPUT_DIR, 'reconstruction_threshold.pkl'))
+    # Tầng lọc rẻ cho cascade (CASCADE_PREFILTER=1), hiệu chỉnh trên chính dữ liệu train
+    save_artifacts(autoencoder, scaler, encoders, threshold, FeatureProfile.fit(X_scaled, mse, threshold),
+                   path_templates=path_templates)
+
+def training_detector(encoders, path_templates, scaler=None, model=None):
+    """LogAnomalyDetector với encoder/template vừa fit: dùng đúng tiền xử lý của API lúc train"""
+    detector = LogAnomalyDetector(OUTPUT_DIR)
+    if isinstance(encoders, HashingEncoder):
+        detector.hash_encoder = encoders
+        detector.label_encoders = {}
+    else:
+        detector.hash_encoder = None
+        detector.label_encoders = encoders
+        detector._build_lookups()
+    detector.path_templates = path_templates
+    detector.scaler = scaler
+    detector.model = model
+    return detector
+
+def report_path_vocabulary(report):
+    """In số path khác nhau trước/sau chuẩn hóa (raw = None khi train --stream, không giữ path gốc)"""
+    steps = [f"{report[k]} {k}" for k in ("raw", "normalized", "templates") if report.get(k) is not None]
+    first = report["raw"] if report.get("raw") is not None else report["normalized"]
+    print(f"✅ Path vocabulary: {' -> '.join(steps)} (giảm x{first / max(report['templates'], 1):.0f})")
+
+def fit_scaler(mins, maxs, hash_encoder=None):
+    """MinMaxScaler chỉ phụ thuộc min/max từng cột: fit trên đúng hai dòng [min, max].
+    Với hashing trick các cột _enc lấy khoảng cố định [0, buckets - 1] (train thường và --stream cho cùng scaler)"""
+    mins, maxs = list(mins), list(maxs)
+    if hash_encoder is not None:
+        for j, name in enumerate(FEATURE_COLUMNS):
+            if name.endswith('_enc'):
+                mins[j], maxs[j] = hash_encoder.bounds()
+    return MinMaxScaler().fit(np.array([mins, maxs], dtype=np.float32))
+
+def build_autoencoder(input_dim):
+    input_layer = Input(shape=(input_dim,))
+    # Encoder
+    encoded = Dense(16, activation='relu')(input_layer)
+    encoded = Dense(8, activation='relu')(encoded)
+    # Decoder
+    decoded = Dense(16, activation='relu')(encoded)
+    output_layer = Dense(input_dim, activation='sigmoid')(decoded)
+    autoencoder = Model(inputs=input_layer, outputs=output_layer)
+    autoencoder.compile(optimizer='adam', loss='mse')
+    return autoencoder
+
+def save_artifacts(autoencoder, scaler, encoders, threshold, prefilter, output_dir=OUTPUT_DIR, path_templates=None):
+    """encoders: dict LabelEncoder (label_encoders.pkl) hoặc HashingEncoder (hash_encoder.json);
+    path_templates: PathTemplates (path_templates.json) hoặc None nếu path không được chuẩn hóa"""
+    os.makedirs(output_dir, exist_ok=True)
+    autoencoder.save(os.path.join(output_dir, 'autoencoder_model.keras'))
+    joblib.dump(scaler, os.path.join(output_dir, 'scaler.pkl'))
+    le_path = os.path.join(output_dir, 'label_encoders.pkl')
+    hash_path = os.path.join(output_dir, HASH_ENCODER_FILE)
+    if isinstance(encoders, HashingEncoder):
+        encoders.save(hash_path)
+        stale_path = le_path
+    else:
+        joblib.dump(encoders, le_path)
+        stale_path = hash_path
+    # Bỏ file encoder kiểu còn lại của lần train trước trong cùng thư mục (API ưu tiên hash_encoder.json)
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+    templates_path = os.path.join(output_dir, PATH_TEMPLATES_FILE)
+    if path_templates is not None:
+        path_templates.save(templates_path)
+    elif os.path.exists(templates_path):
+        os.remove(templates_path)
+    joblib.dump(threshold, os.path.join(output_dir, 'reconstruction_threshold.pkl'))
+    prefilter.save(os.path.join(output_dir, PREFILTER_FILE))
+    print(f"✅ Prefilter profile: z_limit={prefilter.z_limit:.3f}")
+
+    # Bản NumPy cho API (không cần TensorFlow khi chạy server)
+    from export_model import export
+    export(output_dir, autoencoder)
 
     print("\n🎉 TRAINING THÀNH CÔNG!")
-    print(f"👉 4 file model đã được lưu tại: {OUTPUT_DIR}")
+    print(f"👉 Các file model đã được lưu tại: {output_dir}")
+
+# ---------------------------------------------------------------------------
+# Train theo luồng (python train_model.py --stream): file log lớn hơn RAM
+# ---------------------------------------------------------------------------
+
+def iter_training_chunks(filepath):
+    """Parse song song (process pool với file lớn) và đọc trước chunk kế tiếp trong thread nền"""
+    return prefetch(iter_log_chunks(filepath, rows=TRAIN_CHUNK_ROWS, workers=auto_workers(filepath)))
+
+def _text_values(chunk, col):
+    """Các giá trị khác nhau của cột text, dạng chuỗi giống LogAnomalyDetector.encode_column"""
+    if col not in chunk.columns:
+        return {"unknown"}
+    values = chunk[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        found = set(values.cat.categories.astype(str))
+        if values.isna().any(): found.add('nan')
+        return found
+    return set(values.astype(str).fillna('nan').unique())
+
+def fit_preprocessing_stream(filepath):
+    """Lượt 1: từ vựng của các cột text (LabelEncoder) và min/max của từng đặc trưng (MinMaxScaler).
+    Với FEATURE_HASH_BUCKETS không cần đọc từ vựng (bộ nhớ cố định).
+    Với PATH_NORMALIZE chỉ giữ các path đã qua normalize_path, học template khi hết file.
+    Trả về (label_encoders hoặc HashingEncoder, scaler, số dòng, PathTemplates hoặc None)."""
+    hash_encoder = HashingEncoder(FEATURE_HASH_BUCKETS) if FEATURE_HASH_BUCKETS else None
+    vocab = {} if hash_encoder is not None else {col: set() for col in CATEGORICAL_COLUMNS}
+    numeric = ['status', 'size', 'hour']
+    mins = {name: np.inf for name in numeric}
+    maxs = {name: -np.inf for name in numeric}
+    detector = LogAnomalyDetector(OUTPUT_DIR)
+    normalized_paths = set() if PATH_NORMALIZE else None
+    rows = 0
+    for chunk in iter_training_chunks(filepath):
+        rows += len(chunk)
+        for col in vocab:
+            if col == 'path' and normalized_paths is not None: continue
+            vocab[col] |= _text_values(chunk, col)
+        if normalized_paths is not None:
+            normalized_paths |= {normalize_path(p) for p in _text_values(chunk, 'path')}
+        for name in numeric:
+            values = np.asarray(detector._feature_values(chunk, name), dtype=np.float32)
+            mins[name] = min(mins[name], values.min())
+            maxs[name] = max(maxs[name], values.max())
+        print(f"   ... {rows} dòng")
+
+    path_templates = None
+    if normalized_paths is not None:
+        path_templates = PathTemplates.learn(normalized_paths)
+        report = path_templates.vocabulary_report(normalized_paths)
+        report_path_vocabulary({"normalized": report["raw"], "templates": report["templates"]})
+        if 'path' in vocab:
+            vocab['path'] = {path_templates.apply(p) for p in normalized_paths}
+
+    if hash_encoder is not None:
+        scaler = fit_scaler([mins.get(name, 0) for name in FEATURE_COLUMNS], [maxs.get(name, 0) for name in FEATURE_COLUMNS], hash_encoder)
+        return hash_encoder, scaler, rows, path_templates
+
+    label_encoders = {col: LabelEncoder().fit(np.array(sorted(values))) for col, values in vocab.items()}
+    scaler = fit_scaler(
+        [0 if name.endswith('_enc') else mins[name] for name in FEATURE_COLUMNS],
+        [len(label_encoders[name[:-len('_enc')]].classes_) - 1 if name.endswith('_enc') else maxs[name] for name in FEATURE_COLUMNS],
+    )
+    return label_encoders, scaler, rows, path_templates
+
+def write_feature_cache(filepath, detector, path, rows):
+    """Lượt 2: ghi ma trận đặc trưng đã scale (float32) ra file .npy trên đĩa, trả về bản memmap để đọc"""
+    features = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(rows, len(FEATURE_COLUMNS)))
+    offset = 0
+    for chunk in iter_training_chunks(filepath):
+        data, _ = detector.preprocess_features(chunk)
+        features[offset:offset + len(data)] = data
+        offset += len(data)
+    if offset != rows:
+        raise RuntimeError(f"{filepath} changed during training ({rows} -> {offset} rows)")
+    features.flush()
+    del features
+    return np.load(path, mmap_mode='r')
+
+def feature_dataset(features, start, end, shuffle):
+    """tf.data đọc dữ liệu [start, end) từ memmap theo block (xáo thứ tự block và các dòng trong block mỗi epoch)"""
+    def batches():
+        blocks = np.arange(start, end, SHUFFLE_BLOCK_ROWS)
+        if shuffle: np.random.shuffle(blocks)
+        for first in blocks:
+            block = np.array(features[first:min(first + SHUFFLE_BLOCK_ROWS, end)])
+            if shuffle: np.random.shuffle(block)
+            for i in range(0, len(block), BATCH_SIZE):
+                x = block[i:i + BATCH_SIZE]
+                yield x, x
+    spec = tf.TensorSpec(shape=(None, features.shape[1]), dtype=tf.float32)
+    return tf.data.Dataset.from_generator(batches, output_signature=(spec, spec)).prefetch(tf.data.AUTOTUNE)
+
+def streamed_errors(model, features, errors):
+    """Lượt 3: lỗi tái tạo từng dòng (ghi vào `errors`) theo block; trả về threshold (mean + 4 * std của lỗi)
+    cùng mean/std từng đặc trưng, cộng dồn bằng float64"""
+    count = len(features)
+    err_sum = err_sq = 0.0
+    feat_sum = np.zeros(features.shape[1])
+    feat_sq = np.zeros(features.shape[1])
+    for start in range(0, count, SCORE_BLOCK_ROWS):
+        block = np.array(features[start:start + SCORE_BLOCK_ROWS])
+        mse = row_mse(block, model.predict(block, verbose=0))
+        errors[start:start + len(block)] = mse
+        err_sum += mse.sum(dtype=np.float64)
+        err_sq += np.square(mse, dtype=np.float64).sum()
+        feat_sum += block.sum(axis=0, dtype=np.float64)
+        feat_sq += np.square(block, dtype=np.float64).sum(axis=0)
+    mean = err_sum / count
+    threshold = mean + 4 * np.sqrt(max(err_sq / count - mean ** 2, 0.0))
+    feat_mean = feat_sum / count
+    feat_std = np.sqrt(np.maximum(feat_sq / count - feat_mean ** 2, 0.0))
+    return threshold, feat_mean, feat_std
+
+def train_streaming(filepath=DATA_FILE):
+    """Train mà không giữ cả tập dữ liệu trong RAM: parse theo chunk, đặc trưng đã scale nằm trên đĩa (memmap),
+    tf.data đọc theo block, threshold tính từ lỗi tái tạo cộng dồn theo luồng"""
+    if not os.path.exists(filepath):
+        print(f"❌ Lỗi: Không tìm thấy file {filepath}")
+        return
+
+    # 1. Lượt 1: LabelEncoder (hoặc HashingEncoder) + MinMaxScaler
+    print(f"⏳ Lượt 1: đọc từ vựng và min/max từ {filepath}...")
+    encoders, scaler, rows, path_templates = fit_preprocessing_stream(filepath)
+    if rows == 0:
+        print("❌ Lỗi: Không có dòng log hợp lệ")
+        return
+    print(f"✅ {rows} dòng, đã fit {'HashingEncoder' if isinstance(encoders, HashingEncoder) else 'LabelEncoder'} + MinMaxScaler.")
+
+    autoencoder = build_autoencoder(len(FEATURE_COLUMNS))
+    # Dùng đúng tiền xử lý của API để đặc trưng lúc train và lúc suy luận giống nhau
+    detector = training_detector(encoders, path_templates, scaler, autoencoder)
+
+    with tempfile.TemporaryDirectory(dir=TRAIN_CACHE_DIR) as cache_dir:
+        # 2. Lượt 2: đặc trưng đã scale ra đĩa
+        print("⏳ Lượt 2: mã hóa + chuẩn hóa ra file tạm...")
+        features = write_feature_cache(filepath, detector, os.path.join(cache_dir, 'features.npy'), rows)
+
+        # 3. Training (10% dòng cuối làm validation, như validation_split)
+        split = rows - int(rows * VALIDATION_SPLIT)
+        print(f"🚀 Bắt đầu Train ({EPOCHS} epochs, streaming)...")
+        autoencoder.fit(
+            feature_dataset(features, 0, split, shuffle=True),
+            validation_data=feature_dataset(features, split, rows, shuffle=False) if split < rows else None,
+            epochs=EPOCHS,
+            verbose=1
+        )
+
+        # 4. Threshold + prefilter từ lỗi tái tạo theo luồng
+        errors = np.lib.format.open_memmap(os.path.join(cache_dir, 'errors.npy'), mode='w+', dtype=np.float32, shape=(rows,))
+        threshold, feat_mean, feat_std = streamed_errors(autoencoder, features, errors)
+        print(f"🎯 Ngưỡng phát hiện (Threshold): {threshold:.6f}")
+        anomalies = np.concatenate([
+            features[start:start + SCORE_BLOCK_ROWS][errors[start:start + SCORE_BLOCK_ROWS] > threshold]
+            for start in range(0, rows, SCORE_BLOCK_ROWS)
+        ])
+        prefilter = FeatureProfile.calibrate(feat_mean, feat_std, anomalies)
+        del features, errors
+
+    save_artifacts(autoencoder, scaler, encoders, threshold, prefilter, path_templates=path_templates)
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    # python train_model.py [--stream] [file log]
+    args = [a for a in sys.argv[1:] if a != "--stream"]
+    if "--stream" in sys.argv:
+        train_streaming(args[0] if args else DATA_FILE)
+    else:
+        train(args[0] if args else DATA_FILE)
\ No newline at end of file
@@ -45,7 +45,7 @@ with st.sidebar:
     with st.expander("📁 Upload Log Files", expanded=True):
         uploaded_files = st.file_uploader(
             "Chọn file (hỗ trợ chọn nhiều):", 
-            type=["csv", "txt", "log"], 
+            type=["csv", "txt", "log", "gz", "bz2", "zst"], 
             accept_multiple_files=True 
         )
         